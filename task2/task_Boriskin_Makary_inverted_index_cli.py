@@ -20,6 +20,7 @@ from dataset.
 from __future__ import annotations
 
 import json
+import pickle
 import re
 import sys
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
@@ -27,6 +28,16 @@ from typing import Dict, List
 
 DEFAULT_DATASET_PATH = "wikipedia_sample"
 DEFAULT_INVERTED_INDEX_STORE_PATH = "inverted.index"
+# every pickle of protocol 2 and newer starts with the PROTO opcode
+PICKLE_PROTOCOL = 5
+PICKLE_MAGIC = b"\x80"
+
+
+class _DataUnpickler(pickle.Unpickler):
+    """Unpickler of plain data: refuses to import any class or function"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"pickle strategy stores plain data only, but got {module}.{name}")
 
 
 class InvertedIndex:
@@ -68,14 +79,22 @@ class InvertedIndex:
                     result.append(doc)
         return result
 
-    def dump(self, filepath: str) -> None:
-        """Dumps the inverted index dict to the given path"""
+    def dump(self, filepath: str, strategy: str = "json") -> None:
+        """Dumps the inverted index dict to the given path as json or pickle"""
+        if strategy == "pickle":
+            with open(filepath, 'wb') as fout:
+                pickle.dump(self.index, fout, protocol=PICKLE_PROTOCOL)
+            return
         with open(filepath, 'w', encoding='utf8') as fout:
             json.dump(self.index, fout)
 
     @classmethod
     def load(cls, filepath: str) -> InvertedIndex:
-        """Loads the inverted index dict by the given path"""
+        """Loads the inverted index dict by the given path, pickle is detected by its first byte"""
+        with open(filepath, 'rb') as fin:
+            if fin.read(len(PICKLE_MAGIC)) == PICKLE_MAGIC:
+                fin.seek(0)
+                return cls(index=_DataUnpickler(fin).load())
         with open(filepath, 'r', encoding='utf8') as fin:
             return cls(index=json.load(fin))
 
@@ -124,12 +143,9 @@ def build_inverted_index(documents: Dict[int, str]) -> InvertedIndex:
 
 def callback_build(arguments):
     """Callback for build specifier: dump inverted index on hard drive"""
-    if arguments.strategy == "json":
-        documents = load_documents(arguments.dataset)
-        inverted_index = build_inverted_index(documents)
-        inverted_index.dump(arguments.output)
-    elif arguments.strategy == "pickle":
-        print("pickle strategy not implemented yet")
+    documents = load_documents(arguments.dataset)
+    inverted_index = build_inverted_index(documents)
+    inverted_index.dump(arguments.output, strategy=arguments.strategy)
 
 
 def callback_query(arguments):
@@ -155,7 +171,7 @@ def setup_parser(parser):
         "-s", "--strategy",
         choices=["json", "pickle"],
         default="json",
-        help="choose the strategy: json or pickle (not implemented yet)",
+        help="choose the strategy: json or pickle (protocol 5, plain data only)",
     )
     build_parser.add_argument(
         "-d", "--dataset",
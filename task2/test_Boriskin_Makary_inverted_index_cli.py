@@ -1,4 +1,7 @@
 import os.path
+import pickle
+
+import pytest
 
 from task_Boriskin_Makary_inverted_index_cli import InvertedIndex, load_documents, build_inverted_index
 
@@ -123,3 +126,17 @@ def test_find_documents_by_specified_words():
     assert bright_blue_forget_expected_value == inverted.query(['bright', 'blue']), (
         f"\nExpected: {bright_blue_forget_expected_value}\nYou got: {inverted.query(['bright', 'blue'])}"
     )
+
+
+def test_dump_and_load_inverted_index_with_pickle(tmp_path):
+    documents = load_documents(filepath='test_dataset.txt')
+    inverted = build_inverted_index(documents=documents)
+    index_filepath = str(tmp_path / 'inverted.index')
+    inverted.dump(filepath=index_filepath, strategy='pickle')
+    assert inverted == InvertedIndex.load(filepath=index_filepath), (
+        "InvertedIndex loaded from a pickle dump differs from the built one"
+    )
+    with open(index_filepath, 'wb') as fout:
+        pickle.dump({"word": [OSError(1)]}, fout, protocol=5)
+    with pytest.raises(pickle.UnpicklingError):
+        InvertedIndex.load(filepath=index_filepath)
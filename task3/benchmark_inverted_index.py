@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+
+""" Benchmarks for the InvertedIndex implementation.
+
+use `intersect` subcommand to measure query latency against posting length
+for the legacy quadratic scan and the sorted intersection engine;
+use `storage` subcommand to compare index size and load time of the
+storage strategies;
+use `build` subcommand to measure build throughput against worker count;
+use `memory` subcommand to compare memory of list-based and compact postings;
+use `hybrid` subcommand to compare list and bitmap-backed postings on queries
+mixing frequent and rare terms;
+use `shards` subcommand to measure query throughput against shard count;
+use `suite` subcommand to run build, dump, load and query benchmarks on a
+seeded Zipf corpus and write the results as json;
+use `compare` subcommand to flag regressions between two suite results.
+"""
+
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from typing import Callable, Dict, List, Tuple
+
+from task_Boriskin_Makary_inverted_index import InvertedIndex, STORAGE_WRITERS
+from task_Boriskin_Makary_inverted_index import load_documents, build_inverted_index
+from task_Boriskin_Makary_inverted_index import build_inverted_index_parallel
+from task_Boriskin_Makary_inverted_index import ShardedInvertedIndex, write_sharded_index
+
+
+def legacy_query(index: InvertedIndex, words: List[str]) -> List[int]:
+    """Query algorithm used before the sorted intersection engine"""
+    docs_list = [index.index.get(term, []) for term in words]
+    result = []
+    for doc in docs_list[0]:
+        if all(doc in docs for docs in docs_list[1:]):
+            if doc not in result:
+                result.append(doc)
+    return result
+
+
+def random_postings(length: int, universe: int, rng: random.Random) -> List[int]:
+    """Generate a sorted posting list of the given length"""
+    return sorted(rng.sample(range(universe), length))
+
+
+def measure(function: Callable[[], object], repeat: int) -> float:
+    """Return the best wall time of the given function in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def benchmark_intersect(lengths: List[int], skew: int, repeat: int,
+                        legacy_limit: int, seed: int) -> None:
+    """Print query latency for two-term queries against posting length"""
+    rng = random.Random(seed)
+    print("length\tskew\tengine_ms\tlegacy_ms")
+    for length in lengths:
+        universe = max(length * skew * 4, 1000)
+        index = InvertedIndex({
+            "rare": random_postings(length, universe, rng),
+            "common": random_postings(min(length * skew, universe), universe, rng),
+        })
+        words = ["rare", "common"]
+        engine_ms = measure(lambda: index.query(words), repeat)
+        if length * skew <= legacy_limit:
+            legacy_ms = f"{measure(lambda: legacy_query(index, words), repeat):.3f}"
+        else:
+            legacy_ms = "-"
+        print(f"{length}\t{skew}\t{engine_ms:.3f}\t{legacy_ms}")
+
+
+def zipf_weights(vocabulary: int, exponent: float = 1.0) -> List[float]:
+    """Return Zipf weights 1/rank**exponent of the vocabulary ranks"""
+    return [1 / (rank + 1) ** exponent for rank in range(vocabulary)]
+
+
+def synthetic_index(documents: int, vocabulary: int, terms_per_document: int,
+                    seed: int, exponent: float = 1.0) -> InvertedIndex:
+    """Generate an index with a Zipf (1/rank**exponent) term distribution"""
+    rng = random.Random(seed)
+    words = [f"term{rank}" for rank in range(vocabulary)]
+    weights = zipf_weights(vocabulary, exponent)
+    index: Dict[str, List[int]] = {}
+    for doc_id in range(1, documents + 1):
+        for term in set(rng.choices(words, weights, k=terms_per_document)):
+            index.setdefault(term, []).append(doc_id)
+    return InvertedIndex(index)
+
+
+def write_synthetic_dataset(filepath: str, documents: int, vocabulary: int,
+                            words_per_document: int, seed: int, exponent: float = 1.0) -> None:
+    """Write a dataset of documents drawn from a Zipf (1/rank**exponent) vocabulary"""
+    rng = random.Random(seed)
+    words = [f"term{rank}" for rank in range(vocabulary)]
+    weights = zipf_weights(vocabulary, exponent)
+    with open(filepath, 'w', encoding='utf8') as fout:
+        for doc_id in range(1, documents + 1):
+            body = " ".join(rng.choices(words, weights, k=words_per_document))
+            fout.write(f"{doc_id}\tTitle {doc_id}\t{body}\n")
+
+
+def benchmark_build(dataset_filepath: str, workers: List[int], repeat: int) -> None:
+    """Print build time and throughput for every worker count"""
+    size = os.path.getsize(dataset_filepath)
+    print("workers\tbuild_ms\tMB_per_s")
+    for count in workers:
+        if count > 1:
+            build_ms = measure(lambda: build_inverted_index_parallel(dataset_filepath, count), repeat)
+        else:
+            build_ms = measure(lambda: build_inverted_index(load_documents(dataset_filepath)), repeat)
+        print(f"{count}\t{build_ms:.3f}\t{size / 1024 / 1024 / (build_ms / 1000):.3f}")
+
+
+def callback_build(arguments):
+    """Callback for build specifier"""
+    if arguments.dataset_filepath:
+        return benchmark_build(arguments.dataset_filepath, arguments.workers, arguments.repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        dataset_filepath = os.path.join(directory, "dataset.txt")
+        write_synthetic_dataset(dataset_filepath,
+                                documents=arguments.documents,
+                                vocabulary=arguments.vocabulary,
+                                words_per_document=arguments.words_per_document,
+                                seed=arguments.seed)
+        return benchmark_build(dataset_filepath, arguments.workers, arguments.repeat)
+
+
+def benchmark_storage(index: InvertedIndex, strategies: List[str], repeat: int) -> None:
+    """Print index size, load time and full decode time for every strategy"""
+    print("strategy\tbytes\tdump_ms\tload_ms\tdecode_all_ms")
+    with tempfile.TemporaryDirectory() as directory:
+        for strategy in strategies:
+            filepath = os.path.join(directory, f"inverted.{strategy}")
+            try:
+                dump_ms = measure(lambda: index.dump(filepath, strategy=strategy), repeat)
+            except ValueError as error:
+                print(f"{strategy}\t-\t-\t-\t-\t({error})")
+                continue
+            size = os.path.getsize(filepath)
+            load_ms = measure(lambda: InvertedIndex.load(filepath), repeat)
+            loaded = InvertedIndex.load(filepath)
+            decode_ms = measure(lambda: [len(loaded.index[term]) for term in loaded.index], repeat)
+            print(f"{strategy}\t{size}\t{dump_ms:.3f}\t{load_ms:.3f}\t{decode_ms:.3f}")
+
+
+def traced_memory(function: Callable[[], object]) -> int:
+    """Return the number of bytes kept allocated by the object the function creates"""
+    tracemalloc.start()
+    try:
+        result = function()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def benchmark_memory(index: InvertedIndex) -> None:
+    """Print memory used by list-based postings loaded from disc and by compact ones"""
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "inverted.json")
+        index.dump(filepath, strategy="json")
+        lists_bytes = traced_memory(lambda: InvertedIndex.load(filepath))
+    compact_bytes = traced_memory(lambda: index.compact())
+    postings = sum(len(doc_ids) for doc_ids in index.index.values())
+    print("layout\tbytes\tbytes_per_posting")
+    print(f"lists\t{lists_bytes}\t{lists_bytes / postings:.2f}")
+    print(f"compact\t{compact_bytes}\t{compact_bytes / postings:.2f}")
+
+
+def callback_memory(arguments):
+    """Callback for memory specifier"""
+    if arguments.dataset_filepath:
+        index = build_inverted_index(load_documents(arguments.dataset_filepath))
+    else:
+        index = synthetic_index(documents=arguments.documents,
+                                vocabulary=arguments.vocabulary,
+                                terms_per_document=arguments.terms_per_document,
+                                seed=arguments.seed)
+    return benchmark_memory(index)
+
+
+def callback_storage(arguments):
+    """Callback for storage specifier"""
+    if arguments.dataset_filepath:
+        index = build_inverted_index(load_documents(arguments.dataset_filepath))
+    else:
+        index = synthetic_index(documents=arguments.documents,
+                                vocabulary=arguments.vocabulary,
+                                terms_per_document=arguments.terms_per_document,
+                                seed=arguments.seed)
+    return benchmark_storage(index, strategies=arguments.strategies, repeat=arguments.repeat)
+
+
+def benchmark_hybrid(documents: int, rare_length: int, repeat: int, seed: int) -> None:
+    """Print query latency of list and hybrid postings for frequent and rare term mixes"""
+    rng = random.Random(seed)
+    universe = range(1, documents + 1)
+    index = InvertedIndex({
+        "the": random_postings(documents * 9 // 10, documents, rng),
+        "of": random_postings(documents * 7 // 10, documents, rng),
+        "and": random_postings(documents // 2, documents, rng),
+        "rare": sorted(rng.sample(universe, rare_length)),
+    })
+    hybrid = index.hybrid()
+    print("query\tlists_ms\thybrid_ms")
+    for words in [["the", "of"], ["the", "of", "and"], ["the", "rare"], ["the", "of", "and", "rare"]]:
+        lists_ms = measure(lambda: index.query(words), repeat)
+        hybrid_ms = measure(lambda: hybrid.query(words), repeat)
+        print(f"{'+'.join(words)}\t{lists_ms:.3f}\t{hybrid_ms:.3f}")
+
+
+def callback_hybrid(arguments):
+    """Callback for hybrid specifier"""
+    return benchmark_hybrid(documents=arguments.documents,
+                            rare_length=arguments.rare_length,
+                            repeat=arguments.repeat,
+                            seed=arguments.seed)
+
+
+def benchmark_shards(index: InvertedIndex, shard_counts: List[int], partition: str,
+                     queries: int, batch_size: int, seed: int) -> None:
+    """Print queries per second of a sharded index with one worker process per shard"""
+    rng = random.Random(seed)
+    terms = sorted(index.index, key=lambda term: len(index.index[term]), reverse=True)[:1000]
+    workload = [rng.sample(terms, rng.randint(1, 3)) for _ in range(queries)]
+    batches = [workload[start:start + batch_size] for start in range(0, queries, batch_size)]
+    print("shards\tpartition\tqueries_per_s\tbatched_queries_per_s")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in shard_counts:
+            shard_directory = os.path.join(directory, f"shards-{count}")
+            write_sharded_index(index, shard_directory, count, partition=partition)
+            sharded = ShardedInvertedIndex(shard_directory, processes=True)
+            try:
+                sharded.query(workload[0])
+                single_ms = measure(lambda: [sharded.query(words) for words in workload], 1)
+                batched_ms = measure(lambda: [sharded.query_many(batch) for batch in batches], 1)
+            finally:
+                sharded.close()
+            print(f"{count}\t{partition}\t{queries / single_ms * 1000:.1f}\t{queries / batched_ms * 1000:.1f}")
+
+
+def callback_shards(arguments):
+    """Callback for shards specifier"""
+    index = synthetic_index(documents=arguments.documents,
+                            vocabulary=arguments.vocabulary,
+                            terms_per_document=arguments.terms_per_document,
+                            seed=arguments.seed)
+    return benchmark_shards(index, shard_counts=arguments.shards, partition=arguments.partition,
+                            queries=arguments.queries, batch_size=arguments.batch_size, seed=arguments.seed)
+
+
+def latencies(function: Callable[[List[str]], object], workload: List[List[str]]) -> List[float]:
+    """Return the wall time of every query of the workload in milliseconds"""
+    samples = []
+    for words in workload:
+        start = time.perf_counter()
+        function(words)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def query_workloads(index: InvertedIndex, queries: int, seed: int) -> Dict[str, List[List[str]]]:
+    """
+    Generate queries of every shape from terms ranked by posting length:
+    the ten most frequent terms, the next thousand and the rare rest.
+    """
+    rng = random.Random(seed)
+    ranked = sorted(index.index, key=lambda term: (-len(index.index[term]), term))
+    frequent, medium, rare = ranked[:10], ranked[10:1010] or ranked, ranked[1010:] or ranked
+    shapes = {
+        "rare": lambda: [rng.choice(rare)],
+        "frequent_pair": lambda: rng.sample(frequent, min(2, len(frequent))),
+        "mixed_pair": lambda: [rng.choice(frequent), rng.choice(rare)],
+        "three_terms": lambda: [rng.choice(frequent), rng.choice(medium), rng.choice(medium)],
+        "prefix": lambda: [rng.choice(medium)[:-1] + "*"],
+    }
+    return {shape: [generate() for _ in range(queries)] for shape, generate in shapes.items()}
+
+
+def benchmark_suite(documents: int, vocabulary: int, words_per_document: int, exponent: float,
+                    strategies: List[str], queries: int, repeat: int, seed: int) -> dict:
+    """
+    Measure build throughput, dump and load time and size of every strategy
+    and query latency percentiles of every query shape on a synthetic corpus.
+    Metrics are flat names, times are in milliseconds.
+    """
+    metrics: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        dataset_filepath = os.path.join(directory, "dataset.txt")
+        write_synthetic_dataset(dataset_filepath, documents=documents, vocabulary=vocabulary,
+                                words_per_document=words_per_document, seed=seed, exponent=exponent)
+        build_ms = measure(lambda: build_inverted_index(load_documents(dataset_filepath)), repeat)
+        metrics["build.ms"] = build_ms
+        metrics["build.documents_per_s"] = documents / build_ms * 1000
+        metrics["build.MB_per_s"] = os.path.getsize(dataset_filepath) / 1024 / 1024 / (build_ms / 1000)
+        index = build_inverted_index(load_documents(dataset_filepath))
+        workloads = query_workloads(index, queries, seed)
+        for strategy in strategies:
+            filepath = os.path.join(directory, f"inverted.{strategy}")
+            try:
+                metrics[f"storage.{strategy}.dump_ms"] = measure(lambda: index.dump(filepath, strategy=strategy),
+                                                                 repeat)
+            except ValueError as error:
+                print(f"skip {strategy} strategy: {error}", file=sys.stderr)
+                continue
+            metrics[f"storage.{strategy}.bytes"] = os.path.getsize(filepath)
+            metrics[f"storage.{strategy}.load_ms"] = measure(lambda: InvertedIndex.load(filepath), repeat)
+            loaded = InvertedIndex.load(filepath)
+            for shape, workload in workloads.items():
+                samples = latencies(loaded.query, workload)
+                percentiles = statistics.quantiles(samples, n=100, method="inclusive")
+                metrics[f"query.{strategy}.{shape}.p50_ms"] = percentiles[49]
+                metrics[f"query.{strategy}.{shape}.p99_ms"] = percentiles[98]
+    return {
+        "config": {
+            "documents": documents, "vocabulary": vocabulary, "words_per_document": words_per_document,
+            "exponent": exponent, "strategies": strategies, "queries": queries, "repeat": repeat, "seed": seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+        },
+        "metrics": metrics,
+    }
+
+
+def callback_suite(arguments):
+    """Callback for suite specifier"""
+    results = benchmark_suite(documents=arguments.documents,
+                              vocabulary=arguments.vocabulary,
+                              words_per_document=arguments.words_per_document,
+                              exponent=arguments.exponent,
+                              strategies=arguments.strategies,
+                              queries=arguments.queries,
+                              repeat=arguments.repeat,
+                              seed=arguments.seed)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf8') as fout:
+            fout.write(text + "\n")
+    else:
+        print(text)
+
+
+def compare_results(baseline: dict, current: dict, threshold: float,
+                    min_ms: float = 0.0) -> List[Tuple[str, float, float, float]]:
+    """
+    Print the relative change of every metric present in both results and
+    return the (metric, baseline, current, change) regressions worse than
+    the threshold. Throughputs (_per_s) regress when they drop, sizes and
+    times when they grow; times changing by less than min_ms are noise.
+    """
+    if baseline.get("config") != current.get("config"):
+        print("warning: results were produced with different configurations", file=sys.stderr)
+    regressions = []
+    print("metric\tbaseline\tcurrent\tchange")
+    for metric in sorted(baseline["metrics"].keys() & current["metrics"].keys()):
+        old, new = baseline["metrics"][metric], current["metrics"][metric]
+        change = (new - old) / old if old else 0.0
+        worse = -change if metric.endswith("_per_s") else change
+        flag = ""
+        if worse > threshold and not (metric.endswith("_ms") and abs(new - old) < min_ms):
+            regressions.append((metric, old, new, change))
+            flag = "\tREGRESSION"
+        print(f"{metric}\t{old:.3f}\t{new:.3f}\t{change:+.1%}{flag}")
+    return regressions
+
+
+def callback_compare(arguments):
+    """Callback for compare specifier"""
+    with open(arguments.baseline, 'r', encoding='utf8') as fin:
+        baseline = json.load(fin)
+    with open(arguments.current, 'r', encoding='utf8') as fin:
+        current = json.load(fin)
+    regressions = compare_results(baseline, current, arguments.threshold, arguments.min_ms)
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {arguments.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+def callback_intersect(arguments):
+    """Callback for intersect specifier"""
+    return benchmark_intersect(lengths=arguments.lengths,
+                               skew=arguments.skew,
+                               repeat=arguments.repeat,
+                               legacy_limit=arguments.legacy_limit,
+                               seed=arguments.seed)
+
+
+def setup_parser(parser):
+    """Setup arguments parser"""
+    subparsers = parser.add_subparsers(
+        help="choose benchmark"
+    )
+
+    intersect_parser = subparsers.add_parser(
+        "intersect",
+        help="query latency against posting length",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    intersect_parser.add_argument(
+        "--lengths", nargs="+", type=int,
+        default=[100, 1000, 10000, 100000],
+        help="lengths of the shorter posting list",
+    )
+    intersect_parser.add_argument(
+        "--skew", type=int, default=1,
+        help="how many times the longer posting list exceeds the shorter one",
+    )
+    intersect_parser.add_argument(
+        "--repeat", type=int, default=5,
+        help="number of runs, the best one is reported",
+    )
+    intersect_parser.add_argument(
+        "--legacy-limit", type=int, default=20000,
+        help="skip the legacy algorithm for longer posting lists",
+    )
+    intersect_parser.add_argument(
+        "--seed", type=int, default=42,
+        help="random seed for generated posting lists",
+    )
+    intersect_parser.set_defaults(callback=callback_intersect)
+
+    storage_parser = subparsers.add_parser(
+        "storage",
+        help="index size and load time for every storage strategy",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    storage_parser.add_argument(
+        "-d", "--dataset", dest="dataset_filepath",
+        help="dataset to build the index from, a synthetic index is used if omitted",
+    )
+    storage_parser.add_argument(
+        "--documents", type=int, default=20000,
+        help="number of synthetic documents",
+    )
+    storage_parser.add_argument(
+        "--vocabulary", type=int, default=50000,
+        help="number of distinct synthetic terms",
+    )
+    storage_parser.add_argument(
+        "--terms-per-document", type=int, default=100,
+        help="number of term draws per synthetic document",
+    )
+    storage_parser.add_argument(
+        "--strategies", nargs="+", choices=list(STORAGE_WRITERS),
+        default=list(STORAGE_WRITERS),
+        help="storage strategies to compare",
+    )
+    storage_parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="number of runs, the best one is reported",
+    )
+    storage_parser.add_argument(
+        "--seed", type=int, default=42,
+        help="random seed for the synthetic index",
+    )
+    storage_parser.set_defaults(callback=callback_storage)
+
+    build_parser = subparsers.add_parser(
+        "build",
+        help="build throughput against worker count",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    build_parser.add_argument(
+        "-d", "--dataset", dest="dataset_filepath",
+        help="dataset to build the index from, a synthetic dataset is used if omitted",
+    )
+    build_parser.add_argument(
+        "--workers", nargs="+", type=int, default=[1, 2, 4],
+        help="worker counts to measure",
+    )
+    build_parser.add_argument(
+        "--documents", type=int, default=20000,
+        help="number of synthetic documents",
+    )
+    build_parser.add_argument(
+        "--vocabulary", type=int, default=50000,
+        help="number of distinct synthetic terms",
+    )
+    build_parser.add_argument(
+        "--words-per-document", type=int, default=200,
+        help="number of words per synthetic document",
+    )
+    build_parser.add_argument(
+        "--repeat", type=int, default=1,
+        help="number of runs, the best one is reported",
+    )
+    build_parser.add_argument(
+        "--seed", type=int, default=42,
+        help="random seed for the synthetic dataset",
+    )
+    build_parser.set_defaults(callback=callback_build)
+
+    memory_parser = subparsers.add_parser(
+        "memory",
+        help="memory of list-based and compact postings",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    memory_parser.add_argument(
+        "-d", "--dataset", dest="dataset_filepath",
+        help="dataset to build the index from, a synthetic index is used if omitted",
+    )
+    memory_parser.add_argument(
+        "--documents", type=int, default=20000,
+        help="number of synthetic documents",
+    )
+    memory_parser.add_argument(
+        "--vocabulary", type=int, default=50000,
+        help="number of distinct synthetic terms",
+    )
+    memory_parser.add_argument(
+        "--terms-per-document", type=int, default=100,
+        help="number of term draws per synthetic document",
+    )
+    memory_parser.add_argument(
+        "--seed", type=int, default=42,
+        help="random seed for the synthetic index",
+    )
+    memory_parser.set_defaults(callback=callback_memory)
+
+    hybrid_parser = subparsers.add_parser(
+        "hybrid",
+        help="list against bitmap-backed postings on frequent and rare terms",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    hybrid_parser.add_argument(
+        "--documents", type=int, default=500000,
+        help="number of documents in the synthetic corpus",
+    )
+    hybrid_parser.add_argument(
+        "--rare-length", type=int, default=100,
+        help="posting length of the rare term",
+    )
+    hybrid_parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="number of runs, the best one is reported",
+    )
+    hybrid_parser.add_argument(
+        "--seed", type=int, default=42,
+        help="random seed for generated posting lists",
+    )
+    hybrid_parser.set_defaults(callback=callback_hybrid)
+
+    shards_parser = subparsers.add_parser(
+        "shards",
+        help="query throughput against shard count",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    shards_parser.add_argument(
+        "--shards", nargs="+", type=int, default=[1, 2, 4],
+        help="shard counts to measure",
+    )
+    shards_parser.add_argument(
+        "--partition", choices=["term", "doc"], default="term",
+        help="partition shards by term hash or by doc id range",
+    )
+    shards_parser.add_argument(
+        "--queries", type=int, default=2000,
+        help="number of random queries over the most frequent terms",
+    )
+    shards_parser.add_argument(
+        "--batch-size", type=int, default=100,
+        help="number of queries scattered together in the batched run",
+    )
+    shards_parser.add_argument(
+        "--documents", type=int, default=20000,
+        help="number of synthetic documents",
+    )
+    shards_parser.add_argument(
+        "--vocabulary", type=int, default=50000,
+        help="number of distinct synthetic terms",
+    )
+    shards_parser.add_argument(
+        "--terms-per-document", type=int, default=100,
+        help="number of term draws per synthetic document",
+    )
+    shards_parser.add_argument(
+        "--seed", type=int, default=42,
+        help="random seed for the synthetic index and queries",
+    )
+    shards_parser.set_defaults(callback=callback_shards)
+
+    suite_parser = subparsers.add_parser(
+        "suite",
+        help="build, dump, load and query benchmarks written as json",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    suite_parser.add_argument(
+        "-o", "--output",
+        help="file to write the json results to, stdout if omitted",
+    )
+    suite_parser.add_argument(
+        "--documents", type=int, default=20000,
+        help="number of synthetic documents",
+    )
+    suite_parser.add_argument(
+        "--vocabulary", type=int, default=50000,
+        help="number of distinct synthetic terms",
+    )
+    suite_parser.add_argument(
+        "--words-per-document", type=int, default=100,
+        help="number of words per synthetic document",
+    )
+    suite_parser.add_argument(
+        "--exponent", type=float, default=1.0,
+        help="Zipf exponent of the vocabulary, larger values make frequent terms heavier",
+    )
+    suite_parser.add_argument(
+        "--strategies", nargs="+", choices=list(STORAGE_WRITERS),
+        default=list(STORAGE_WRITERS),
+        help="storage strategies to measure",
+    )
+    suite_parser.add_argument(
+        "--queries", type=int, default=200,
+        help="number of queries of every shape",
+    )
+    suite_parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="number of build, dump and load runs, the best one is reported",
+    )
+    suite_parser.add_argument(
+        "--seed", type=int, default=42,
+        help="random seed for the synthetic corpus and queries",
+    )
+    suite_parser.set_defaults(callback=callback_suite)
+
+    compare_parser = subparsers.add_parser(
+        "compare",
+        help="compare two suite results and fail on regressions",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    compare_parser.add_argument("baseline", help="json results of the baseline run")
+    compare_parser.add_argument("current", help="json results of the run to check")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1,
+        help="relative change of a metric reported as a regression",
+    )
+    compare_parser.add_argument(
+        "--min-ms", type=float, default=0.5,
+        help="ignore time metrics changing by fewer milliseconds than this",
+    )
+    compare_parser.set_defaults(callback=callback_compare)
+
+
+def main():
+    """Run the chosen benchmark"""
+    parser = ArgumentParser(
+        prog="Inverted Index benchmarks",
+        description="tool to measure InvertedIndex performance",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    setup_parser(parser)
+    arguments = parser.parse_args()
+    if not hasattr(arguments, "callback"):
+        parser.print_help(file=sys.stderr)
+        return
+    arguments.callback(arguments)
+
+
+if __name__ == "__main__":
+    main()
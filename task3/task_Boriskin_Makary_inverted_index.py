@@ -14,23 +14,153 @@ use load_documents(filepath: str) -> Dict[int, str] to load set of documents
 from dataset to dictionary;
 use build_inverted_index(load_documents(filepath: str)) -> InvertedIndex to
 create an InvertedIndex object from the set of documents imported previously
-from dataset.
+from dataset;
+use write_document_store(dataset_filepath, store_filepath) and
+DocumentStore(store_filepath)[doc_id] to fetch document texts by id without
+loading the dataset.
 """
 
 from __future__ import annotations
 
 import os
-from io import TextIOWrapper
+import asyncio
+import heapq
+import math
+import mmap
+import shutil
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatchcase
+from functools import lru_cache, partial
+from itertools import accumulate, groupby
+from operator import itemgetter
+from io import BytesIO, TextIOWrapper
+from multiprocessing import resource_tracker, shared_memory
 import json
+import pickle
 import re
+import signal
+import time
+import zlib
 import sys
-from struct import pack, unpack, calcsize
+from struct import pack, unpack, unpack_from, calcsize
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType, ArgumentTypeError
-from typing import Dict, List
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, TextIO, Tuple
+
+try:
+    import numpy
+except ImportError:  # numpy is optional: compact postings fall back to plain arrays
+    numpy = None
 
 DEFAULT_DATASET_PATH = "wikipedia_sample"
 DEFAULT_INVERTED_INDEX_STORE_PATH = "inverted.index"
 
+# switch from linear merge to galloping search when one posting list
+# is at least this many times longer than the running intersection
+GALLOPING_RATIO = 8
+
+# Roaring-style hybrid postings: chunks of 2 ** 16 doc ids are stored as
+# sorted arrays of low bits up to ARRAY_CONTAINER_LIMIT values, as bitmaps above
+CHUNK_BITS = 16
+ARRAY_CONTAINER_LIMIT = 4096
+BITMAP_BYTES = (1 << CHUNK_BITS) // 8
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+# BM25 ranking parameters and the default number of ranked results
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_TOP_K = 10
+
+# query terms with this character are patterns expanded over the sorted term dictionary
+WILDCARD = '*'
+QUERY_TOKEN_PATTERN = re.compile(r'[\w*]+')
+
+# analyzer: tokens are runs of word characters, terms are normalized tokens
+ANALYZER_TOKEN_PATTERN = re.compile(r'\w+')
+ANALYZER_CACHE_LIMIT = 1 << 20
+# stop words of Lucene's english analyzer
+ENGLISH_STOP_WORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "is", "it",
+    "no", "not", "of", "on", "or", "such", "that", "the", "their", "then", "there", "these",
+    "they", "this", "to", "was", "will", "with",
+))
+
+# boolean queries: upper-case operators, parentheses and terms, adjacent operands are AND-ed
+BOOLEAN_TOKEN_PATTERN = re.compile(r'[()]|[\w*]+')
+BOOLEAN_OPERATORS = ("AND", "OR", "NOT")
+
+# on-disk layout of the struct strategy (version 3):
+# magic | meta size ('<I') | json meta (e.g. analyzer config)
+# | header ('<cQQ': postings typecode, terms, term block size)
+# | newline separated utf-8 terms | counts ('<I' per term) | postings (little-endian)
+# version 2 has no meta, files without a magic are read as version 1 with a json header per term
+STRUCT_MAGIC = b"IIDXSTR3"
+STRUCT_V2_MAGIC = b"IIDXSTR2"
+STRUCT_META_SIZE_FORMAT = '<I'
+STRUCT_HEADER_FORMAT = '<cQQ'
+
+# on-disk layout of the pickle strategy: magic | header ('<QQQ': pickle, counts and postings sizes)
+# | protocol 5 pickle of terms, typecode and meta | counts and postings as out-of-band buffers
+PICKLE_MAGIC = b"IIDXPKL5"
+PICKLE_HEADER_FORMAT = '<QQQ'
+
+# on-disk layout of the memory-mapped strategy:
+# magic | aligned sections | json footer | footer offset ('<Q')
+MMAP_MAGIC = b"IIDXMMAP"
+MMAP_FORMAT_VERSION = 1
+FOOTER_OFFSET_FORMAT = '<Q'
+SECTION_ALIGNMENT = 8
+# varbyte postings longer than a skip block get a skip table: the last doc id and
+# the end of the bytes of every block of SKIP_BLOCK_SIZE doc ids
+SKIP_BLOCK_SIZE = 128
+
+# rough CPython footprint used to bound in-memory blocks of the streaming build
+ESTIMATED_TERM_BYTES = 200
+ESTIMATED_POSTING_BYTES = 40
+# a run file starts with the sorted doc ids of its block, varbyte encoded in chunks
+RUN_DOC_IDS_CHUNK = 4096
+MEMORY_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+# document store: a container with doc id -> (start, length) tables pointing into
+# the dataset, or into zlib compressed blocks of whole documents kept in the store;
+# tables are indexed by doc id unless doc ids are sparser than the density factor
+DOCUMENT_STORE_BLOCK_SIZE = 64 * 1024
+DOCUMENT_STORE_DENSITY = 4
+DOCUMENT_STORE_CACHED_BLOCKS = 16
+MISSING_DOCUMENT = 2 ** 64 - 1
+SNIPPET_WORDS = 20
+DEFAULT_SNIPPETS = 10
+
+# query --jobs: number of query file lines sent to a worker process at once
+DEFAULT_QUERY_CHUNK = 1000
+
+# stats subcommand: nearest-rank percentiles of posting lengths and the heaviest terms shown
+STATS_PERCENTILES = (50, 90, 99)
+DEFAULT_STATS_TOP = 10
+
+# segmented indexes are directories with a manifest listing live segments;
+# adding documents merges segments once there are more than the merge factor
+SEGMENTS_MANIFEST = "manifest.json"
+DEFAULT_MERGE_FACTOR = 10
+
+# sharded index: a directory with the manifest and one index file per shard,
+# shards own terms by crc32 hash ("term") or contiguous doc id ranges ("doc")
+SHARDS_MANIFEST = "shards.json"
+SHARD_PARTITIONS = ("term", "doc")
+
+# shared memory block: container size ('<Q') followed by a raw mmap container
+SHARED_SIZE_FORMAT = '<Q'
+DEFAULT_SHARED_MEMORY_NAME = "inverted_index"
+
+# query server: one query per line in, one comma separated answer per line out
+DEFAULT_SERVE_HOST = "127.0.0.1"
+DEFAULT_SERVE_PORT = 8765
+DEFAULT_RELOAD_INTERVAL = 1.0
+
 
 class EncodedFileType(FileType):
     def __call__(self, string):
@@ -54,6 +184,1434 @@ class EncodedFileType(FileType):
             raise ArgumentTypeError(message % (string, e))
 
 
+def _galloping_search(postings: Sequence[int], target: int, low: int) -> int:
+    """Return the first position not before low whose doc id is >= target"""
+    if isinstance(postings, (SkipPostings, HybridPostings)):
+        return postings.search(target, low)
+    size = len(postings)
+    step = 1
+    high = low
+    while high < size and postings[high] < target:
+        low = high + 1
+        high += step
+        step <<= 1
+    return bisect_left(postings, target, low, min(high, size))
+
+
+def _intersect_galloping(short: Sequence[int], long: Sequence[int]) -> List[int]:
+    """Intersect a short sorted list with a much longer one by exponential search"""
+    result = []
+    position = 0
+    size = len(long)
+    for doc_id in short:
+        position = _galloping_search(long, doc_id, position)
+        if position >= size:
+            break
+        if long[position] == doc_id:
+            result.append(doc_id)
+            position += 1
+    return result
+
+
+def _intersect_merge(left: Sequence[int], right: Sequence[int]) -> List[int]:
+    """Intersect two sorted lists of similar size by a linear merge"""
+    result = []
+    i = j = 0
+    left_size, right_size = len(left), len(right)
+    while i < left_size and j < right_size:
+        left_doc, right_doc = left[i], right[j]
+        if left_doc == right_doc:
+            result.append(left_doc)
+            i += 1
+            j += 1
+        elif left_doc < right_doc:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _bitmap_lows(bitmap: bytes) -> array:
+    """Return the sorted low bits set in a bitmap container"""
+    return array('H', (
+        byte_position * 8 + bit
+        for byte_position, byte in enumerate(bitmap) if byte
+        for bit in _BYTE_BITS[byte]
+    ))
+
+
+def _make_container(lows: array):
+    """Store sorted low bits of a chunk as an array or, when dense, as a bitmap"""
+    if len(lows) <= ARRAY_CONTAINER_LIMIT:
+        return lows
+    bitmap = bytearray(BITMAP_BYTES)
+    for low in lows:
+        bitmap[low >> 3] |= 1 << (low & 7)
+    return bytes(bitmap)
+
+
+def _intersect_containers(left, right) -> Optional[Tuple[object, int]]:
+    """Intersect two containers of the same chunk, None if nothing is left"""
+    if isinstance(left, bytes) and isinstance(right, bytes):
+        # word-level AND of both bitmaps
+        value = int.from_bytes(left, 'little') & int.from_bytes(right, 'little')
+        cardinality = bin(value).count('1')
+        if not cardinality:
+            return None
+        bitmap = value.to_bytes(BITMAP_BYTES, 'little')
+        return (bitmap if cardinality > ARRAY_CONTAINER_LIMIT else _bitmap_lows(bitmap)), cardinality
+    if isinstance(left, bytes):
+        left, right = right, left
+    if isinstance(right, bytes):
+        lows = array('H', (low for low in left if right[low >> 3] >> (low & 7) & 1))
+    else:
+        short, long = sorted((left, right), key=len)
+        if len(long) >= GALLOPING_RATIO * len(short):
+            lows = array('H', _intersect_galloping(short, long))
+        else:
+            lows = array('H', _intersect_merge(short, long))
+    return (lows, len(lows)) if lows else None
+
+
+class HybridPostings:
+    """Sorted doc ids split into Roaring-style containers.
+
+    Doc ids sharing the high bits form a chunk of 2 ** 16 values; sparse
+    chunks keep their low bits in a sorted array('H'), dense ones switch
+    to an 8 KiB bitmap so that intersections become word-level AND.
+    """
+
+    def __init__(self, keys: List[int], containers: list, cardinalities: List[int]):
+        self._keys = keys
+        self._containers = containers
+        self._ranks = list(accumulate(cardinalities, initial=0))
+        # (container position, sorted lows) of the last decoded bitmap
+        self._decoded: Tuple[int, Sequence[int]] = (-1, array('H'))
+
+    @classmethod
+    def from_sorted(cls, doc_ids: Iterable[int]) -> HybridPostings:
+        """Build containers from sorted doc ids"""
+        keys, containers, cardinalities = [], [], []
+        for key, group in groupby(doc_ids, key=lambda doc_id: doc_id >> CHUNK_BITS):
+            if key >= 2 ** 32:
+                raise ValueError(f"hybrid postings support doc ids below 2 ** 48, got chunk {key}")
+            lows = array('H', (doc_id & 0xFFFF for doc_id in group))
+            keys.append(key)
+            containers.append(_make_container(lows))
+            cardinalities.append(len(lows))
+        return cls(keys, containers, cardinalities)
+
+    @property
+    def has_bitmaps(self) -> bool:
+        return any(isinstance(container, bytes) for container in self._containers)
+
+    def intersection(self, other: HybridPostings) -> HybridPostings:
+        """Intersect chunk by chunk, choosing the operation by container kinds"""
+        keys, containers, cardinalities = [], [], []
+        i = j = 0
+        while i < len(self._keys) and j < len(other._keys):
+            if self._keys[i] < other._keys[j]:
+                i += 1
+            elif self._keys[i] > other._keys[j]:
+                j += 1
+            else:
+                intersected = _intersect_containers(self._containers[i], other._containers[j])
+                if intersected is not None:
+                    keys.append(self._keys[i])
+                    containers.append(intersected[0])
+                    cardinalities.append(intersected[1])
+                i += 1
+                j += 1
+        return HybridPostings(keys, containers, cardinalities)
+
+    def filter_sorted(self, doc_ids: Iterable[int]) -> List[int]:
+        """Keep the doc ids present in these postings"""
+        return [doc_id for doc_id in doc_ids if doc_id in self]
+
+    def tobytes(self) -> bytes:
+        """Serialize as a container count followed by (key, kind, cardinality, payload) records"""
+        chunks = [pack('<I', len(self._keys))]
+        for position, (key, container) in enumerate(zip(self._keys, self._containers)):
+            cardinality = self._ranks[position + 1] - self._ranks[position]
+            if isinstance(container, bytes):
+                chunks.append(pack('<IBI', key, 1, cardinality))
+                chunks.append(container)
+            else:
+                chunks.append(pack('<IBI', key, 0, cardinality))
+                chunks.append(_array_to_le_bytes(container))
+        return b''.join(chunks)
+
+    @classmethod
+    def frombytes(cls, data: bytes) -> HybridPostings:
+        """Deserialize containers written by tobytes"""
+        data = memoryview(data)
+        count = unpack('<I', data[:4])[0]
+        record_size = calcsize('<IBI')
+        offset = 4
+        keys, containers, cardinalities = [], [], []
+        for _ in range(count):
+            key, kind, cardinality = unpack('<IBI', data[offset:offset + record_size])
+            offset += record_size
+            if kind:
+                containers.append(bytes(data[offset:offset + BITMAP_BYTES]))
+                offset += BITMAP_BYTES
+            else:
+                containers.append(_decode_raw(data[offset:offset + 2 * cardinality], 'H'))
+                offset += 2 * cardinality
+            keys.append(key)
+            cardinalities.append(cardinality)
+        return cls(keys, containers, cardinalities)
+
+    def __len__(self) -> int:
+        return self._ranks[-1]
+
+    def __iter__(self) -> Iterator[int]:
+        for key, container in zip(self._keys, self._containers):
+            base = key << CHUNK_BITS
+            lows = _bitmap_lows(container) if isinstance(container, bytes) else container
+            for low in lows:
+                yield base | low
+
+    def __contains__(self, doc_id) -> bool:
+        key = doc_id >> CHUNK_BITS
+        position = bisect_left(self._keys, key)
+        if position == len(self._keys) or self._keys[position] != key:
+            return False
+        container = self._containers[position]
+        low = doc_id & 0xFFFF
+        if isinstance(container, bytes):
+            return bool(container[low >> 3] >> (low & 7) & 1)
+        found = bisect_left(container, low)
+        return found < len(container) and container[found] == low
+
+    def _lows(self, position: int) -> Sequence[int]:
+        """Return sorted low bits of a container, decoding a bitmap only when it was not the last one"""
+        container = self._containers[position]
+        if not isinstance(container, bytes):
+            return container
+        if self._decoded[0] != position:
+            self._decoded = (position, _bitmap_lows(container))
+        return self._decoded[1]
+
+    def search(self, target: int, low: int = 0) -> int:
+        """Return the first position not before low whose doc id is >= target"""
+        if low >= len(self):
+            return len(self)
+        key = target >> CHUNK_BITS
+        position = bisect_left(self._keys, key, bisect_right(self._ranks, low) - 1)
+        if position == len(self._keys):
+            return len(self)
+        if self._keys[position] > key:
+            return max(self._ranks[position], low)
+        return max(self._ranks[position] + bisect_left(self._lows(position), target & 0xFFFF), low)
+
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("hybrid postings index out of range")
+        position = bisect_right(self._ranks, index) - 1
+        return (self._keys[position] << CHUNK_BITS) | self._lows(position)[index - self._ranks[position]]
+
+
+def _encode_roaring(doc_ids: Sequence[int], typecode: str) -> bytes:
+    return HybridPostings.from_sorted(doc_ids).tobytes()
+
+
+def _decode_roaring(data: bytes, typecode: str) -> Sequence[int]:
+    """Decode hybrid postings, lists without bitmap containers become plain arrays"""
+    postings = HybridPostings.frombytes(data)
+    return postings if postings.has_bitmaps else array(typecode, postings)
+
+
+def intersect_postings(postings_lists: List[Sequence[int]]) -> List[int]:
+    """
+    Intersect sorted posting lists starting from the shortest one.
+    Lists of similar size are merged linearly, skewed ones are galloped over;
+    hybrid postings are intersected container-wise and then filter the rest.
+    """
+    if not postings_lists:
+        return []
+    ordered = sorted(postings_lists, key=len)
+    if any(isinstance(postings, HybridPostings) for postings in ordered):
+        hybrids = [postings for postings in ordered if isinstance(postings, HybridPostings)]
+        plain = [postings for postings in ordered if not isinstance(postings, HybridPostings)]
+        if plain:
+            # a short plain list is cheaper to probe against bitmaps than AND-ing them
+            result = intersect_postings(plain)
+            for postings in hybrids:
+                if not result:
+                    break
+                result = postings.filter_sorted(result)
+            return result
+        combined = hybrids[0]
+        for postings in hybrids[1:]:
+            combined = combined.intersection(postings)
+        return list(combined)
+    if numpy is not None and all(isinstance(postings, numpy.ndarray) for postings in ordered):
+        result = ordered[0]
+        for postings in ordered[1:]:
+            if not len(result):
+                break
+            result = numpy.intersect1d(result, postings, assume_unique=True)
+        return result.tolist()
+    result = list(ordered[0])
+    for postings in ordered[1:]:
+        if not result:
+            break
+        if len(postings) >= GALLOPING_RATIO * len(result):
+            result = _intersect_galloping(result, postings)
+        else:
+            result = _intersect_merge(result, postings)
+    return result
+
+
+def union_postings(postings_lists: List[Sequence[int]]) -> List[int]:
+    """Merge sorted posting lists into one sorted list without repeats"""
+    if len(postings_lists) == 1:
+        return list(postings_lists[0])
+    result = []
+    previous = None
+    for doc_id in heapq.merge(*postings_lists):
+        if doc_id != previous:
+            result.append(doc_id)
+            previous = doc_id
+    return result
+
+
+def difference_postings(left: Sequence[int], right: Sequence[int]) -> List[int]:
+    """Return doc ids of the sorted left list missing from the sorted right one"""
+    if isinstance(right, HybridPostings):
+        return [doc_id for doc_id in left if doc_id not in right]
+    result = []
+    position = 0
+    for doc_id in left:
+        position = _galloping_search(right, doc_id, position)
+        if position == len(right) or right[position] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+class QueryNode(NamedTuple):
+    """Node of a boolean query: a TERM leaf or an AND, OR, NOT operator over children"""
+    op: str
+    term: Optional[str] = None
+    children: Tuple[QueryNode, ...] = ()
+    cost: int = 0
+
+
+def parse_boolean_query(expression: str) -> QueryNode:
+    """
+    Parse a query like `python AND (snake OR NOT monty)` into a QueryNode tree.
+    NOT binds tighter than AND, AND binds tighter than OR; operators are upper-case.
+    """
+    tokens = BOOLEAN_TOKEN_PATTERN.findall(expression)
+    position = 0
+
+    def peek() -> Optional[str]:
+        return tokens[position] if position < len(tokens) else None
+
+    def take() -> str:
+        nonlocal position
+        if position == len(tokens):
+            raise ValueError(f"unexpected end of boolean query {expression!r}")
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or() -> QueryNode:
+        children = [parse_and()]
+        while peek() == "OR":
+            take()
+            children.append(parse_and())
+        return _boolean_node("OR", children)
+
+    def parse_and() -> QueryNode:
+        children = [parse_unary()]
+        while peek() is not None and peek() not in ("OR", ")"):
+            if peek() == "AND":
+                take()
+            children.append(parse_unary())
+        return _boolean_node("AND", children)
+
+    def parse_unary() -> QueryNode:
+        token = take()
+        if token == "NOT":
+            return QueryNode("NOT", children=(parse_unary(),))
+        if token == "(":
+            node = parse_or()
+            if take() != ")":
+                raise ValueError(f"missing closing parenthesis in boolean query {expression!r}")
+            return node
+        if token in BOOLEAN_OPERATORS or token == ")":
+            raise ValueError(f"unexpected {token!r} in boolean query {expression!r}")
+        return QueryNode("TERM", term=token)
+
+    if not tokens:
+        raise ValueError("boolean query is empty")
+    root = parse_or()
+    if position != len(tokens):
+        raise ValueError(f"unexpected {tokens[position]!r} in boolean query {expression!r}")
+    return root
+
+
+def _boolean_node(op: str, children: List[QueryNode]) -> QueryNode:
+    """Return the only child or an operator node with nested nodes of the same operator flattened"""
+    if len(children) == 1:
+        return children[0]
+    flat = []
+    for child in children:
+        flat.extend(child.children if child.op == op else (child,))
+    return QueryNode(op, children=tuple(flat))
+
+
+def _terms_with_prefix_in_sorted(terms: Sequence[str], prefix: str) -> Iterator[str]:
+    """Yield terms starting with the prefix from a sorted sequence of terms"""
+    position = bisect_left(terms, prefix)
+    while position < len(terms) and terms[position].startswith(prefix):
+        yield terms[position]
+        position += 1
+
+
+def expand_pattern(terms_with_prefix: Callable[[str], Iterable[str]], pattern: str) -> List[str]:
+    """
+    Expand a wildcard pattern like pyth* or n*work into dictionary terms:
+    the literal prefix before the first wildcard is located by binary search
+    in the sorted term dictionary, the rest of the pattern filters that range.
+    """
+    prefix = pattern.split(WILDCARD, 1)[0]
+    candidates = terms_with_prefix(prefix)
+    if pattern == prefix + WILDCARD:
+        return list(candidates)
+    regex = re.compile('.*'.join(map(re.escape, pattern.split(WILDCARD))), re.DOTALL)
+    return [term for term in candidates if regex.fullmatch(term)]
+
+
+def _lookup(index: Mapping[str, Sequence[int]], term: str,
+            terms_with_prefix: Callable[[str], Iterable[str]]) -> Optional[Sequence[int]]:
+    """Return postings of the term or the union for a wildcard pattern, None if nothing matches"""
+    if WILDCARD in term:
+        expanded = expand_pattern(terms_with_prefix, term)
+        return union_postings([index[expanded_term] for expanded_term in expanded]) if expanded else None
+    return index[term] if term in index else None
+
+
+def _s_stem(term: str) -> str:
+    """Harman's S stemmer: strip English plural endings"""
+    if len(term) <= 3:
+        return term
+    if term.endswith("ies") and not term.endswith(("eies", "aies")):
+        return term[:-3] + "y"
+    if term.endswith("es") and not term.endswith(("aes", "ees", "oes")):
+        return term[:-1]
+    if term.endswith("s") and not term.endswith(("us", "ss")):
+        return term[:-1]
+    return term
+
+
+STEMMERS: Dict[str, Callable[[str], str]] = {"s": _s_stem}
+
+
+class Analyzer:
+    """Turn text into index terms: split into word tokens, lower-case them,
+    drop stop words and tokens of unusual length, stem the rest.
+
+    The same analyzer is used to build and to query an index; its config is
+    stored in the index header. Stages are compiled into list transforms once,
+    stems are cached, so every distinct token is stemmed once.
+    """
+
+    def __init__(self, lowercase: bool = True, stop_words: Iterable[str] = (),
+                 min_length: int = 1, max_length: int = 0, stemmer: Optional[str] = None):
+        if stemmer is not None and stemmer not in STEMMERS:
+            raise ValueError(f"unknown stemmer {stemmer!r}, choose one of {list(STEMMERS)}")
+        self.config = {
+            "lowercase": lowercase,
+            "stop_words": sorted(set(stop_words)),
+            "min_length": min_length,
+            "max_length": max_length,
+            "stemmer": stemmer,
+        }
+        self._lowercase = lowercase
+        self._stop_words = frozenset(self.config["stop_words"])
+        self._min_length = min_length
+        self._max_length = max_length or sys.maxsize
+        self._filters = bool(self._stop_words) or min_length > 1 or max_length > 0
+        self._stem = STEMMERS[stemmer] if stemmer is not None else None
+        self._stems: Dict[str, str] = {}
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> Analyzer:
+        """Return the analyzer for a stored config, the default one for None; analyzers are shared"""
+        if not config or config == DEFAULT_ANALYZER.config:
+            return DEFAULT_ANALYZER
+        key = json.dumps(config, sort_keys=True)
+        if key not in _ANALYZERS:
+            _ANALYZERS[key] = cls(**config)
+        return _ANALYZERS[key]
+
+    @property
+    def is_default(self) -> bool:
+        return self.config == DEFAULT_ANALYZER.config
+
+    def _keep(self, token: str) -> bool:
+        return self._min_length <= len(token) <= self._max_length and token not in self._stop_words
+
+    def _stem_token(self, token: str) -> str:
+        stem = self._stem(token)
+        if len(self._stems) < ANALYZER_CACHE_LIMIT:
+            self._stems[token] = stem
+        return stem
+
+    def terms(self, text: str) -> List[str]:
+        """Return terms of the text in order"""
+        tokens = ANALYZER_TOKEN_PATTERN.findall(text.lower() if self._lowercase else text)
+        if self._filters:
+            minimum, maximum, stop_words = self._min_length, self._max_length, self._stop_words
+            tokens = [token for token in tokens if minimum <= len(token) <= maximum and token not in stop_words]
+        if self._stem is not None:
+            stems = self._stems
+            tokens = [stems.get(token) or self._stem_token(token) for token in tokens]
+        return tokens
+
+    def positions(self, text: str) -> Iterator[Tuple[int, str]]:
+        """Yield (token position, term) pairs; dropped tokens leave gaps in positions"""
+        tokens = ANALYZER_TOKEN_PATTERN.findall(text.lower() if self._lowercase else text)
+        for position, token in enumerate(tokens):
+            if self._filters and not self._keep(token):
+                continue
+            if self._stem is not None:
+                token = self._stems.get(token) or self._stem_token(token)
+            yield position, token
+
+    def query_terms(self, words: Iterable[str]) -> List[str]:
+        """Return terms of query words, wildcard patterns are only lower-cased"""
+        terms = []
+        for word in words:
+            for token in QUERY_TOKEN_PATTERN.findall(word):
+                if WILDCARD in token:
+                    terms.append(token.lower() if self._lowercase else token)
+                else:
+                    terms.extend(self.terms(token))
+        return terms
+
+    def __eq__(self, other):
+        if not isinstance(other, Analyzer):
+            return NotImplemented
+        return self.config == other.config
+
+    def __repr__(self) -> str:
+        return f"Analyzer({self.config!r})"
+
+
+DEFAULT_ANALYZER = Analyzer()
+_ANALYZERS: Dict[str, Analyzer] = {}
+
+
+def load_stop_words(value: str) -> frozenset:
+    """Return English stop words for "english" or the words listed one per line in a file"""
+    if value == "english":
+        return ENGLISH_STOP_WORDS
+    with open(value, 'r', encoding='utf8') as fin:
+        return frozenset(line.strip().lower() for line in fin if line.strip())
+
+
+def _postings_typecode(max_doc_id: int) -> str:
+    """Choose the narrowest unsigned array typecode able to hold doc ids"""
+    if max_doc_id < 2 ** 16:
+        return 'H'
+    return 'I' if max_doc_id < 2 ** 32 else 'Q'
+
+
+def _array_to_le_bytes(values: array) -> bytes:
+    """Serialize an array in little-endian byte order"""
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _read_array(buffer: memoryview, typecode: str, offset: int, size: int) -> Sequence[int]:
+    """View a little-endian array section of the buffer without copying it"""
+    view = buffer[offset:offset + size]
+    if sys.byteorder == 'little':
+        return view.cast(typecode)
+    values = array(typecode)
+    values.frombytes(view)
+    values.byteswap()
+    return values
+
+
+def _map_file(filepath: str) -> memoryview:
+    """Map the whole file read-only into memory"""
+    with open(filepath, 'rb') as fin:
+        if os.fstat(fin.fileno()).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def encode_varbyte(doc_ids: Sequence[int], gaps: bool = True, base: int = 0) -> bytes:
+    """
+    Encode sorted doc ids as gaps in variable-byte format:
+    7 bits per byte, least significant group first, high bit marks continuation.
+    The first gap is taken from base, the last doc id of a previous block.
+    With gaps=False the values are encoded as they are (e.g. term frequencies).
+    """
+    encoded = bytearray()
+    previous = base
+    for doc_id in doc_ids:
+        gap = doc_id - previous
+        if gaps:
+            previous = doc_id
+        while gap >= 0x80:
+            encoded.append((gap & 0x7F) | 0x80)
+            gap >>= 7
+        encoded.append(gap)
+    return bytes(encoded)
+
+
+def decode_varbyte(data: bytes, typecode: str = 'Q', gaps: bool = True, base: int = 0) -> array:
+    """Decode variable-byte doc ids (or plain values with gaps=False) produced by encode_varbyte"""
+    if not data:
+        return array(typecode)
+    if max(data) < 0x80:
+        # every value fits into one byte: a prefix sum restores the doc ids
+        if not gaps:
+            return array(typecode, data)
+        doc_ids = array(typecode, accumulate(data, initial=base))
+        del doc_ids[0]
+        return doc_ids
+    doc_ids = array(typecode)
+    append = doc_ids.append
+    gap = shift = 0
+    previous = base
+    for byte in data:
+        if byte & 0x80:
+            gap |= (byte & 0x7F) << shift
+            shift += 7
+        else:
+            if gaps:
+                previous += gap | (byte << shift)
+            else:
+                previous = gap | (byte << shift)
+            append(previous)
+            gap = shift = 0
+    return doc_ids
+
+
+class SkipPostings:
+    """Sorted doc ids of a varbyte posting list read through its skip table.
+
+    The list is encoded in blocks of block_size doc ids, the skip table keeps
+    (last doc id, end of block bytes) pairs. A search bisects the table and
+    decodes only the block it lands in; the last decoded block is kept.
+    """
+
+    def __init__(self, data: memoryview, skips: Sequence[int], size: int, typecode: str, block_size: int):
+        self._data = data
+        self._last = skips[0::2]
+        self._ends = skips[1::2]
+        self._size = size
+        self._typecode = typecode
+        self._block_size = block_size
+        self._block_number = -1
+        self._block = array(typecode)
+
+    def _decode_block(self, number: int) -> array:
+        if number != self._block_number:
+            start, base = (self._ends[number - 1], self._last[number - 1]) if number else (0, 0)
+            self._block = decode_varbyte(self._data[start:self._ends[number]], self._typecode, base=base)
+            self._block_number = number
+        return self._block
+
+    def decode(self) -> array:
+        """Decode the whole posting list"""
+        return decode_varbyte(self._data, self._typecode)
+
+    def search(self, target: int, low: int = 0) -> int:
+        """Return the first position not before low whose doc id is >= target"""
+        number = bisect_left(self._last, target, low // self._block_size)
+        if number >= len(self._last):
+            return self._size
+        offset = number * self._block_size
+        return offset + bisect_left(self._decode_block(number), target, max(low - offset, 0))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.decode()[index]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("postings index out of range")
+        return self._decode_block(index // self._block_size)[index % self._block_size]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.decode())
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return f"SkipPostings({self.decode().tolist()!r})"
+
+
+def encode_positions(positions_lists: Iterable[Sequence[int]]) -> bytes:
+    """
+    Encode token positions of every posting of a term as one block:
+    the varbyte length of a header listing the encoded size of every posting,
+    the header itself and the gap-encoded positions of all postings.
+    """
+    encoded = [encode_varbyte(positions) for positions in positions_lists]
+    header = encode_varbyte([len(data) for data in encoded], gaps=False)
+    return encode_varbyte([len(header)], gaps=False) + header + b''.join(encoded)
+
+
+class PositionsBlock:
+    """Token positions of a term decoded one posting at a time from an encode_positions block"""
+
+    def __init__(self, data: bytes):
+        data = memoryview(data)
+        header_end = 0
+        while data[header_end] & 0x80:
+            header_end += 1
+        header_end += 1
+        header_size = decode_varbyte(data[:header_end], gaps=False)[0]
+        sizes = decode_varbyte(data[header_end:header_end + header_size], gaps=False)
+        self._offsets = array('Q', accumulate(sizes, initial=header_end + header_size))
+        self._data = data
+
+    def positions(self, index: int) -> array:
+        """Return sorted positions of the term in the document at the given posting index"""
+        return decode_varbyte(self._data[self._offsets[index]:self._offsets[index + 1]], 'I')
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+
+def _write_json(fout: BinaryIO, items: Iterable[Tuple[str, Sequence[int]]],
+                typecode: str = 'I') -> None:
+    """Write term and postings pairs as one json object"""
+    fout.write(b'{')
+    for position, (term, doc_ids) in enumerate(items):
+        if position:
+            fout.write(b', ')
+        fout.write(f"{json.dumps(term)}: {json.dumps(list(doc_ids))}".encode('utf-8'))
+    fout.write(b'}')
+
+
+def _write_array(fout: BinaryIO, values: array) -> None:
+    """Write the array in little-endian byte order in one call"""
+    if sys.byteorder == 'little':
+        values.tofile(fout)
+    else:
+        fout.write(_array_to_le_bytes(values))
+
+
+def _write_struct(fout: BinaryIO, items: Iterable[Tuple[str, Sequence[int]]],
+                  typecode: str = 'I', analyzer: Optional[dict] = None) -> None:
+    """Write term and postings pairs as one term block, one counts array and one postings array"""
+    terms = []
+    counts = array('I')
+    postings = array(typecode)
+    for term, doc_ids in items:
+        if '\n' in term:
+            raise ValueError(f"struct strategy separates terms by newlines, but got term {term!r}")
+        terms.append(term)
+        counts.append(len(doc_ids))
+        postings.fromlist(list(doc_ids))
+    term_block = '\n'.join(terms).encode('utf-8')
+    meta = json.dumps({"analyzer": analyzer} if analyzer else {}).encode('utf-8')
+    fout.write(STRUCT_MAGIC)
+    fout.write(pack(STRUCT_META_SIZE_FORMAT, len(meta)))
+    fout.write(meta)
+    fout.write(pack(STRUCT_HEADER_FORMAT, typecode.encode('ascii'), len(terms), len(term_block)))
+    fout.write(term_block)
+    _write_array(fout, counts)
+    _write_array(fout, postings)
+
+
+def _read_struct(data: bytes) -> Tuple[Dict[str, List[int]], dict]:
+    """Read the term -> postings dict and the meta written by _write_struct (or its version 2)"""
+    offset = len(STRUCT_MAGIC)
+    meta = {}
+    if data[:offset] == STRUCT_MAGIC:
+        meta_size = unpack_from(STRUCT_META_SIZE_FORMAT, data, offset)[0]
+        offset += calcsize(STRUCT_META_SIZE_FORMAT)
+        meta = json.loads(data[offset:offset + meta_size].decode('utf-8'))
+        offset += meta_size
+    typecode, size, term_block_size = unpack_from(STRUCT_HEADER_FORMAT, data, offset)
+    offset += calcsize(STRUCT_HEADER_FORMAT)
+    terms = data[offset:offset + term_block_size].decode('utf-8').split('\n') if size else []
+    offset += term_block_size
+    counts = array('I')
+    counts.frombytes(data[offset:offset + size * counts.itemsize])
+    offset += size * counts.itemsize
+    postings = array(typecode.decode('ascii'))
+    postings.frombytes(data[offset:])
+    if sys.byteorder != 'little':
+        counts.byteswap()
+        postings.byteswap()
+    index = {}
+    position = 0
+    for term, count in zip(terms, counts):
+        index[term] = postings[position:position + count].tolist()
+        position += count
+    return index, meta
+
+
+def _read_struct_v1(filepath: str) -> Dict[str, List[int]]:
+    """Read the first struct format: a json header per term followed by 16-bit doc ids"""
+    size = os.path.getsize(filepath)
+    inverted_index = dict()
+    with open(filepath, 'rb') as fin:
+        while fin.tell() < size:
+            meta = unpack('>I', fin.read(calcsize('>I')))[0]
+            header = unpack(f'{meta}s', fin.read(calcsize(f'{meta}s')))[0].decode('utf-8')
+            word_and_docs_count = json.loads(header)
+            for word in word_and_docs_count:
+                docs_count = word_and_docs_count[word]
+                doc_ids = list(
+                    unpack(f'>{docs_count}H', fin.read(calcsize(f'>{docs_count}H')))
+                )
+                doc_ids.sort()
+                inverted_index[word] = doc_ids
+    return inverted_index
+
+
+def _write_pickle(fout: BinaryIO, items: Iterable[Tuple[str, Sequence[int]]],
+                  typecode: str = 'I', analyzer: Optional[dict] = None) -> None:
+    """Pickle terms with protocol 5, counts and postings arrays are written as out-of-band buffers"""
+    terms = []
+    counts = array('I')
+    postings = array(typecode)
+    for term, doc_ids in items:
+        terms.append(term)
+        counts.append(len(doc_ids))
+        postings.fromlist(list(doc_ids))
+    if sys.byteorder != 'little':
+        counts.byteswap()
+        postings.byteswap()
+    buffers: List[pickle.PickleBuffer] = []
+    state = {"terms": terms, "typecode": typecode, "meta": {"analyzer": analyzer} if analyzer else {},
+             "counts": pickle.PickleBuffer(counts), "postings": pickle.PickleBuffer(postings)}
+    data = pickle.dumps(state, protocol=5, buffer_callback=buffers.append)
+    fout.write(PICKLE_MAGIC)
+    fout.write(pack(PICKLE_HEADER_FORMAT, len(data), *(len(buffer.raw()) for buffer in buffers)))
+    fout.write(data)
+    for buffer in buffers:
+        fout.write(buffer.raw())
+
+
+class _DataUnpickler(pickle.Unpickler):
+    """Unpickler of plain data: refuses to import any class or function"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"pickle strategy stores plain data only, but got {module}.{name}")
+
+
+def _read_pickle(buffer: memoryview) -> Tuple[List[str], Sequence[int], Sequence[int], str, dict]:
+    """Return terms, counts, postings, their typecode and meta of a pickle strategy file;
+    on little-endian hosts the arrays are views of the buffer"""
+    offset = len(PICKLE_MAGIC)
+    pickle_size, counts_size, postings_size = unpack_from(PICKLE_HEADER_FORMAT, buffer, offset)
+    offset += calcsize(PICKLE_HEADER_FORMAT)
+    counts_offset = offset + pickle_size
+    postings_offset = counts_offset + counts_size
+    buffers = [buffer[counts_offset:postings_offset], buffer[postings_offset:postings_offset + postings_size]]
+    state = _DataUnpickler(BytesIO(buffer[offset:counts_offset]), buffers=buffers).load()
+    counts = _read_array(state["counts"], 'I', 0, counts_size)
+    postings = _read_array(state["postings"], state["typecode"], 0, postings_size)
+    return state["terms"], counts, postings, state["typecode"], state["meta"]
+
+
+class _ContainerWriter:
+    """Streaming writer of the memory-mapped index container.
+
+    Sections are appended one by one, aligned to SECTION_ALIGNMENT bytes,
+    and described in a json footer written by close().
+    """
+
+    def __init__(self, fout: BinaryIO, **meta):
+        self.fout = fout
+        self.sections: Dict[str, List[int]] = {}
+        self.meta = meta
+        fout.write(MMAP_MAGIC)
+
+    def _align(self) -> None:
+        padding = -self.fout.tell() % SECTION_ALIGNMENT
+        self.fout.write(b'\0' * padding)
+
+    def begin_section(self, name: str) -> None:
+        """Start a section, everything written until end_section belongs to it"""
+        self._align()
+        self.sections[name] = [self.fout.tell(), 0]
+
+    def end_section(self, name: str) -> None:
+        """Finish the section started by begin_section"""
+        self.sections[name][1] = self.fout.tell() - self.sections[name][0]
+
+    def write_section(self, name: str, data: bytes) -> None:
+        """Write a whole section at once"""
+        self.begin_section(name)
+        self.fout.write(data)
+        self.end_section(name)
+
+    def close(self) -> None:
+        """Write the footer describing all sections"""
+        footer = dict(self.meta, version=MMAP_FORMAT_VERSION, sections=self.sections)
+        footer_offset = self.fout.tell()
+        self.fout.write(json.dumps(footer).encode('utf-8'))
+        self.fout.write(pack(FOOTER_OFFSET_FORMAT, footer_offset))
+
+
+def _write_mmap(fout: BinaryIO, items: Iterable[Tuple[str, Sequence[int]]],
+                typecode: str = 'I', codec: str = "raw",
+                frequencies: Optional[Mapping[str, Sequence[int]]] = None,
+                doc_lengths: Optional[Mapping[int, int]] = None,
+                positions: Optional[Mapping[str, bytes]] = None,
+                analyzer: Optional[dict] = None) -> None:
+    """
+    Write term and postings pairs sorted by term as a memory-mappable container:
+    postings block, term dictionary block, per-term offsets and counts.
+    Postings are stored as fixed-width little-endian arrays with "raw" codec,
+    as gap-encoded variable-byte sequences with "varbyte" codec
+    or as Roaring-style array and bitmap containers with "roaring" codec.
+    Optional term frequencies (with per-term maxima and document lengths)
+    and encoded positions blocks are stored in their own sections.
+    Varbyte postings longer than SKIP_BLOCK_SIZE are written block by block
+    and get skip table entries; the bytes are the same as without blocks.
+    """
+    if codec not in POSTINGS_CODECS:
+        raise ValueError(f"unknown postings codec {codec!r}, choose one of {list(POSTINGS_CODECS)}")
+    if (frequencies is None) != (doc_lengths is None):
+        raise ValueError("term frequencies and document lengths should be written together")
+    term_offsets = array('Q', [0])
+    postings_offsets = array('Q', [0])
+    counts = array('I')
+    terms = bytearray()
+    previous_term = None
+    encode = POSTINGS_CODECS[codec][0]
+    writer = _ContainerWriter(fout, codec=codec, typecode=typecode)
+    skips = skip_offsets = None
+    if codec == "varbyte":
+        skips = array('Q')
+        skip_offsets = array('Q', [0])
+        writer.meta["skip_block"] = SKIP_BLOCK_SIZE
+    if analyzer:
+        writer.meta["analyzer"] = analyzer
+    # optional per-term blocks are spooled aside while the postings section is streamed
+    spools = {}
+    if frequencies is not None:
+        spools["frequencies"] = (tempfile.TemporaryFile(), array('Q', [0]))
+        max_frequencies = array('I')
+    if positions is not None:
+        spools["positions"] = (tempfile.TemporaryFile(), array('Q', [0]))
+    writer.begin_section("postings")
+    postings_start = fout.tell()
+    for term, doc_ids in items:
+        if previous_term is not None and term <= previous_term:
+            raise ValueError(f"terms should be written in sorted order, got {term!r} after {previous_term!r}")
+        previous_term = term
+        if skips is not None and len(doc_ids) > SKIP_BLOCK_SIZE:
+            term_start = fout.tell()
+            base = 0
+            for start in range(0, len(doc_ids), SKIP_BLOCK_SIZE):
+                block = doc_ids[start:start + SKIP_BLOCK_SIZE]
+                fout.write(encode_varbyte(block, base=base))
+                base = block[-1]
+                skips.append(base)
+                skips.append(fout.tell() - term_start)
+        else:
+            fout.write(encode(doc_ids, typecode))
+        if skips is not None:
+            skip_offsets.append(len(skips) // 2)
+        postings_offsets.append(fout.tell() - postings_start)
+        terms += term.encode('utf-8')
+        term_offsets.append(len(terms))
+        counts.append(len(doc_ids))
+        if frequencies is not None:
+            spool, offsets = spools["frequencies"]
+            spool.write(encode_varbyte(frequencies[term], gaps=False))
+            offsets.append(spool.tell())
+            max_frequencies.append(max(frequencies[term], default=0))
+        if positions is not None:
+            spool, offsets = spools["positions"]
+            spool.write(positions[term])
+            offsets.append(spool.tell())
+    writer.end_section("postings")
+    writer.meta["terms"] = len(counts)
+    writer.write_section("terms", bytes(terms))
+    writer.write_section("term_offsets", _array_to_le_bytes(term_offsets))
+    writer.write_section("postings_offsets", _array_to_le_bytes(postings_offsets))
+    writer.write_section("counts", _array_to_le_bytes(counts))
+    if skips is not None:
+        writer.write_section("skips", _array_to_le_bytes(skips))
+        writer.write_section("skip_offsets", _array_to_le_bytes(skip_offsets))
+    for name, (spool, offsets) in spools.items():
+        with spool:
+            spool.seek(0)
+            writer.begin_section(name)
+            shutil.copyfileobj(spool, fout)
+            writer.end_section(name)
+        writer.write_section(f"{name}_offsets", _array_to_le_bytes(offsets))
+    if frequencies is not None:
+        writer.write_section("max_frequencies", _array_to_le_bytes(max_frequencies))
+        length_doc_ids = sorted(doc_lengths)
+        lengths = array('I', (doc_lengths[doc_id] for doc_id in length_doc_ids))
+        writer.write_section("length_doc_ids", _array_to_le_bytes(array('Q', length_doc_ids)))
+        writer.write_section("lengths", _array_to_le_bytes(lengths))
+        writer.meta.update(_length_statistics(lengths))
+    writer.close()
+
+
+def _length_statistics(lengths: Iterable[int]) -> Dict[str, float]:
+    """Return the number of documents with their average and minimal length"""
+    documents = total = 0
+    shortest = None
+    for length in lengths:
+        documents += 1
+        total += length
+        shortest = length if shortest is None else min(shortest, length)
+    return {
+        "documents": documents,
+        "average_length": total / documents if documents else 0.0,
+        "min_length": shortest or 0,
+    }
+
+
+def _read_footer(buffer: memoryview) -> dict:
+    """Parse the json footer of a container written by _ContainerWriter"""
+    footer_offset = unpack(FOOTER_OFFSET_FORMAT, buffer[-calcsize(FOOTER_OFFSET_FORMAT):])[0]
+    footer_end = len(buffer) - calcsize(FOOTER_OFFSET_FORMAT)
+    return json.loads(bytes(buffer[footer_offset:footer_end]).decode('utf-8'))
+
+
+def _decode_raw(data: bytes, typecode: str) -> array:
+    """Decode fixed-width little-endian doc ids"""
+    doc_ids = array(typecode)
+    doc_ids.frombytes(data)
+    if sys.byteorder != 'little':
+        doc_ids.byteswap()
+    return doc_ids
+
+
+# codec name -> (encode(doc_ids, typecode), decode(data, typecode))
+POSTINGS_CODECS = {
+    "raw": (lambda doc_ids, typecode: _array_to_le_bytes(array(typecode, doc_ids)), _decode_raw),
+    "varbyte": (lambda doc_ids, typecode: encode_varbyte(doc_ids), decode_varbyte),
+    "roaring": (_encode_roaring, _decode_roaring),
+}
+
+
+class MappedPostings(Mapping):
+    """Read-only term -> postings mapping over a memory-mapped index container.
+
+    Only the json footer is parsed on open; terms are found by binary search
+    in the sorted term dictionary and postings are decoded on access.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer)
+        self.footer = _read_footer(self._buffer)
+        self.typecode = self.footer["typecode"]
+        self._decode_postings = POSTINGS_CODECS[self.footer["codec"]][1]
+        self._size = self.footer["terms"]
+        self._terms = self._section("terms")
+        self._term_offsets = self._section_array("term_offsets", 'Q')
+        self._postings_offsets = self._section_array("postings_offsets", 'Q')
+        self._counts = self._section_array("counts", 'I')
+        self._postings = self._section("postings")
+        self._skips: Optional[Sequence[int]] = None
+        if "skips" in self.footer["sections"]:
+            self._skips = self._section_array("skips", 'Q')
+            self._skip_offsets = self._section_array("skip_offsets", 'Q')
+        self.analyzer = Analyzer.from_config(self.footer.get("analyzer"))
+        self.frequencies: Optional[_MappedFrequencies] = None
+        self.doc_lengths: Optional[_MappedDocLengths] = None
+        self.positions: Optional[_MappedPositions] = None
+        if "positions" in self.footer["sections"]:
+            self.positions = _MappedPositions(self)
+        if "frequencies" in self.footer["sections"]:
+            self.frequencies = _MappedFrequencies(self)
+            self.doc_lengths = _MappedDocLengths(
+                self._section_array("length_doc_ids", 'Q'),
+                self._section_array("lengths", 'I'),
+                {name: self.footer[name] for name in ("documents", "average_length", "min_length")},
+            )
+
+    def _section(self, name: str) -> memoryview:
+        offset, size = self.footer["sections"][name]
+        return self._buffer[offset:offset + size]
+
+    def _section_array(self, name: str, typecode: str) -> Sequence[int]:
+        offset, size = self.footer["sections"][name]
+        return _read_array(self._buffer, typecode, offset, size)
+
+    def _term_bytes(self, position: int) -> bytes:
+        return self._terms[self._term_offsets[position]:self._term_offsets[position + 1]].tobytes()
+
+    def _lower_bound(self, key: bytes) -> int:
+        """Return the position of the first term not less than the key"""
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self._term_bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find(self, term: str) -> int:
+        """Return the position of the term in the dictionary or -1"""
+        key = term.encode('utf-8')
+        position = self._lower_bound(key)
+        if position < self._size and self._term_bytes(position) == key:
+            return position
+        return -1
+
+    def terms_with_prefix(self, prefix: str) -> Iterator[str]:
+        """Yield dictionary terms starting with the prefix in sorted order"""
+        key = prefix.encode('utf-8')
+        position = self._lower_bound(key)
+        while position < self._size:
+            term = self._term_bytes(position)
+            if not term.startswith(key):
+                break
+            yield term.decode('utf-8')
+            position += 1
+
+    def _decode(self, position: int) -> Sequence[int]:
+        start = self._postings_offsets[position]
+        end = self._postings_offsets[position + 1]
+        if self._skips is not None and self._skip_offsets[position] < self._skip_offsets[position + 1]:
+            skips = self._skips[2 * self._skip_offsets[position]:2 * self._skip_offsets[position + 1]]
+            return SkipPostings(self._postings[start:end], skips, self._counts[position], self.typecode,
+                                self.footer["skip_block"])
+        return self._decode_postings(self._postings[start:end], self.typecode)
+
+    def posting_length(self, term: str) -> int:
+        """Return the number of documents containing the term without decoding them"""
+        position = self._find(term)
+        return self._counts[position] if position >= 0 else 0
+
+    def __getitem__(self, term: str) -> array:
+        position = self._find(term)
+        if position < 0:
+            raise KeyError(term)
+        return self._decode(position)
+
+    def __contains__(self, term) -> bool:
+        return isinstance(term, str) and self._find(term) >= 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        for position in range(self._size):
+            yield self._term_bytes(position).decode('utf-8')
+
+
+class CompactPostings(Mapping):
+    """Read-only term -> postings mapping in CSR layout.
+
+    Postings of all terms live in one contiguous unsigned array, the postings
+    of the i-th term are postings[offsets[i]:offsets[i + 1]]. With numpy
+    installed postings are numpy views intersected by numpy.intersect1d,
+    otherwise they are zero-copy memoryview slices of the array.
+    """
+
+    def __init__(self, index: Mapping[str, Sequence[int]]):
+        max_doc_id = max((doc_ids[-1] for doc_ids in index.values() if len(doc_ids)), default=0)
+        postings = array(_postings_typecode(max_doc_id))
+        offsets = array('Q', [0])
+        self._term_ids: Dict[str, int] = {}
+        for term_id, (term, doc_ids) in enumerate(index.items()):
+            self._term_ids[term] = term_id
+            postings.extend(iter(doc_ids))
+            offsets.append(len(postings))
+        self._offsets = offsets
+        self._array = postings
+        self._sorted_terms = sorted(self._term_ids)
+        if numpy is not None:
+            self._postings = numpy.frombuffer(postings, dtype=numpy.dtype(postings.typecode))
+        else:
+            self._postings = memoryview(postings)
+
+    def nbytes(self) -> int:
+        """Return the size of the postings and offsets buffers"""
+        return (len(self._array) * self._array.itemsize
+                + len(self._offsets) * self._offsets.itemsize)
+
+    def posting_length(self, term: str) -> int:
+        """Return the number of documents containing the term"""
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            return 0
+        return self._offsets[term_id + 1] - self._offsets[term_id]
+
+    def terms_with_prefix(self, prefix: str) -> Iterator[str]:
+        """Yield terms starting with the prefix in sorted order"""
+        return _terms_with_prefix_in_sorted(self._sorted_terms, prefix)
+
+    def __getitem__(self, term: str) -> Sequence[int]:
+        term_id = self._term_ids[term]
+        return self._postings[self._offsets[term_id]:self._offsets[term_id + 1]]
+
+    def __contains__(self, term) -> bool:
+        return term in self._term_ids
+
+    def __len__(self) -> int:
+        return len(self._term_ids)
+
+    def __iter__(self):
+        return iter(self._term_ids)
+
+
+class _MappedFrequencies(Mapping):
+    """Read-only term -> term frequencies mapping aligned with MappedPostings"""
+
+    def __init__(self, postings: MappedPostings):
+        self._postings = postings
+        self._frequencies = postings._section("frequencies")
+        self._offsets = postings._section_array("frequencies_offsets", 'Q')
+        self._max_frequencies = postings._section_array("max_frequencies", 'I')
+
+    def max_frequency(self, term: str) -> int:
+        """Return the largest frequency of the term in one document"""
+        position = self._postings._find(term)
+        return self._max_frequencies[position] if position >= 0 else 0
+
+    def __getitem__(self, term: str) -> array:
+        position = self._postings._find(term)
+        if position < 0:
+            raise KeyError(term)
+        data = self._frequencies[self._offsets[position]:self._offsets[position + 1]]
+        return decode_varbyte(data, 'I', gaps=False)
+
+    def __contains__(self, term) -> bool:
+        return term in self._postings
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def __iter__(self):
+        return iter(self._postings)
+
+
+class _MappedPositions(Mapping):
+    """Read-only term -> encoded positions block mapping aligned with MappedPostings"""
+
+    def __init__(self, postings: MappedPostings):
+        self._postings = postings
+        self._positions = postings._section("positions")
+        self._offsets = postings._section_array("positions_offsets", 'Q')
+
+    def __getitem__(self, term: str) -> memoryview:
+        position = self._postings._find(term)
+        if position < 0:
+            raise KeyError(term)
+        return self._positions[self._offsets[position]:self._offsets[position + 1]]
+
+    def __contains__(self, term) -> bool:
+        return term in self._postings
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def __iter__(self):
+        return iter(self._postings)
+
+
+class _MappedDocLengths(Mapping):
+    """Read-only doc id -> document length mapping over sorted arrays"""
+
+    def __init__(self, doc_ids: Sequence[int], lengths: Sequence[int], statistics: Dict[str, float]):
+        self._doc_ids = doc_ids
+        self._lengths = lengths
+        self.statistics = statistics
+
+    def __getitem__(self, doc_id: int) -> int:
+        position = bisect_left(self._doc_ids, doc_id)
+        if position == len(self._doc_ids) or self._doc_ids[position] != doc_id:
+            raise KeyError(doc_id)
+        return self._lengths[position]
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    def __iter__(self):
+        return iter(self._doc_ids)
+
+
+class _PostingsCursor:
+    """Position in a term's postings used by WAND to skip ahead"""
+
+    def __init__(self, doc_ids: Sequence[int], frequencies: Sequence[int], idf: float, upper_bound: float):
+        self.doc_ids = doc_ids
+        self.frequencies = frequencies
+        self.idf = idf
+        self.upper_bound = upper_bound
+        self.position = 0
+
+    @property
+    def doc_id(self) -> Optional[int]:
+        return self.doc_ids[self.position] if self.position < len(self.doc_ids) else None
+
+    def advance_to(self, doc_id: int) -> None:
+        """Move to the first posting not less than doc_id"""
+        self.position = _galloping_search(self.doc_ids, doc_id, self.position)
+
+
+# strategies writing the memory-mapped container, the only ones storing term frequencies
+CONTAINER_STRATEGIES = ("mmap", "varbyte", "roaring")
+# extras stored by the other strategies, container strategies store all of them
+STRATEGY_EXTRAS = {"struct": ("analyzer",), "pickle": ("analyzer",)}
+
+STORAGE_WRITERS = {
+    "json": _write_json,
+    "struct": _write_struct,
+    "mmap": _write_mmap,
+    "varbyte": partial(_write_mmap, codec="varbyte"),
+    "roaring": partial(_write_mmap, codec="roaring"),
+    "pickle": _write_pickle,
+}
+
+
+def write_index(filepath: str, items: Iterable[Tuple[str, Sequence[int]]],
+                strategy: str = "struct", max_doc_id: int = 0, **extras) -> None:
+    """
+    Write term and postings pairs sorted by term to the given path with the chosen strategy.
+    Extras (frequencies, doc_lengths, positions) are only stored by container strategies,
+    a non-default analyzer config by container strategies and struct.
+    """
+    if strategy not in STORAGE_WRITERS:
+        raise ValueError(f"unknown storage strategy {strategy!r}, choose one of {list(STORAGE_WRITERS)}")
+    extras = {name: value for name, value in extras.items() if value is not None}
+    if strategy not in CONTAINER_STRATEGIES:
+        unsupported = [name for name in extras if name not in STRATEGY_EXTRAS.get(strategy, ())]
+        if unsupported:
+            raise ValueError(f"{strategy} strategy does not store {', '.join(unsupported)}, "
+                             f"choose one of {list(CONTAINER_STRATEGIES)}")
+    with open(filepath, 'wb') as fout:
+        STORAGE_WRITERS[strategy](fout, items, typecode=_postings_typecode(max_doc_id), **extras)
+
+
+def _load_mmap(filepath: str) -> dict:
+    postings = MappedPostings(_map_file(filepath))
+    return dict(index=postings, frequencies=postings.frequencies, doc_lengths=postings.doc_lengths,
+                positions=postings.positions, analyzer=postings.analyzer)
+
+
+def _load_struct(filepath: str) -> dict:
+    with open(filepath, 'rb') as fin:
+        index, meta = _read_struct(fin.read())
+    return dict(index=index, analyzer=Analyzer.from_config(meta.get("analyzer")))
+
+
+def _load_pickle(filepath: str) -> dict:
+    terms, counts, postings, _, meta = _read_pickle(_map_file(filepath))
+    index = {}
+    position = 0
+    for term, count in zip(terms, counts):
+        index[term] = postings[position:position + count].tolist()
+        position += count
+    return dict(index=index, analyzer=Analyzer.from_config(meta.get("analyzer")))
+
+
+# file magic -> loader returning InvertedIndex arguments; all magics are 8 bytes long,
+# json files start with '{' and files of the first struct format have no magic
+STORAGE_LOADERS = {
+    MMAP_MAGIC: _load_mmap,
+    STRUCT_MAGIC: _load_struct,
+    STRUCT_V2_MAGIC: _load_struct,
+    PICKLE_MAGIC: _load_pickle,
+}
+
+
+def compare_storage(inverted_index: InvertedIndex, strategies: Iterable[str] = tuple(STORAGE_WRITERS)) -> List[dict]:
+    """Dump the index with every strategy into a temporary directory and return size, dump and load times"""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for strategy in strategies:
+            filepath = os.path.join(directory, f"inverted.{strategy}")
+            start = time.perf_counter()
+            try:
+                inverted_index.dump(filepath, strategy=strategy)
+            except ValueError as error:
+                print(f"skip {strategy} strategy: {error}", file=sys.stderr)
+                continue
+            dump_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            InvertedIndex.load(filepath)
+            load_ms = (time.perf_counter() - start) * 1000
+            results.append({"strategy": strategy, "bytes": os.path.getsize(filepath),
+                            "dump_ms": dump_ms, "load_ms": load_ms})
+    return results
+
+
+class QueryCache:
+    """LRU cache of query results keyed by the normalized set of query terms.
+
+    Both the number of cached queries and the total number of cached
+    doc ids are bounded; the cache is cleared as soon as the generation
+    of the index it serves changes. InvertedIndex methods never change a
+    plain index, code changing its postings in place must increase its
+    generation, as SegmentedInvertedIndex does on every commit.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_postings: int = 1_000_000):
+        self.max_entries = max_entries
+        self.max_postings = max_postings
+        self.hits = 0
+        self.misses = 0
+        self.generation = None
+        self._results: OrderedDict = OrderedDict()
+        self._postings = 0
+
+    @staticmethod
+    def key(terms: Iterable[str]) -> frozenset:
+        """Normalize query terms: conjunctive queries ignore order and repeats"""
+        return frozenset(terms)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._postings = 0
+
+    def get(self, key: frozenset, generation: int) -> Optional[List[int]]:
+        """Return the cached result or None, counting hits and misses"""
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._results.move_to_end(key)
+        return list(result)
+
+    def put(self, key: frozenset, result: List[int]) -> None:
+        """Store the result evicting least recently used ones above the bounds"""
+        replaced = self._results.pop(key, None)
+        if replaced is not None:
+            self._postings -= len(replaced)
+        if len(result) > self.max_postings or self.max_entries <= 0:
+            return
+        self._results[key] = list(result)
+        self._postings += len(result)
+        while len(self._results) > self.max_entries or self._postings > self.max_postings:
+            _, evicted = self._results.popitem(last=False)
+            self._postings -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def stats(self) -> str:
+        """Human readable hit and miss counters"""
+        total = self.hits + self.misses
+        hit_rate = 100 * self.hits / total if total else 0.0
+        return f"query cache: {self.hits} hits, {self.misses} misses, hit rate {hit_rate:.1f}%"
+
+
 class InvertedIndex:
     """one-liner description
 
@@ -64,126 +1622,1888 @@ class InvertedIndex:
     - by default $index is None;
     - in this method $index = {}.
 
-    $index - is an "inverted index" instance which is a dictionary with int keys and str values
+    $index - is an "inverted index" instance which is a dictionary with int keys and str values;
+    posting lists (the values) are expected to be sorted by document id.
+    """
+
+    def __init__(self, index: Mapping[str, Sequence[int]] = None,
+                 frequencies: Mapping[str, Sequence[int]] = None,
+                 doc_lengths: Mapping[int, int] = None,
+                 positions: Mapping[str, bytes] = None,
+                 analyzer: Analyzer = None):
+        if index is not None:
+            self.index = index
+        else:
+            self.index = dict()
+        # optional data for ranked retrieval: term frequencies aligned with
+        # the postings and the number of terms of every document
+        self.frequencies = frequencies
+        self.doc_lengths = doc_lengths
+        # optional encode_positions blocks aligned with the postings for phrase queries
+        self.positions = positions
+        # turns documents and query words into terms, build and query should use the same
+        self.analyzer = analyzer if analyzer is not None else DEFAULT_ANALYZER
+        self._length_statistics: Optional[Tuple[int, Dict[str, float]]] = None
+        # bumped on every change of the index, invalidates cached results;
+        # methods never change a plain index, whoever changes it in place bumps it
+        self.generation = 0
+        self.cache: Optional[QueryCache] = None
+        # block holding the postings of an index opened by InvertedIndex.attach
+        self.shared_memory: Optional[shared_memory.SharedMemory] = None
+        self._sorted_terms: Optional[List[str]] = None
+        self._sorted_terms_version = None
+
+    def terms_with_prefix(self, prefix: str) -> Iterator[str]:
+        """
+        Yield indexed terms starting with the prefix in sorted order.
+        Plain dicts get a sorted term list built on first use and rebuilt after changes.
+        """
+        if hasattr(self.index, "terms_with_prefix"):
+            return self.index.terms_with_prefix(prefix)
+        version = (self.generation, len(self.index))
+        if self._sorted_terms is None or self._sorted_terms_version != version:
+            self._sorted_terms = sorted(self.index)
+            self._sorted_terms_version = version
+        return _terms_with_prefix_in_sorted(self._sorted_terms, prefix)
+
+    def expand_term(self, pattern: str) -> List[str]:
+        """Return indexed terms matching a wildcard pattern like pyth*"""
+        return expand_pattern(self.terms_with_prefix, pattern)
+
+    def _term_postings(self, term: str) -> Optional[Sequence[int]]:
+        """Return postings of the term or the union for a wildcard pattern, None if nothing matches"""
+        return _lookup(self.index, term, self.terms_with_prefix)
+
+    def _query_terms(self, words: List[str]) -> List[str]:
+        """Check the query, analyze its words and drop repeated terms"""
+        assert isinstance(words, list), (
+            "query should be provided with a list of words, but user provided: "
+            f"{repr(words)}"
+        )
+        return list(dict.fromkeys(self.analyzer.query_terms(words)))
+
+    def query(self, words: List[str]) -> List[int]:
+        """Return the list of relevant documents for the given query"""
+        terms = self._query_terms(words)
+        if self.cache is None:
+            return self._execute_query(terms)
+        key = self.cache.key(terms)
+        result = self.cache.get(key, self.generation)
+        if result is None:
+            result = self._execute_query(terms)
+            self.cache.put(key, result)
+        return result
+
+    def query_many(self, queries: List[List[str]]) -> List[List[int]]:
+        """
+        Return the lists of relevant documents for a batch of queries.
+        Postings of every distinct term are fetched once; terms of each query are
+        ordered by posting length and intersections of shared prefixes are reused.
+        """
+        return self._execute_many([self._query_terms(words) for words in queries])
+
+    def _execute_many(self, term_lists: List[List[str]]) -> List[List[int]]:
+        """Answer a batch of analyzed queries sharing postings and intersections of common prefixes"""
+        postings: Dict[str, Optional[Sequence[int]]] = {}
+        for terms in term_lists:
+            for term in terms:
+                if term not in postings:
+                    postings[term] = self._term_postings(term)
+
+        def plan_order(term: str) -> Tuple[int, str]:
+            # missing terms come first and empty the result right away
+            return (len(postings[term]) if postings[term] is not None else -1), term
+
+        prefixes: Dict[Tuple[str, ...], Sequence[int]] = {}
+        results: Dict[frozenset, Sequence[int]] = {}
+        answers = []
+        for terms in term_lists:
+            key = frozenset(terms)
+            if key not in results:
+                result: Sequence[int] = []
+                plan = tuple(sorted(key, key=plan_order))
+                for size in range(1, len(plan) + 1):
+                    prefix = plan[:size]
+                    if prefix in prefixes:
+                        result = prefixes[prefix]
+                    elif postings[prefix[-1]] is None:
+                        result = prefixes[prefix] = []
+                    elif size == 1:
+                        result = prefixes[prefix] = postings[prefix[-1]]
+                    else:
+                        result = prefixes[prefix] = intersect_postings([result, postings[prefix[-1]]])
+                    if not result:
+                        break
+                results[key] = result
+            answers.append(list(results[key]))
+        return answers
+
+    def _ranking_statistics(self) -> Dict[str, float]:
+        """Return the number of documents with their average and minimal length"""
+        if hasattr(self.doc_lengths, "statistics"):
+            return self.doc_lengths.statistics
+        if self._length_statistics is None or self._length_statistics[0] != self.generation:
+            self._length_statistics = (self.generation, _length_statistics(self.doc_lengths.values()))
+        return self._length_statistics[1]
+
+    def query_top_k(self, words: List[str], k: int = DEFAULT_TOP_K,
+                    k1: float = BM25_K1, b: float = BM25_B) -> List[Tuple[int, float]]:
+        """
+        Return up to k (doc id, BM25 score) pairs of documents containing any query word,
+        best first. WAND dynamic pruning skips documents whose score upper bound,
+        built from per-term maximal frequencies, cannot beat the current k-th score.
+        """
+        if self.frequencies is None or self.doc_lengths is None:
+            raise ValueError("ranked retrieval needs an index built with term frequencies")
+        statistics = self._ranking_statistics()
+        documents = statistics["documents"]
+        average_length = statistics["average_length"] or 1.0
+        shortest_norm = k1 * (1 - b + b * statistics["min_length"] / average_length)
+        cursors = []
+        for term in self._query_terms(words):
+            if term not in self.index:
+                continue
+            doc_ids = self.index[term]
+            idf = math.log(1 + (documents - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            if hasattr(self.frequencies, "max_frequency"):
+                max_frequency = self.frequencies.max_frequency(term)
+                frequencies = self.frequencies[term]
+            else:
+                frequencies = self.frequencies[term]
+                max_frequency = max(frequencies, default=0)
+            upper_bound = idf * max_frequency * (k1 + 1) / (max_frequency + shortest_norm)
+            cursors.append(_PostingsCursor(doc_ids, frequencies, idf, upper_bound))
+
+        top: List[Tuple[float, int]] = []
+        threshold = 0.0
+        cursors = [cursor for cursor in cursors if cursor.doc_id is not None]
+        while cursors and k > 0:
+            cursors.sort(key=lambda cursor: cursor.doc_id)
+            bound = 0.0
+            pivot = None
+            for position, cursor in enumerate(cursors):
+                bound += cursor.upper_bound
+                if bound > threshold or len(top) < k:
+                    pivot = position
+                    break
+            if pivot is None:
+                break
+            pivot_doc_id = cursors[pivot].doc_id
+            if cursors[0].doc_id == pivot_doc_id:
+                norm = k1 * (1 - b + b * self.doc_lengths[pivot_doc_id] / average_length)
+                score = 0.0
+                for cursor in cursors:
+                    if cursor.doc_id != pivot_doc_id:
+                        break
+                    frequency = cursor.frequencies[cursor.position]
+                    score += cursor.idf * frequency * (k1 + 1) / (frequency + norm)
+                    cursor.position += 1
+                if len(top) < k:
+                    heapq.heappush(top, (score, -pivot_doc_id))
+                elif score > threshold:
+                    heapq.heapreplace(top, (score, -pivot_doc_id))
+                if len(top) == k:
+                    threshold = top[0][0]
+            else:
+                for cursor in cursors[:pivot]:
+                    cursor.advance_to(pivot_doc_id)
+            cursors = [cursor for cursor in cursors if cursor.doc_id is not None]
+        return [(-negative_doc_id, score) for score, negative_doc_id in sorted(top, reverse=True)]
+
+    def _candidate_positions(self, terms: List[str]) -> Iterator[Tuple[int, List[array]]]:
+        """Yield documents containing all terms with the positions of every term, decoded only for them"""
+        if self.positions is None:
+            raise ValueError("index has no token positions, build it with positions")
+        postings = []
+        for term in terms:
+            if WILDCARD in term:
+                raise ValueError(f"wildcard patterns are not supported in phrases: {term!r}")
+            doc_ids = self.index.get(term)
+            if doc_ids is None:
+                return
+            postings.append(doc_ids)
+        blocks = [PositionsBlock(self.positions[term]) for term in terms]
+        cursors = [0] * len(terms)
+        for doc_id in intersect_postings(postings):
+            term_positions = []
+            for i, doc_ids in enumerate(postings):
+                cursors[i] = _galloping_search(doc_ids, doc_id, cursors[i])
+                term_positions.append(blocks[i].positions(cursors[i]))
+            yield doc_id, term_positions
+
+    def query_phrase(self, words: List[str], slop: int = 0) -> List[int]:
+        """
+        Return documents where the words occur in the given order
+        with at most slop other tokens between neighbouring words.
+        Words dropped by the analyzer (e.g. stop words) keep their places in the phrase.
+        """
+        assert isinstance(words, list), (
+            "query should be provided with a list of words, but user provided: "
+            f"{repr(words)}"
+        )
+        for word in words:
+            if WILDCARD in word:
+                raise ValueError(f"wildcard patterns are not supported in phrases: {word!r}")
+        phrase = list(self.analyzer.positions(" ".join(words)))
+        if not phrase:
+            return []
+        terms = list(dict.fromkeys(term for _, term in phrase))
+        slots = [terms.index(term) for _, term in phrase]
+        gaps = [position - previous for (previous, _), (position, _) in zip(phrase, phrase[1:])]
+        result = []
+        for doc_id, term_positions in self._candidate_positions(terms):
+            reachable = term_positions[slots[0]]
+            for slot, gap in zip(slots[1:], gaps):
+                reachable = [
+                    position for position in term_positions[slot]
+                    if bisect_left(reachable, position - gap - slop) < bisect_right(reachable, position - gap)
+                ]
+                if not reachable:
+                    break
+            if reachable:
+                result.append(doc_id)
+        return result
+
+    def query_near(self, words: List[str], distance: int) -> List[int]:
+        """Return documents where all words occur in any order within a window of distance tokens"""
+        terms = self._query_terms(words)
+        if not terms:
+            return []
+        result = []
+        for doc_id, term_positions in self._candidate_positions(terms):
+            # smallest window holding one position of every term, advancing the leftmost list
+            heap = [(positions[0], i, 0) for i, positions in enumerate(term_positions) if positions]
+            if len(heap) < len(terms):
+                continue
+            heapq.heapify(heap)
+            rightmost = max(position for position, _, _ in heap)
+            while rightmost - heap[0][0] > distance:
+                _, i, index = heapq.heappop(heap)
+                if index + 1 == len(term_positions[i]):
+                    break
+                position = term_positions[i][index + 1]
+                rightmost = max(rightmost, position)
+                heapq.heappush(heap, (position, i, index + 1))
+            else:
+                result.append(doc_id)
+        return result
+
+    def _posting_length(self, term: str) -> int:
+        """Return the number of documents of the term or of all terms matching a wildcard pattern"""
+        if WILDCARD in term:
+            return sum(self._posting_length(expanded) for expanded in self.expand_term(term))
+        if hasattr(self.index, "posting_length"):
+            return self.index.posting_length(term)
+        return len(self.index.get(term, ()))
+
+    def plan_boolean(self, node: QueryNode) -> Optional[QueryNode]:
+        """
+        Return the query tree with analyzed terms, estimated costs (result size upper bounds)
+        and AND operands ordered cheapest first, negated operands last.
+        A double negation is folded into its operand.
+        Terms dropped by the analyzer are removed with operators left without operands,
+        None is returned when nothing is left.
+        """
+        if node.op == "TERM":
+            terms = self.analyzer.query_terms([node.term])
+            if not terms:
+                return None
+            return node._replace(term=terms[0], cost=self._posting_length(terms[0]))
+        children = [child for child in map(self.plan_boolean, node.children) if child is not None]
+        if not children:
+            return None
+        if node.op == "NOT":
+            if children[0].op == "NOT":
+                return children[0].children[0]
+            return node._replace(children=tuple(children), cost=children[0].cost)
+        positive = sorted((child for child in children if child.op != "NOT"), key=lambda child: child.cost)
+        negative = sorted((child for child in children if child.op == "NOT"), key=lambda child: child.cost)
+        if node.op == "OR":
+            if negative:
+                raise ValueError("NOT can only restrict an AND operand, not an OR alternative")
+            return node._replace(children=tuple(positive), cost=sum(child.cost for child in positive))
+        if not positive:
+            raise ValueError("AND needs at least one operand without NOT")
+        return node._replace(children=tuple(positive + negative), cost=positive[0].cost)
+
+    def _execute_plan(self, node: QueryNode) -> Sequence[int]:
+        """Evaluate a planned query tree, stopping an AND as soon as its running result is empty"""
+        if node.op == "TERM":
+            if node.cost == 0:
+                return []
+            postings = self._term_postings(node.term)
+            return postings if postings is not None else []
+        if node.op == "OR":
+            results = [self._execute_plan(child) for child in node.children]
+            return union_postings([postings for postings in results if len(postings)])
+        result = None
+        for child in node.children:
+            if result is not None and not len(result):
+                break
+            if child.op == "NOT":
+                # the negated operand only removes documents from the running result
+                result = difference_postings(result, self._execute_plan(child.children[0]))
+            elif result is None:
+                result = self._execute_plan(child)
+            else:
+                result = intersect_postings([result, self._execute_plan(child)])
+        return result
+
+    def query_boolean(self, expression) -> List[int]:
+        """Return documents matching a boolean query string (or a parsed QueryNode) with AND, OR, NOT"""
+        node = parse_boolean_query(expression) if isinstance(expression, str) else expression
+        plan = self.plan_boolean(node)
+        if (plan if plan is not None else node).op == "NOT":
+            raise ValueError("boolean query needs at least one operand without NOT")
+        return list(self._execute_plan(plan)) if plan is not None else []
+
+    def _execute_query(self, terms: List[str]) -> List[int]:
+        """Intersect postings of distinct query terms, wildcard patterns match the union of their terms"""
+        docs_list = []
+        for term in terms:
+            postings = self._term_postings(term)
+            if postings is None:
+                return []
+            docs_list.append(postings)
+        return intersect_postings(docs_list)
+
+    def dump(self, filepath: str, strategy: str = "struct") -> None:
+        """Dumps the inverted index dict to the given path with the chosen strategy"""
+        max_doc_id = max((doc_ids[-1] for doc_ids in self.index.values() if len(doc_ids)), default=0)
+        write_index(filepath, sorted(self.index.items()), strategy=strategy, max_doc_id=max_doc_id,
+                    analyzer=None if self.analyzer.is_default else self.analyzer.config,
+                    frequencies=self.frequencies, doc_lengths=self.doc_lengths, positions=self.positions)
+
+    @classmethod
+    def load(cls, filepath: str) -> InvertedIndex:
+        """
+        Loads the inverted index dict by the given path.
+        The storage strategy is detected from the magic of the file by STORAGE_LOADERS;
+        memory-mapped indexes decode postings lazily on query,
+        files without a magic are json or the first struct format,
+        a directory is opened as a SegmentedInvertedIndex.
+        """
+        print(f"load inverted index from filepath {filepath}", file=sys.stderr)
+
+        if os.path.isdir(filepath):
+            if os.path.exists(os.path.join(filepath, SHARDS_MANIFEST)):
+                return ShardedInvertedIndex(filepath)
+            return SegmentedInvertedIndex(filepath)
+        with open(filepath, 'rb') as fin:
+            signature = fin.read(len(MMAP_MAGIC))
+        if signature in STORAGE_LOADERS:
+            return cls(**STORAGE_LOADERS[signature](filepath))
+        if signature.startswith(b'{'):
+            with open(filepath, 'r', encoding='utf8') as fin:
+                return cls(index=json.load(fin))
+
+        inverted = InvertedIndex()
+        inverted.index = _read_struct_v1(filepath)
+        return inverted
+
+    def share(self, name: Optional[str] = None) -> shared_memory.SharedMemory:
+        """
+        Copy the index into a shared memory block as a raw mmap container and return the block.
+        Other processes attach to it by name without copying postings; the caller owns
+        the block and should close and unlink it when the workers are done.
+        """
+        max_doc_id = max((doc_ids[-1] for doc_ids in self.index.values() if len(doc_ids)), default=0)
+        with tempfile.TemporaryFile() as spool:
+            _write_mmap(spool, sorted(self.index.items()), typecode=_postings_typecode(max_doc_id),
+                        frequencies=self.frequencies, doc_lengths=self.doc_lengths, positions=self.positions,
+                        analyzer=None if self.analyzer.is_default else self.analyzer.config)
+            size = spool.tell()
+            header_size = calcsize(SHARED_SIZE_FORMAT)
+            memory = shared_memory.SharedMemory(name=name, create=True, size=header_size + size)
+            memory.buf[:header_size] = pack(SHARED_SIZE_FORMAT, size)
+            spool.seek(0)
+            spool.readinto(memory.buf[header_size:header_size + size])
+        return memory
+
+    @classmethod
+    def attach(cls, name: str) -> InvertedIndex:
+        """
+        Open an index shared by InvertedIndex.share, e.g. in every web server worker.
+        Postings stay in the shared block, so memory does not grow with the number of workers.
+        """
+        print(f"attach inverted index from shared memory {name}", file=sys.stderr)
+        memory = _attach_shared_memory(name)
+        header_size = calcsize(SHARED_SIZE_FORMAT)
+        size = unpack(SHARED_SIZE_FORMAT, memory.buf[:header_size])[0]
+        postings = MappedPostings(memory.buf[header_size:header_size + size])
+        inverted = cls(index=postings, frequencies=postings.frequencies, doc_lengths=postings.doc_lengths,
+                       positions=postings.positions, analyzer=postings.analyzer)
+        inverted.shared_memory = memory
+        return inverted
+
+    def hybrid(self) -> InvertedIndex:
+        """Return a copy of the index where postings with dense chunks become HybridPostings"""
+        index = {}
+        for term, doc_ids in self.index.items():
+            if len(doc_ids) > ARRAY_CONTAINER_LIMIT:
+                postings = HybridPostings.from_sorted(doc_ids)
+                if postings.has_bitmaps:
+                    doc_ids = postings
+            index[term] = doc_ids
+        return InvertedIndex(index=index, frequencies=self.frequencies, doc_lengths=self.doc_lengths,
+                             positions=self.positions, analyzer=self.analyzer)
+
+    def compact(self) -> InvertedIndex:
+        """Return a copy of the index with postings packed into a CSR layout"""
+        return InvertedIndex(index=CompactPostings(self.index),
+                             frequencies=self.frequencies, doc_lengths=self.doc_lengths,
+                             positions=self.positions, analyzer=self.analyzer)
+
+    def __eq__(self, other):
+        if not isinstance(other, InvertedIndex):
+            return NotImplemented
+        outcome = (
+            len(self.index) == len(other.index)
+            and all(
+                term in other.index and list(other.index[term]) == list(doc_ids)
+                for term, doc_ids in self.index.items()
+            )
+        )
+        return outcome
+
+
+def load_documents(filepath: str) -> Dict[int, str]:
+    """
+    Loads the documents dataset by the given path.
+    Return the dict with articles' ids as keys and articles' contents as values.
+    """
+    print(f"loading documents from path {filepath} to build inverted index...", file=sys.stderr)
+    with open(filepath, 'r', encoding='utf8') as dataset:
+        lines = dataset.readlines()
+    documents: Dict[int, str] = {}
+    for line in lines:
+        doc_id, content = _parse_document(line)
+        documents[doc_id] = content
+    return documents
+
+
+def _parse_document(line: str) -> Tuple[int, str]:
+    """Split a dataset line into the article id and its lower-cased content"""
+    content: str
+    doc_id, content = line.lower().split("\t", 1)
+    return int(doc_id), content.strip()
+
+
+def write_document_store(dataset_filepath: str, store_filepath: str, compress: bool = False) -> int:
+    """
+    Write the document store of the dataset in one pass without loading it.
+    The store keeps the start and length of every document text (the line
+    after its id) in the dataset, or with compress in zlib compressed
+    blocks of whole documents inside the store. Return the number of documents.
+    """
+    # doc id -> (block number, start, length), later lines replace earlier ones like in load_documents
+    entries: Dict[int, Tuple[int, int, int]] = {}
+    store_directory = os.path.dirname(os.path.abspath(store_filepath))
+    with open(dataset_filepath, 'rb') as dataset, open(store_filepath, 'wb') as fout:
+        writer = _ContainerWriter(
+            fout, kind="documents", compression="zlib" if compress else None,
+            dataset=None if compress else os.path.relpath(os.path.abspath(dataset_filepath), store_directory),
+            dataset_size=os.path.getsize(dataset_filepath),
+        )
+        block = bytearray()
+        block_offsets = array('Q', [0])
+        if compress:
+            writer.begin_section("blocks")
+        offset = 0
+        for line in dataset:
+            doc_id, _, text = line.rstrip(b'\r\n').partition(b'\t')
+            start = offset + len(doc_id) + 1
+            offset += len(line)
+            if compress:
+                entries[int(doc_id)] = (len(block_offsets) - 1, len(block), len(text))
+                block += text
+                if len(block) >= DOCUMENT_STORE_BLOCK_SIZE:
+                    fout.write(zlib.compress(block))
+                    block_offsets.append(fout.tell() - writer.sections["blocks"][0])
+                    block.clear()
+            else:
+                entries[int(doc_id)] = (0, start, len(text))
+        if compress:
+            if block:
+                fout.write(zlib.compress(block))
+                block_offsets.append(fout.tell() - writer.sections["blocks"][0])
+            writer.end_section("blocks")
+            writer.write_section("block_offsets", _array_to_le_bytes(block_offsets))
+        doc_ids = sorted(entries)
+        max_doc_id = doc_ids[-1] if doc_ids else 0
+        if max_doc_id >= DOCUMENT_STORE_DENSITY * len(doc_ids):
+            slots: Iterable[int] = doc_ids
+            writer.write_section("doc_ids", _array_to_le_bytes(array('Q', doc_ids)))
+        else:
+            slots = range(max_doc_id + 1 if doc_ids else 0)
+        missing = (0, MISSING_DOCUMENT, 0)
+        writer.write_section("starts", _array_to_le_bytes(array('Q', (entries.get(slot, missing)[1] for slot in slots))))
+        writer.write_section("lengths", _array_to_le_bytes(array('I', (entries.get(slot, missing)[2] for slot in slots))))
+        if compress:
+            writer.write_section("block_numbers", _array_to_le_bytes(
+                array('I', (entries.get(slot, missing)[0] for slot in slots))))
+        writer.meta["documents"] = len(doc_ids)
+        writer.close()
+    print(f"wrote document store of {len(doc_ids)} documents to {store_filepath}", file=sys.stderr)
+    return len(doc_ids)
+
+
+class DocumentStore(Mapping):
+    """Read-only doc id -> document text mapping over a memory-mapped document store.
+
+    A document is found by its doc id in a dense table, or by binary search
+    in sorted doc ids for sparse ones, and sliced from the mapped dataset
+    or from its decompressed block; recently decompressed blocks are cached.
+    """
+
+    def __init__(self, filepath: str):
+        self._buffer = _map_file(filepath)
+        self.footer = _read_footer(self._buffer)
+        if self.footer.get("kind") != "documents":
+            raise ValueError(f"{filepath} is not a document store")
+        sections = self.footer["sections"]
+        self._starts = self._section_array("starts", 'Q')
+        self._lengths = self._section_array("lengths", 'I')
+        self._doc_ids = self._section_array("doc_ids", 'Q') if "doc_ids" in sections else None
+        if self.footer["compression"]:
+            offset, size = sections["blocks"]
+            self._data = self._buffer[offset:offset + size]
+            self._block_offsets = self._section_array("block_offsets", 'Q')
+            self._block_numbers = self._section_array("block_numbers", 'I')
+            self._block = lru_cache(maxsize=DOCUMENT_STORE_CACHED_BLOCKS)(self._decompress_block)
+        else:
+            dataset_filepath = os.path.join(os.path.dirname(os.path.abspath(filepath)), self.footer["dataset"])
+            self._data = _map_file(dataset_filepath)
+            if len(self._data) != self.footer["dataset_size"]:
+                raise ValueError(f"dataset {dataset_filepath} changed after its document store was written")
+
+    def _section_array(self, name: str, typecode: str) -> Sequence[int]:
+        offset, size = self.footer["sections"][name]
+        return _read_array(self._buffer, typecode, offset, size)
+
+    def _decompress_block(self, number: int) -> bytes:
+        return zlib.decompress(self._data[self._block_offsets[number]:self._block_offsets[number + 1]])
+
+    def _slot(self, doc_id: int) -> int:
+        """Return the table position of the doc id or -1"""
+        if self._doc_ids is not None:
+            slot = bisect_left(self._doc_ids, doc_id)
+            return slot if slot < len(self._doc_ids) and self._doc_ids[slot] == doc_id else -1
+        if 0 <= doc_id < len(self._starts) and self._starts[doc_id] != MISSING_DOCUMENT:
+            return doc_id
+        return -1
+
+    def __getitem__(self, doc_id: int) -> str:
+        slot = self._slot(doc_id)
+        if slot < 0:
+            raise KeyError(doc_id)
+        start, length = self._starts[slot], self._lengths[slot]
+        data = self._block(self._block_numbers[slot]) if self.footer["compression"] else self._data
+        return bytes(data[start:start + length]).decode('utf-8')
+
+    def __iter__(self) -> Iterator[int]:
+        if self._doc_ids is not None:
+            return iter(self._doc_ids)
+        return (doc_id for doc_id, start in enumerate(self._starts) if start != MISSING_DOCUMENT)
+
+    def __len__(self) -> int:
+        return self.footer["documents"]
+
+    def snippet(self, doc_id: int, words: List[str], analyzer: Analyzer = DEFAULT_ANALYZER,
+                length: int = SNIPPET_WORDS) -> str:
+        """Return about length words of the document around its first word matching the query"""
+        text = self[doc_id]
+        patterns = analyzer.query_terms(word for word in words if word not in BOOLEAN_OPERATORS)
+        tokens = list(ANALYZER_TOKEN_PATTERN.finditer(text))
+        first = next((
+            number for number, token in enumerate(tokens)
+            if any(fnmatchcase(term, pattern) for term in analyzer.terms(token.group()) for pattern in patterns)
+        ), 0)
+        start = max(min(first - length // 2, len(tokens) - length), 0)
+        window = tokens[start:start + length]
+        if not window:
+            return ""
+        snippet = " ".join(text[window[0].start():window[-1].end()].split())
+        return ("..." if start > 0 else "") + snippet + ("..." if start + length < len(tokens) else "")
+
+
+def _add_document(index: Dict[str, List[int]], doc_id: int, content: str,
+                  frequencies: Dict[str, List[int]] = None, doc_lengths: Dict[int, int] = None,
+                  positions: Dict[str, List[List[int]]] = None,
+                  analyzer: Analyzer = DEFAULT_ANALYZER) -> int:
+    """
+    Append the doc id to the postings of every distinct term the analyzer finds in the content,
+    optionally recording term frequencies, the document length and token positions.
+    Return the number of postings added.
+    """
+    if positions is None:
+        terms = analyzer.terms(content)
+    else:
+        term_positions: Dict[str, List[int]] = {}
+        terms = []
+        for position, term in analyzer.positions(content):
+            term_positions.setdefault(term, []).append(position)
+            terms.append(term)
+    if frequencies is None:
+        filtered_terms = list(dict.fromkeys(terms))
+    else:
+        term_counts = Counter(terms)
+        filtered_terms = list(term_counts)
+    for term in filtered_terms:
+        if term not in index:
+            index[term] = [doc_id]
+            if frequencies is not None:
+                frequencies[term] = [term_counts[term]]
+            if positions is not None:
+                positions[term] = [term_positions[term]]
+        else:
+            index[term].append(doc_id)
+            if frequencies is not None:
+                frequencies[term].append(term_counts[term])
+            if positions is not None:
+                positions[term].append(term_positions[term])
+    if doc_lengths is not None:
+        doc_lengths[doc_id] = len(terms)
+    return len(filtered_terms)
+
+
+def _remove_document(index: Dict[str, List[int]], doc_id: int) -> None:
+    """Drop the doc id from unsorted postings, terms left without documents are removed"""
+    for term in [term for term, doc_ids in index.items() if doc_id in doc_ids]:
+        index[term].remove(doc_id)
+        if not index[term]:
+            del index[term]
+
+
+def _sort_postings(index: Dict[str, List[int]], *aligned: Optional[Dict[str, list]]) -> None:
+    """Sort postings by doc id keeping aligned per-posting data (frequencies, positions) in step"""
+    aligned = [values for values in aligned if values is not None]
+    for term, doc_ids in index.items():
+        if not aligned:
+            doc_ids.sort()
+        elif any(previous > doc_id for previous, doc_id in zip(doc_ids, doc_ids[1:])):
+            order = sorted(range(len(doc_ids)), key=doc_ids.__getitem__)
+            index[term] = [doc_ids[i] for i in order]
+            for values in aligned:
+                values[term] = [values[term][i] for i in order]
+
+
+def build_inverted_index(documents: Dict[int, str], frequencies: bool = False,
+                         positions: bool = False, analyzer: Analyzer = None) -> InvertedIndex:
+    """
+    Build the InvertedIndex object by the given dict of documents.
+    With frequencies term frequencies and document lengths are kept for ranked queries,
+    with positions token positions are kept for phrase and proximity queries.
+    The analyzer (the default one if omitted) turns contents into terms and is kept for queries.
+    Return the InvertedIndex object.
+    """
+    print("building inverted index for provided documents", file=sys.stderr)
+    inverted = InvertedIndex(analyzer=analyzer)
+    if frequencies:
+        inverted.frequencies = {}
+        inverted.doc_lengths = {}
+    term_positions: Optional[Dict[str, List[List[int]]]] = {} if positions else None
+    doc_id: int
+    for doc_id, content in documents.items():
+        _add_document(inverted.index, doc_id, content, inverted.frequencies, inverted.doc_lengths,
+                      term_positions, inverted.analyzer)
+    _sort_postings(inverted.index, inverted.frequencies, term_positions)
+    if positions:
+        inverted.positions = {term: encode_positions(positions_lists)
+                              for term, positions_lists in term_positions.items()}
+    return inverted
+
+
+def _split_byte_ranges(filepath: str, parts: int) -> List[Tuple[int, int]]:
+    """Split the file into at most `parts` byte ranges aligned to line starts"""
+    size = os.path.getsize(filepath)
+    boundaries = [0]
+    with open(filepath, 'rb') as fin:
+        for part in range(1, parts):
+            position = max(size * part // parts, boundaries[-1])
+            fin.seek(position)
+            if position:
+                fin.readline()
+            boundaries.append(min(fin.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def _build_partial_index(filepath: str, start: int, end: int,
+                         analyzer_config: Optional[dict] = None) -> Tuple[Dict[str, List[int]], Set[int]]:
+    """
+    Build sorted postings for the dataset lines starting inside [start, end),
+    a repeated doc id replaces its earlier line. Return postings and the indexed doc ids.
+    """
+    analyzer = Analyzer.from_config(analyzer_config)
+    index: Dict[str, List[int]] = {}
+    doc_ids_seen: Set[int] = set()
+    with open(filepath, 'rb') as fin:
+        fin.seek(start)
+        while fin.tell() < end:
+            line = fin.readline()
+            if not line:
+                break
+            doc_id, content = _parse_document(line.decode('utf8'))
+            if doc_id in doc_ids_seen:
+                _remove_document(index, doc_id)
+            doc_ids_seen.add(doc_id)
+            _add_document(index, doc_id, content, analyzer=analyzer)
+    for doc_ids in index.values():
+        doc_ids.sort()
+    return index, doc_ids_seen
+
+
+def build_inverted_index_parallel(dataset_filepath: str, workers: int,
+                                  analyzer: Analyzer = None) -> InvertedIndex:
+    """
+    Build the InvertedIndex object from the dataset with a pool of processes:
+    every worker indexes its own byte range, partial postings are merged in sorted order.
+    The result is the same as build_inverted_index(load_documents(dataset_filepath)):
+    a doc id repeated in the dataset keeps only its last line.
+    """
+    print(f"building inverted index for {dataset_filepath} with {workers} workers", file=sys.stderr)
+    analyzer = analyzer if analyzer is not None else DEFAULT_ANALYZER
+    ranges = _split_byte_ranges(dataset_filepath, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partial_indexes = list(executor.map(
+            _build_partial_index,
+            [dataset_filepath] * len(ranges),
+            *zip(*ranges),
+            [analyzer.config] * len(ranges),
+        ))
+    merged: Dict[str, List[List[int]]] = {}
+    replaced: Set[int] = set()
+    # later ranges replace documents of earlier ones, so ranges are visited from the end
+    for partial_index, doc_ids_seen in reversed(partial_indexes):
+        stale = doc_ids_seen & replaced
+        replaced |= doc_ids_seen
+        for term, doc_ids in partial_index.items():
+            if stale:
+                doc_ids = [doc_id for doc_id in doc_ids if doc_id not in stale]
+                if not doc_ids:
+                    continue
+            merged.setdefault(term, []).append(doc_ids)
+    index = {
+        term: postings[0] if len(postings) == 1 else list(heapq.merge(*postings))
+        for term, postings in merged.items()
+    }
+    return InvertedIndex(index, analyzer=analyzer)
+
+
+def parse_memory_size(value: str) -> int:
+    """Parse a memory budget like 512M or 2G into bytes"""
+    match = re.fullmatch(r"\s*(\d+)\s*([KMG]?)B?\s*", value.upper())
+    if not match:
+        raise ArgumentTypeError(f"invalid memory size {value!r}, expected e.g. 512M or 2G")
+    return int(match.group(1)) * MEMORY_UNITS[match.group(2)]
+
+
+def _write_run(filepath: str, index: Dict[str, List[int]], doc_ids_indexed: Iterable[int]) -> None:
+    """Write a sorted block of the streaming build and the doc ids it indexed as a run file"""
+    doc_ids_indexed = sorted(doc_ids_indexed)
+    chunks = [
+        encode_varbyte(doc_ids_indexed[start:start + RUN_DOC_IDS_CHUNK],
+                       base=doc_ids_indexed[start - 1] if start else 0)
+        for start in range(0, len(doc_ids_indexed), RUN_DOC_IDS_CHUNK)
+    ]
+    with open(filepath, 'wb') as fout:
+        fout.write(pack('<Q', sum(calcsize('<I') + len(chunk) for chunk in chunks)))
+        for chunk in chunks:
+            fout.write(pack('<I', len(chunk)))
+            fout.write(chunk)
+        for term in sorted(index):
+            doc_ids = index[term]
+            doc_ids.sort()
+            term_bytes = term.encode('utf-8')
+            postings = encode_varbyte(doc_ids)
+            fout.write(pack('<II', len(term_bytes), len(postings)))
+            fout.write(term_bytes)
+            fout.write(postings)
+
+
+def _read_run_doc_ids(filepath: str) -> Iterator[int]:
+    """Read the sorted doc ids indexed by a run file one chunk at a time"""
+    with open(filepath, 'rb') as fin:
+        end = calcsize('<Q') + unpack('<Q', fin.read(calcsize('<Q')))[0]
+        last_doc_id = 0
+        while fin.tell() < end:
+            chunk_size = unpack('<I', fin.read(calcsize('<I')))[0]
+            doc_ids = decode_varbyte(fin.read(chunk_size), base=last_doc_id)
+            yield from doc_ids
+            last_doc_id = doc_ids[-1]
+
+
+def _replaced_doc_ids(run_filepaths: List[str]) -> Dict[int, Set[int]]:
+    """Return doc ids of every run number that a later run indexed again"""
+    replaced: Dict[int, Set[int]] = {}
+
+    def read_doc_ids(run_number: int, filepath: str) -> Iterator[Tuple[int, int]]:
+        for doc_id in _read_run_doc_ids(filepath):
+            yield doc_id, run_number
+
+    doc_ids = [read_doc_ids(run_number, filepath) for run_number, filepath in enumerate(run_filepaths)]
+    for doc_id, group in groupby(heapq.merge(*doc_ids), key=itemgetter(0)):
+        run_numbers = [run_number for _, run_number in group]
+        for run_number in run_numbers[:-1]:
+            replaced.setdefault(run_number, set()).add(doc_id)
+    return replaced
+
+
+def _read_run(filepath: str) -> Iterator[Tuple[str, array]]:
+    """Read term and postings pairs back from a run file"""
+    header_size = calcsize('<II')
+    with open(filepath, 'rb') as fin:
+        fin.seek(calcsize('<Q') + unpack('<Q', fin.read(calcsize('<Q')))[0])
+        while True:
+            header = fin.read(header_size)
+            if not header:
+                break
+            term_size, postings_size = unpack('<II', header)
+            term = fin.read(term_size).decode('utf-8')
+            yield term, decode_varbyte(fin.read(postings_size))
+
+
+def _merge_runs(run_filepaths: List[str]) -> Iterator[Tuple[str, List[int]]]:
+    """
+    k-way merge of run files into term and postings pairs sorted by term,
+    doc ids a later run indexed again are dropped from the earlier runs.
+    """
+    replaced = _replaced_doc_ids(run_filepaths)
+
+    def read_run(run_number: int, filepath: str) -> Iterator[Tuple[str, int, Sequence[int]]]:
+        stale = replaced.get(run_number)
+        for term, doc_ids in _read_run(filepath):
+            if stale:
+                doc_ids = [doc_id for doc_id in doc_ids if doc_id not in stale]
+                if not doc_ids:
+                    continue
+            yield term, run_number, doc_ids
+
+    runs = [read_run(run_number, filepath) for run_number, filepath in enumerate(run_filepaths)]
+    for term, group in groupby(heapq.merge(*runs), key=lambda entry: entry[0]):
+        postings = [doc_ids for _, _, doc_ids in group]
+        yield term, list(postings[0]) if len(postings) == 1 else list(heapq.merge(*postings))
+
+
+def build_inverted_index_streaming(dataset_filepath: str, inverted_index_filepath: str,
+                                   strategy: str = "struct", max_memory: int = 256 * 1024 ** 2,
+                                   analyzer: Analyzer = None) -> None:
+    """
+    Build the inverted index reading the dataset line by line (SPIMI):
+    blocks are indexed in memory up to max_memory bytes (estimated),
+    full blocks are written to temporary run files and k-way merged into the index file.
+    As in load_documents a doc id repeated in the dataset keeps only its last line:
+    run files store the doc ids of their block and the merge drops replaced ones.
+    """
+    print(f"building inverted index for {dataset_filepath} within {max_memory} bytes", file=sys.stderr)
+    analyzer = analyzer if analyzer is not None else DEFAULT_ANALYZER
+    directory = os.path.dirname(os.path.abspath(inverted_index_filepath))
+    with tempfile.TemporaryDirectory(prefix="inverted-runs-", dir=directory) as runs_directory:
+        run_filepaths: List[str] = []
+        block: Dict[str, List[int]] = {}
+        block_doc_ids: Set[int] = set()
+        block_bytes = 0
+        max_doc_id = 0
+        with open(dataset_filepath, 'r', encoding='utf8') as dataset:
+            for line in dataset:
+                doc_id, content = _parse_document(line)
+                max_doc_id = max(max_doc_id, doc_id)
+                if doc_id in block_doc_ids:
+                    _remove_document(block, doc_id)
+                else:
+                    block_doc_ids.add(doc_id)
+                    block_bytes += ESTIMATED_POSTING_BYTES
+                terms_count = len(block)
+                postings_added = _add_document(block, doc_id, content, analyzer=analyzer)
+                block_bytes += (ESTIMATED_POSTING_BYTES * postings_added
+                                + ESTIMATED_TERM_BYTES * (len(block) - terms_count))
+                if block_bytes >= max_memory:
+                    run_filepaths.append(os.path.join(runs_directory, f"run-{len(run_filepaths)}"))
+                    _write_run(run_filepaths[-1], block, block_doc_ids)
+                    block = {}
+                    block_doc_ids = set()
+                    block_bytes = 0
+        if not run_filepaths:
+            for doc_ids in block.values():
+                doc_ids.sort()
+            items = sorted(block.items())
+        else:
+            if block_doc_ids:
+                run_filepaths.append(os.path.join(runs_directory, f"run-{len(run_filepaths)}"))
+                _write_run(run_filepaths[-1], block, block_doc_ids)
+                block = {}
+            print(f"merging {len(run_filepaths)} runs into {inverted_index_filepath}", file=sys.stderr)
+            items = _merge_runs(run_filepaths)
+        write_index(inverted_index_filepath, items, strategy=strategy, max_doc_id=max_doc_id,
+                    analyzer=None if analyzer.is_default else analyzer.config)
+
+
+def _write_file_atomically(filepath: str, data: bytes) -> None:
+    """Write the file under a temporary name and rename it into place"""
+    temporary_filepath = f"{filepath}.tmp"
+    with open(temporary_filepath, 'wb') as fout:
+        fout.write(data)
+    os.replace(temporary_filepath, filepath)
+
+
+class _Segment:
+    """Immutable segment of a SegmentedInvertedIndex.
+
+    A segment is an mmap index file, a sorted array of its doc ids and
+    a tombstone bitmap marking deleted positions of that array.
+    """
+
+    def __init__(self, directory: str, name: str, tombstones: Optional[str] = None):
+        self.name = name
+        self.tombstones_name = tombstones
+        self.postings = MappedPostings(_map_file(os.path.join(directory, f"{name}.index")))
+        docs_buffer = _map_file(os.path.join(directory, f"{name}.docs"))
+        self.doc_ids = _read_array(docs_buffer, 'Q', 0, len(docs_buffer))
+        if tombstones:
+            with open(os.path.join(directory, tombstones), 'rb') as fin:
+                self.tombstones = bytearray(fin.read())
+        else:
+            self.tombstones = bytearray((len(self.doc_ids) + 7) // 8)
+        self.deleted_doc_ids = {
+            self.doc_ids[byte_position * 8 + bit]
+            for byte_position, byte in enumerate(self.tombstones) if byte
+            for bit in range(8) if byte >> bit & 1
+        }
+        self.dirty = False
+
+    @property
+    def live_count(self) -> int:
+        return len(self.doc_ids) - len(self.deleted_doc_ids)
+
+    def delete(self, doc_id: int) -> bool:
+        """Mark the document deleted, return True if it was live in this segment"""
+        position = bisect_left(self.doc_ids, doc_id)
+        if position == len(self.doc_ids) or self.doc_ids[position] != doc_id:
+            return False
+        if doc_id in self.deleted_doc_ids:
+            return False
+        self.tombstones[position >> 3] |= 1 << (position & 7)
+        self.deleted_doc_ids.add(doc_id)
+        self.dirty = True
+        return True
+
+    def live(self, doc_ids: Sequence[int]) -> Sequence[int]:
+        """Drop deleted documents from sorted doc ids"""
+        if not self.deleted_doc_ids:
+            return doc_ids
+        deleted = self.deleted_doc_ids
+        return [doc_id for doc_id in doc_ids if doc_id not in deleted]
+
+    def live_postings(self, term: str) -> Sequence[int]:
+        """Return live postings of the term, empty if the segment lacks it"""
+        if term not in self.postings:
+            return []
+        return self.live(self.postings[term])
+
+
+class _SegmentedPostings(Mapping):
+    """Read-only term -> live postings view merged over all segments"""
+
+    def __init__(self, segmented_index: SegmentedInvertedIndex):
+        self._segmented_index = segmented_index
+
+    def terms_with_prefix(self, prefix: str) -> Iterator[str]:
+        """Yield live terms of all segments starting with the prefix in sorted order"""
+        terms = heapq.merge(*(
+            segment.postings.terms_with_prefix(prefix) for segment in self._segmented_index.segments
+        ))
+        for term, _ in groupby(terms):
+            if term in self:
+                yield term
+
+    def __getitem__(self, term: str) -> List[int]:
+        postings = [segment.live_postings(term) for segment in self._segmented_index.segments]
+        doc_ids = list(heapq.merge(*postings))
+        if not doc_ids:
+            raise KeyError(term)
+        return doc_ids
+
+    def __contains__(self, term) -> bool:
+        return any(segment.live_postings(term) for segment in self._segmented_index.segments)
+
+    def __iter__(self):
+        terms = heapq.merge(*(iter(segment.postings) for segment in self._segmented_index.segments))
+        for term, _ in groupby(terms):
+            if term in self:
+                yield term
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class SegmentedInvertedIndex(InvertedIndex):
+    """InvertedIndex stored as a directory of immutable segments.
+
+    Added documents go to a new small segment, deleted or replaced ones
+    are marked in tombstone bitmaps of older segments, and merge() rewrites
+    segments log-structured style dropping deleted documents.
+    The manifest lists live segments and is replaced atomically on every change.
+    """
+
+    def __init__(self, directory: str, merge_factor: int = DEFAULT_MERGE_FACTOR):
+        super().__init__(index=_SegmentedPostings(self))
+        self.directory = directory
+        self.merge_factor = merge_factor
+        self.segments: List[_Segment] = []
+        self.next_segment = 1
+        self.generation = 0
+        manifest_filepath = os.path.join(directory, SEGMENTS_MANIFEST)
+        if os.path.exists(manifest_filepath):
+            with open(manifest_filepath, 'r', encoding='utf8') as fin:
+                manifest = json.load(fin)
+            self.next_segment = manifest["next_segment"]
+            self.generation = manifest["generation"]
+            self.segments = [
+                _Segment(directory, segment["name"], segment["tombstones"])
+                for segment in manifest["segments"]
+            ]
+
+    def _execute_query(self, terms: List[str]) -> List[int]:
+        """Intersect postings of distinct query terms in every segment separately"""
+        if not terms:
+            return []
+        results = []
+        for segment in self.segments:
+            docs_list = []
+            for term in terms:
+                postings = _lookup(segment.postings, term, segment.postings.terms_with_prefix)
+                if postings is None:
+                    break
+                docs_list.append(postings)
+            else:
+                results.append(segment.live(intersect_postings(docs_list)))
+        return list(heapq.merge(*results))
+
+    def _segment_filepath(self, name: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{name}.{suffix}")
+
+    def _new_segment_name(self) -> str:
+        name = f"segment-{self.next_segment:06d}"
+        self.next_segment += 1
+        return name
+
+    def _commit(self, obsolete_files: List[str] = ()) -> None:
+        """Persist changed tombstones and the manifest, then drop obsolete files"""
+        self.generation += 1
+        obsolete_files = list(obsolete_files)
+        for segment in self.segments:
+            if segment.dirty:
+                if segment.tombstones_name:
+                    obsolete_files.append(segment.tombstones_name)
+                segment.tombstones_name = f"{segment.name}.{self.generation}.del"
+                _write_file_atomically(os.path.join(self.directory, segment.tombstones_name),
+                                       bytes(segment.tombstones))
+                segment.dirty = False
+        manifest = {
+            "next_segment": self.next_segment,
+            "generation": self.generation,
+            "segments": [
+                {"name": segment.name, "tombstones": segment.tombstones_name}
+                for segment in self.segments
+            ],
+        }
+        _write_file_atomically(os.path.join(self.directory, SEGMENTS_MANIFEST),
+                               json.dumps(manifest).encode('utf-8'))
+        for filename in obsolete_files:
+            os.remove(os.path.join(self.directory, filename))
+
+    def _write_segment(self, name: str, items: Iterable[Tuple[str, Sequence[int]]],
+                       doc_ids: Sequence[int]) -> _Segment:
+        """Write the segment files for sorted term and postings pairs and sorted doc ids"""
+        max_doc_id = doc_ids[-1] if doc_ids else 0
+        write_index(self._segment_filepath(name, "index"), items, strategy="mmap", max_doc_id=max_doc_id)
+        _write_file_atomically(self._segment_filepath(name, "docs"), _array_to_le_bytes(array('Q', doc_ids)))
+        return _Segment(self.directory, name)
+
+    def add_documents(self, documents: Dict[int, str]) -> None:
+        """Index new documents in a new segment, replacing older versions of the same ids"""
+        if not documents:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for segment in self.segments:
+            for doc_id in documents:
+                segment.delete(doc_id)
+        inverted = build_inverted_index(documents)
+        segment = self._write_segment(self._new_segment_name(), sorted(inverted.index.items()),
+                                      sorted(documents))
+        self.segments.append(segment)
+        self._commit()
+        if len(self.segments) > self.merge_factor:
+            self.merge(max_segments=self.merge_factor)
+
+    def delete_documents(self, doc_ids: Iterable[int]) -> int:
+        """Mark documents deleted in every segment, return the number of deleted documents"""
+        deleted = 0
+        for doc_id in doc_ids:
+            deleted += sum(segment.delete(doc_id) for segment in self.segments)
+        if deleted:
+            self._commit()
+        return deleted
+
+    def merge(self, max_segments: int = 1) -> None:
+        """
+        Merge the smallest segments until at most max_segments remain,
+        a single remaining segment is rewritten only to drop deleted documents.
+        """
+        if max_segments < 1:
+            raise ValueError(f"max_segments should be positive, got {max_segments}")
+        by_size = sorted(self.segments, key=lambda segment: segment.live_count)
+        to_merge = by_size[:max(len(self.segments) - max_segments + 1, 1)]
+        if len(to_merge) == 1 and not to_merge[0].deleted_doc_ids:
+            return
+        print(f"merging segments {[segment.name for segment in to_merge]}", file=sys.stderr)
+        terms = heapq.merge(*(iter(segment.postings) for segment in to_merge))
+        items = (
+            (term, postings)
+            for term, postings in (
+                (term, list(heapq.merge(*(segment.live_postings(term) for segment in to_merge))))
+                for term, _ in groupby(terms)
+            )
+            if postings
+        )
+        doc_ids = list(heapq.merge(*(segment.live(segment.doc_ids) for segment in to_merge)))
+        obsolete_files = []
+        for segment in to_merge:
+            obsolete_files += [f"{segment.name}.index", f"{segment.name}.docs"]
+            if segment.tombstones_name:
+                obsolete_files.append(segment.tombstones_name)
+        merged_segments = []
+        if doc_ids:
+            merged_segments.append(self._write_segment(self._new_segment_name(), items, doc_ids))
+        self.segments = [segment for segment in self.segments if segment not in to_merge] + merged_segments
+        self._commit(obsolete_files)
+
+
+def shard_of_term(term: str, shards: int) -> int:
+    """Return the shard owning the term in a term-partitioned index"""
+    return zlib.crc32(term.encode('utf-8')) % shards
+
+
+def write_sharded_index(inverted_index: InvertedIndex, directory: str, shards: int,
+                        partition: str = "term", strategy: str = "mmap") -> None:
+    """
+    Split the index into shards index files in the directory, by term hash
+    or by contiguous doc id ranges, and write the shards manifest last.
+    """
+    if partition not in SHARD_PARTITIONS:
+        raise ValueError(f"unknown shard partition {partition!r}, choose one of {list(SHARD_PARTITIONS)}")
+    if shards < 1:
+        raise ValueError(f"number of shards should be positive, got {shards}")
+    os.makedirs(directory, exist_ok=True)
+    parts: List[Dict[str, Sequence[int]]] = [{} for _ in range(shards)]
+    if partition == "term":
+        for term, doc_ids in inverted_index.index.items():
+            parts[shard_of_term(term, shards)][term] = doc_ids
+    else:
+        max_doc_id = max((doc_ids[-1] for doc_ids in inverted_index.index.values() if len(doc_ids)), default=0)
+        # shard i holds doc ids below bounds[i] and not below bounds[i - 1]
+        bounds = [(max_doc_id + 1) * (number + 1) // shards for number in range(shards)]
+        for term, doc_ids in inverted_index.index.items():
+            start = 0
+            for number, bound in enumerate(bounds):
+                end = bisect_left(doc_ids, bound, start)
+                if end > start:
+                    parts[number][term] = list(doc_ids[start:end])
+                start = end
+    filenames = []
+    for number, part in enumerate(parts):
+        filename = f"shard-{number:03d}.index"
+        InvertedIndex(index=part, analyzer=inverted_index.analyzer).dump(
+            os.path.join(directory, filename), strategy=strategy)
+        filenames.append(filename)
+    manifest = {"partition": partition, "strategy": strategy, "shards": filenames,
+                "analyzer": inverted_index.analyzer.config}
+    _write_file_atomically(os.path.join(directory, SHARDS_MANIFEST), json.dumps(manifest).encode('utf-8'))
+
+
+# index of the shard served by a coordinator worker process
+_WORKER_SHARD: Optional[InvertedIndex] = None
+
+
+def _init_shard_worker(filepath: str) -> None:
+    global _WORKER_SHARD
+    _WORKER_SHARD = InvertedIndex.load(filepath)
+
+
+def _shard_answers(index: InvertedIndex, partition: str, queries: List[List[str]]) -> list:
+    """
+    Answer a batch of queries, already analyzed by the coordinator, on one shard:
+    full answers of a doc-partitioned shard, or for a term-partitioned shard the
+    intersection of its own exact terms (None without them) and the local union
+    of every wildcard pattern.
+    """
+    if partition == "doc":
+        return index._execute_many(queries)
+    answers = []
+    for terms in queries:
+        exact = [term for term in terms if WILDCARD not in term]
+        unions = []
+        for pattern in (term for term in terms if WILDCARD in term):
+            postings = index._term_postings(pattern)
+            unions.append(list(postings) if postings is not None else [])
+        answers.append((index._execute_query(exact) if exact else None, unions))
+    return answers
+
+
+def _worker_shard_answers(partition: str, queries: List[List[str]]) -> list:
+    return _shard_answers(_WORKER_SHARD, partition, queries)
+
+
+class _ShardedPostings(Mapping):
+    """Read-only term -> postings view over all shards of a sharded index"""
+
+    def __init__(self, sharded_index: ShardedInvertedIndex):
+        self._sharded_index = sharded_index
+
+    def _owners(self, term: str) -> List[InvertedIndex]:
+        shards = self._sharded_index.shards
+        if self._sharded_index.partition == "term":
+            return [shards[shard_of_term(term, len(shards))]]
+        return shards
+
+    def terms_with_prefix(self, prefix: str) -> Iterator[str]:
+        """Yield terms of all shards starting with the prefix in sorted order"""
+        terms = heapq.merge(*(shard.terms_with_prefix(prefix) for shard in self._sharded_index.shards))
+        for term, _ in groupby(terms):
+            yield term
+
+    def __getitem__(self, term: str) -> List[int]:
+        postings = [shard.index[term] for shard in self._owners(term) if term in shard.index]
+        if not postings:
+            raise KeyError(term)
+        # doc-partitioned shards hold increasing doc id ranges
+        return [doc_id for doc_ids in postings for doc_id in doc_ids]
+
+    def __contains__(self, term) -> bool:
+        return any(term in shard.index for shard in self._owners(term))
+
+    def __iter__(self):
+        terms = heapq.merge(*(sorted(shard.index) for shard in self._sharded_index.shards))
+        return (term for term, _ in groupby(terms))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class ShardedInvertedIndex(InvertedIndex):
+    """InvertedIndex split into shard files by write_sharded_index.
+
+    Queries are scattered to the shards and partial results gathered:
+    term-partitioned shards return intersections of the terms they own, which
+    are intersected again, doc-partitioned shards answer whole queries over
+    their doc ranges, which are concatenated. With processes every shard is
+    served by its own worker process, otherwise shards are queried in turn.
     """
 
-    def __init__(self, index: Dict[str, List[int]] = None):
-        if index:
-            self.index = index
-        else:
-            self.index = dict()
+    def __init__(self, directory: str, processes: bool = False):
+        super().__init__(index=_ShardedPostings(self))
+        self.directory = directory
+        with open(os.path.join(directory, SHARDS_MANIFEST), 'r', encoding='utf8') as fin:
+            manifest = json.load(fin)
+        self.partition = manifest["partition"]
+        self.analyzer = Analyzer.from_config(manifest.get("analyzer"))
+        self.filepaths = [os.path.join(directory, filename) for filename in manifest["shards"]]
+        self._shards: Optional[List[InvertedIndex]] = None
+        self._executors: Optional[List[ProcessPoolExecutor]] = None
+        if processes:
+            self._executors = [
+                ProcessPoolExecutor(max_workers=1, initializer=_init_shard_worker, initargs=(filepath,))
+                for filepath in self.filepaths
+            ]
 
-    def query(self, words: List[str]) -> List[int]:
-        """Return the list of relevant documents for the given query"""
-        assert isinstance(words, list), (
-            "query should be provided with a list of words, but user provided: "
-            f"{repr(words)}"
-        )
+    @property
+    def shards(self) -> List[InvertedIndex]:
+        """Shard indexes loaded in this process on first use"""
+        if self._shards is None:
+            self._shards = [InvertedIndex.load(filepath) for filepath in self.filepaths]
+        return self._shards
 
-        docs_list = []
-        for term in words:
-            if term in self.index:
-                docs_list.append(self.index[term])
-            else:
-                docs_list.append([])
-        result = []
-        for doc in docs_list[0]:
-            if all(doc in docs for docs in docs_list[1:]):
-                if doc not in result:
-                    result.append(doc)
-        return result
+    def close(self) -> None:
+        """Stop shard worker processes"""
+        if self._executors is not None:
+            for executor in self._executors:
+                executor.shutdown()
+            self._executors = None
 
-    def dump(self, filepath: str) -> None:
-        """Dumps the inverted index dict to the given path"""
-        with open(filepath, 'wb') as fout:
-            for word in self.index:
-                word_and_docs_count = {}
-                doc_ids = self.index[word]
-                word_and_docs_count[word] = len(doc_ids)
-                header: bytes = json.dumps(word_and_docs_count).encode('utf-8')
-                meta: int = len(header)
-                fout.write(pack('>I', meta))
-                fout.write(header)
-                fout.write(pack(f'>{len(doc_ids)}H', *doc_ids))
+    def _scatter(self, shard_queries: List[List[List[str]]]) -> List[Optional[list]]:
+        """Run every shard's batch of queries, shards without any terms are skipped"""
+        active = [any(terms for terms in queries) for queries in shard_queries]
+        if self._executors is None:
+            return [
+                _shard_answers(shard, self.partition, queries) if is_active else None
+                for shard, queries, is_active in zip(self.shards, shard_queries, active)
+            ]
+        futures = [
+            executor.submit(_worker_shard_answers, self.partition, queries) if is_active else None
+            for executor, queries, is_active in zip(self._executors, shard_queries, active)
+        ]
+        return [future.result() if future is not None else None for future in futures]
+
+    def _gather(self, term_lists: List[List[str]]) -> List[List[int]]:
+        shards = len(self.filepaths)
+        if self.partition == "doc":
+            partial = self._scatter([term_lists] * shards)
+            return [
+                [doc_id for answers in partial if answers is not None for doc_id in answers[number]]
+                for number in range(len(term_lists))
+            ]
+        shard_queries = [[[] for _ in term_lists] for _ in range(shards)]
+        for number, terms in enumerate(term_lists):
+            patterns = [term for term in terms if WILDCARD in term]
+            for term in terms:
+                if WILDCARD not in term:
+                    shard_queries[shard_of_term(term, shards)][number].append(term)
+            if patterns:
+                for queries in shard_queries:
+                    queries[number].extend(patterns)
+        partial = self._scatter(shard_queries)
+        results = []
+        for number, terms in enumerate(term_lists):
+            intersections = []
+            unions = [[] for term in terms if WILDCARD in term]
+            for shard, answers in enumerate(partial):
+                if answers is None or not shard_queries[shard][number]:
+                    continue
+                intersection, pattern_unions = answers[number]
+                if intersection is not None:
+                    intersections.append(intersection)
+                for pattern_number, postings in enumerate(pattern_unions):
+                    unions[pattern_number].append(postings)
+            postings_lists = intersections + [union_postings(postings) for postings in unions]
+            results.append(intersect_postings(postings_lists) if terms else [])
+        return results
+
+    def _execute_query(self, terms: List[str]) -> List[int]:
+        """Scatter the query to the shards and merge their partial results"""
+        return self._gather([terms])[0]
+
+    def _execute_many(self, term_lists: List[List[str]]) -> List[List[int]]:
+        """Answer a batch of queries with one round trip to every shard"""
+        return self._gather(term_lists)
 
-    @classmethod
-    def load(cls, filepath: str) -> InvertedIndex:
-        """Loads the inverted index dict by the given path"""
-        print(f"load inverted index from filepath {filepath}", file=sys.stderr)
 
-        size = os.path.getsize(filepath)
-        inverted_index = dict()
-        fin = open(filepath, 'rb')
+def _struct_v1_term_counts(filepath: str, sections: Dict[str, int]) -> Iterator[Tuple[str, int, Callable]]:
+    """Stream terms of the first struct format header by header, postings are read one term at a time"""
+    sections.update(headers=0, postings=0)
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as fin:
         while fin.tell() < size:
             meta = unpack('>I', fin.read(calcsize('>I')))[0]
-            header = unpack(f'{meta}s', fin.read(calcsize(f'{meta}s')))[0].decode('utf-8')
-            word_and_docs_count = json.loads(header)
-            for word in word_and_docs_count:
-                docs_count = word_and_docs_count[word]
-                doc_ids = list(
-                    unpack(f'>{docs_count}H', fin.read(calcsize(f'>{docs_count}H')))
-                )
-                inverted_index[word] = doc_ids
-        fin.close()
+            header = json.loads(fin.read(meta).decode('utf-8'))
+            sections["headers"] += calcsize('>I') + meta
+            for word, docs_count in header.items():
+                doc_ids = sorted(unpack(f'>{docs_count}H', fin.read(calcsize(f'>{docs_count}H'))))
+                sections["postings"] += calcsize(f'>{docs_count}H')
+                yield word, docs_count, partial(list, doc_ids)
 
-        inverted = InvertedIndex()
-        inverted.index = inverted_index
-        return inverted
 
-    def __eq__(self, other):
-        outcome = (
-            self.index == other.index
+def _sliced_term_counts(terms: Iterable[str], counts: Sequence[int],
+                        postings: Sequence[int]) -> Iterator[Tuple[str, int, Callable]]:
+    position = 0
+    for term, count in zip(terms, counts):
+        yield term, count, partial(postings.__getitem__, slice(position, position + count))
+        position += count
+
+
+def _index_file_terms(filepath: str, sections: Dict[str, int]) -> Tuple[str, str, Iterator[Tuple[str, int, Callable]]]:
+    """
+    Return the storage strategy, the postings typecode and an iterator of
+    (term, posting length, read postings) of an index file, reading only the
+    term dictionary and the counts. Json indexes have to be parsed whole.
+    On-disk bytes per section are stored into sections.
+    """
+    with open(filepath, 'rb') as fin:
+        signature = fin.read(len(MMAP_MAGIC))
+    if signature == MMAP_MAGIC:
+        postings = MappedPostings(_map_file(filepath))
+        footer_offset = unpack(FOOTER_OFFSET_FORMAT, postings._buffer[-calcsize(FOOTER_OFFSET_FORMAT):])[0]
+        sections["magic"] = len(MMAP_MAGIC)
+        sections.update((name, size) for name, (offset, size) in postings.footer["sections"].items())
+        sections["footer"] = len(postings._buffer) - footer_offset
+        sections["padding"] = len(postings._buffer) - sum(sections.values())
+        items = (
+            (postings._term_bytes(position).decode('utf-8'), postings._counts[position],
+             partial(postings._decode, position))
+            for position in range(len(postings))
         )
-        return outcome
+        codec = postings.footer["codec"]
+        return "mmap" if codec == "raw" else codec, postings.typecode, items
+    if signature in (STRUCT_MAGIC, STRUCT_V2_MAGIC):
+        buffer = _map_file(filepath)
+        offset = len(STRUCT_MAGIC)
+        if signature == STRUCT_MAGIC:
+            offset += calcsize(STRUCT_META_SIZE_FORMAT) + unpack_from(STRUCT_META_SIZE_FORMAT, buffer, offset)[0]
+        typecode, size, term_block_size = unpack_from(STRUCT_HEADER_FORMAT, buffer, offset)
+        typecode = typecode.decode('ascii')
+        offset += calcsize(STRUCT_HEADER_FORMAT)
+        terms = bytes(buffer[offset:offset + term_block_size]).decode('utf-8').split('\n') if size else []
+        sections.update(header=offset, terms=term_block_size, counts=size * calcsize('<I'))
+        offset += term_block_size
+        counts = _read_array(buffer, 'I', offset, sections["counts"])
+        offset += sections["counts"]
+        sections["postings"] = len(buffer) - offset
+        return "struct", typecode, _sliced_term_counts(terms, counts, _read_array(buffer, typecode, offset,
+                                                                                  sections["postings"]))
+    if signature == PICKLE_MAGIC:
+        buffer = _map_file(filepath)
+        terms, counts, postings, typecode, _ = _read_pickle(buffer)
+        sections["header"] = len(PICKLE_MAGIC) + calcsize(PICKLE_HEADER_FORMAT)
+        sections.update(zip(("pickle", "counts", "postings"),
+                            unpack_from(PICKLE_HEADER_FORMAT, buffer, len(PICKLE_MAGIC))))
+        return "pickle", typecode, _sliced_term_counts(terms, counts, postings)
+    if signature.startswith(b'{'):
+        with open(filepath, 'r', encoding='utf8') as fin:
+            index = json.load(fin)
+        sections["json"] = os.path.getsize(filepath)
+        max_doc_id = max((doc_ids[-1] for doc_ids in index.values() if doc_ids), default=0)
+        terms = sorted(index)
+        return "json", _postings_typecode(max_doc_id), _sliced_term_counts(
+            terms, [len(index[term]) for term in terms], [doc_id for term in terms for doc_id in index[term]])
+    return "struct", 'H', _struct_v1_term_counts(filepath, sections)
 
 
-def load_documents(filepath: str) -> Dict[int, str]:
+def _merged_term_counts(sources: List[Iterator[Tuple[str, int, Callable]]]) -> Iterator[Tuple[str, int, Callable]]:
+    """Merge term ordered iterators of several index files, summing posting lengths of equal terms"""
+    for term, group in groupby(heapq.merge(*sources, key=itemgetter(0)), key=itemgetter(0)):
+        group = list(group)
+        readers = [read for _, _, read in group]
+        yield term, sum(count for _, count, _ in group), (
+            lambda readers=readers: union_postings([read() for read in readers]))
+
+
+def _directory_index_files(directory: str) -> Tuple[str, List[str], List[str]]:
+    """Return the kind of a directory index, its index files and other data files"""
+    shards_filepath = os.path.join(directory, SHARDS_MANIFEST)
+    if os.path.exists(shards_filepath):
+        with open(shards_filepath, 'r', encoding='utf8') as fin:
+            return "sharded", json.load(fin)["shards"], [SHARDS_MANIFEST]
+    with open(os.path.join(directory, SEGMENTS_MANIFEST), 'r', encoding='utf8') as fin:
+        segments = json.load(fin)["segments"]
+    others = [SEGMENTS_MANIFEST] + [f"{segment['name']}.docs" for segment in segments]
+    others += [segment["tombstones"] for segment in segments if segment["tombstones"]]
+    return "segmented", [f"{segment['name']}.index" for segment in segments], others
+
+
+def _percentile(sorted_values: Sequence[int], percent: float) -> int:
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0
+    return sorted_values[max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)]
+
+
+def _estimated_memory(terms: int, postings: int, term_bytes: int, itemsize: int,
+                      encoded: Dict[str, Optional[int]]) -> Dict[str, Dict[str, Optional[int]]]:
     """
-    Loads the documents dataset by the given path.
-    Return the dict with articles' ids as keys and articles' contents as values.
+    Estimate the memory used by the loaded index with every storage strategy:
+    heap bytes of Python objects and bytes mapped from the index file, which
+    are paged in on access and shared between processes. encoded maps mmap
+    based strategies to their postings section size, None when unknown.
     """
-    print(f"loading documents from path {filepath} to build inverted index...", file=sys.stderr)
-    with open(filepath, 'r', encoding='utf8') as dataset:
-        lines = dataset.readlines()
-    documents: Dict[int, str] = {}
-    for line in lines:
-        content: str
-        doc_id, content = line.lower().split("\t", 1)
-        doc_id = int(doc_id)
-        documents[doc_id] = content.strip()
-    return documents
+    dict_bytes = terms * ESTIMATED_TERM_BYTES + postings * ESTIMATED_POSTING_BYTES
+    # term dictionary, term and postings offsets, counts
+    dictionary_bytes = term_bytes + 2 * (terms + 1) * calcsize('<Q') + terms * calcsize('<I')
+    memory = {
+        "json": {"heap_bytes": dict_bytes, "mapped_bytes": 0},
+        "struct": {"heap_bytes": dict_bytes, "mapped_bytes": 0},
+        "pickle": {"heap_bytes": dict_bytes, "mapped_bytes": 0},
+        "compact": {"heap_bytes": terms * ESTIMATED_TERM_BYTES + postings * itemsize
+                    + (terms + 1) * calcsize('<Q'), "mapped_bytes": 0},
+    }
+    for strategy, size in encoded.items():
+        memory[strategy] = {"heap_bytes": 0, "mapped_bytes": None if size is None else dictionary_bytes + size}
+    return memory
 
 
-def build_inverted_index(documents: Dict[int, str]) -> InvertedIndex:
+def index_statistics(filepath: str, top: int = DEFAULT_STATS_TOP, scan: bool = False) -> dict:
     """
-    Build the InvertedIndex object by the given dict of documents.
-    Return the InvertedIndex object.
+    Collect statistics of an index file or directory without loading it:
+    vocabulary size, posting length percentiles and log2 histogram, the
+    heaviest terms, on-disk bytes per section and estimated memory of every
+    storage strategy. With scan every posting list is decoded once, one term
+    at a time, to size the varbyte and roaring encodings exactly.
     """
-    print("building inverted index for provided documents", file=sys.stderr)
-    inverted = InvertedIndex()
-    doc_id: int
-    for doc_id, content in documents.items():
-        terms: List[str] = re.split(r"\W+", content)
-        filtered_terms = list(dict.fromkeys(terms))
-        for term in filtered_terms:
-            if term not in inverted.index:
-                inverted.index[term] = [doc_id]
+    sections: Dict[str, int] = {}
+    if os.path.isdir(filepath):
+        kind, filenames, others = _directory_index_files(filepath)
+        file_sections = [{} for _ in filenames]
+        opened = [_index_file_terms(os.path.join(filepath, filename), part)
+                  for filename, part in zip(filenames, file_sections)]
+        strategies = {strategy for strategy, _, _ in opened}
+        strategy = f"{kind} {'/'.join(sorted(strategies))}"
+        typecode = max((typecode for _, typecode, _ in opened), key=lambda code: array(code).itemsize, default='H')
+        items = _merged_term_counts([items for _, _, items in opened])
+    else:
+        strategy, typecode, items = _index_file_terms(filepath, sections)
+    counts = array('Q')
+    heaviest: List[Tuple[int, str]] = []
+    term_bytes = max_doc_id = 0
+    scanned = {"varbyte": 0, "roaring": 0}
+    for term, count, read in items:
+        counts.append(count)
+        term_bytes += len(term.encode('utf-8'))
+        if len(heaviest) < top:
+            heapq.heappush(heaviest, (count, term))
+        elif top and (count, term) > heaviest[0]:
+            heapq.heapreplace(heaviest, (count, term))
+        if scan and count:
+            doc_ids = read()
+            max_doc_id = max(max_doc_id, doc_ids[-1])
+            scanned["varbyte"] += len(encode_varbyte(doc_ids))
+            scanned["roaring"] += len(_encode_roaring(doc_ids, typecode))
+    if os.path.isdir(filepath):
+        for filename, part in zip(filenames, file_sections):
+            sections.update((f"{filename}:{name}", size) for name, size in part.items())
+        sections.update((filename, os.path.getsize(os.path.join(filepath, filename))) for filename in others)
+    if scan:
+        typecode = _postings_typecode(max_doc_id)
+    postings = sum(counts)
+    encoded: Dict[str, Optional[int]] = {"mmap": postings * array(typecode).itemsize, "varbyte": None, "roaring": None}
+    if scan:
+        encoded.update(scanned)
+    counts = sorted(counts)
+    histogram = [
+        [1 << bucket, (2 << bucket) - 1, len(list(group))]
+        for bucket, group in groupby(count.bit_length() - 1 for count in counts if count)
+    ]
+    statistics = {
+        "path": filepath,
+        "strategy": strategy,
+        "typecode": typecode,
+        "terms": len(counts),
+        "postings": postings,
+        "mean_length": postings / len(counts) if counts else 0.0,
+        "percentiles": {f"p{percent}": _percentile(counts, percent) for percent in STATS_PERCENTILES},
+        "max_length": counts[-1] if counts else 0,
+        "histogram": histogram,
+        "heaviest": [[term, count] for count, term in sorted(heaviest, reverse=True)],
+        "sections": sections,
+        "file_bytes": sum(sections.values()),
+        "memory": _estimated_memory(len(counts), postings, term_bytes, array(typecode).itemsize, encoded),
+    }
+    if strategy in encoded:
+        statistics["memory"][strategy]["mapped_bytes"] = statistics["file_bytes"]
+    if scan:
+        statistics["max_doc_id"] = max_doc_id
+    return statistics
+
+
+def print_index_statistics(statistics: dict, fout: Optional[TextIO] = None) -> None:
+    """Print statistics collected by index_statistics as a plain text report"""
+    print(f"index: {statistics['path']} ({statistics['strategy']}, doc ids '{statistics['typecode']}')", file=fout)
+    print(f"vocabulary: {statistics['terms']} terms, {statistics['postings']} postings", file=fout)
+    percentiles = ", ".join(f"{name} {value}" for name, value in statistics["percentiles"].items())
+    print(f"posting length: mean {statistics['mean_length']:.2f}, {percentiles}, max {statistics['max_length']}",
+          file=fout)
+    print("posting length histogram:", file=fout)
+    for low, high, terms in statistics["histogram"]:
+        print(f"  {low:>10}-{high:<10} {terms}", file=fout)
+    print("heaviest terms:", file=fout)
+    for term, count in statistics["heaviest"]:
+        print(f"  {term:<24} {count}", file=fout)
+    print(f"on-disk sections ({statistics['file_bytes']} bytes):", file=fout)
+    for name, size in statistics["sections"].items():
+        print(f"  {name:<32} {size}", file=fout)
+    print("estimated memory by strategy (heap, mapped bytes):", file=fout)
+    for strategy, memory in statistics["memory"].items():
+        mapped = "-" if memory["mapped_bytes"] is None else memory["mapped_bytes"]
+        print(f"  {strategy:<10} {memory['heap_bytes']:>14} {mapped:>14}", file=fout)
+
+
+class _SharedIndexMemory(shared_memory.SharedMemory):
+    """Shared memory block that an attached index keeps mapped while its postings are viewed"""
+
+    def close(self) -> None:
+        try:
+            super().close()
+        except BufferError:
+            # memoryviews of a live index still point into the block, it is unmapped at exit
+            pass
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing block without letting this process unlink it on exit"""
+    try:
+        return _SharedIndexMemory(name=name, track=False)
+    except TypeError:
+        # track was added in Python 3.13, older versions register every attached block
+        memory = _SharedIndexMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+class QueryServer:
+    """Keep an inverted index resident and answer line protocol queries over TCP or a Unix socket.
+
+    Every connection is served by its own task, requests pipelined on one
+    connection are answered in order. The index path is polled and a changed
+    index is loaded aside and swapped in between queries; replace the index
+    by renaming a new file over it, a memory-mapped file must not be rewritten in place.
+    """
+
+    def __init__(self, inverted_index_filepath: str, cache_size: int = 0, boolean: bool = False,
+                 reload_interval: float = DEFAULT_RELOAD_INTERVAL):
+        self.inverted_index_filepath = inverted_index_filepath
+        self.cache_size = cache_size
+        self.boolean = boolean
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self._signature = self._index_signature()
+        self.inverted_index = self._load()
+
+    def _index_signature(self) -> Tuple[int, int, int]:
+        """Return what changes when the index is rewritten or replaced"""
+        path = self.inverted_index_filepath
+        if os.path.isdir(path):
+            shards_filepath = os.path.join(path, SHARDS_MANIFEST)
+            path = shards_filepath if os.path.exists(shards_filepath) else os.path.join(path, SEGMENTS_MANIFEST)
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _load(self) -> InvertedIndex:
+        inverted_index = InvertedIndex.load(self.inverted_index_filepath)
+        if self.cache_size > 0:
+            inverted_index.cache = QueryCache(max_entries=self.cache_size)
+        return inverted_index
+
+    def answer(self, line: str) -> str:
+        """Return the answer line for one query line, errors are reported as ERROR lines"""
+        try:
+            if self.boolean:
+                document_ids = self.inverted_index.query_boolean(line) if line.strip() else []
             else:
-                inverted.index[term].append(doc_id)
-    return inverted
+                document_ids = self.inverted_index.query(QUERY_TOKEN_PATTERN.findall(line))
+        except ValueError as error:
+            return f"ERROR {error}"
+        return ','.join(map(str, document_ids))
+
+    async def reload_if_changed(self) -> bool:
+        """Load the index again if its file changed, queries keep using the old one meanwhile"""
+        try:
+            signature = self._index_signature()
+        except OSError:
+            # the index is being replaced right now, try on the next poll
+            return False
+        if signature == self._signature:
+            return False
+        loop = asyncio.get_running_loop()
+        try:
+            inverted_index = await loop.run_in_executor(None, self._load)
+        except Exception as error:
+            print(f"failed to reload inverted index: {error!r}", file=sys.stderr)
+            return False
+        self.inverted_index = inverted_index
+        self._signature = signature
+        self.reloads += 1
+        print(f"reloaded inverted index from {self.inverted_index_filepath}", file=sys.stderr)
+        return True
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload_if_changed()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(self.answer(line.decode('utf-8', errors='replace')).encode('utf-8') + b"\n")
+                # answers of pipelined requests are buffered until the client reads them
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = DEFAULT_SERVE_HOST, port: int = DEFAULT_SERVE_PORT,
+                    unix_path: Optional[str] = None) -> asyncio.AbstractServer:
+        """Start listening and return the asyncio server"""
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self.handle_client, path=unix_path)
+        return await asyncio.start_server(self.handle_client, host=host, port=port)
+
+    async def serve_forever(self, host: str = DEFAULT_SERVE_HOST, port: int = DEFAULT_SERVE_PORT,
+                            unix_path: Optional[str] = None) -> None:
+        """Serve clients and watch the index until SIGINT or SIGTERM"""
+        server = await self.start(host, port, unix_path)
+        addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"serving inverted index {self.inverted_index_filepath} on {addresses}", file=sys.stderr)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        watcher = asyncio.create_task(self._watch()) if self.reload_interval > 0 else None
+        async with server:
+            await stop.wait()
+        if watcher is not None:
+            watcher.cancel()
+        print("query server stopped", file=sys.stderr)
 
 
 def callback_build(arguments):
     """Callback for build specifier: dump inverted index on hard drive"""
     return process_build(arguments.strategy,
                          arguments.dataset_filepath,
-                         arguments.inverted_index_filepath)
+                         arguments.inverted_index_filepath,
+                         workers=getattr(arguments, "workers", 1),
+                         max_memory=getattr(arguments, "max_memory", None),
+                         frequencies=getattr(arguments, "frequencies", False),
+                         positions=getattr(arguments, "positions", False),
+                         shards=getattr(arguments, "shards", 0),
+                         partition=getattr(arguments, "partition", "term"),
+                         store_filepath=getattr(arguments, "store_filepath", None),
+                         compress_store=getattr(arguments, "compress_store", False),
+                         analyzer=Analyzer(
+                             stop_words=getattr(arguments, "stop_words", None) or (),
+                             min_length=getattr(arguments, "min_length", 1),
+                             max_length=getattr(arguments, "max_length", 0),
+                             stemmer=getattr(arguments, "stemmer", None),
+                         ))
+
+
+def process_build(strategy, dataset_filepath, inverted_index_filepath, workers=1, max_memory=None,
+                  frequencies=False, positions=False, shards=0, partition="term", analyzer=None,
+                  store_filepath=None, compress_store=False):
+    """Check every option before anything is written, then build and write the index and the document store"""
+    if strategy not in STORAGE_WRITERS:
+        raise ValueError(f"unknown storage strategy {strategy!r}, choose one of {list(STORAGE_WRITERS)}")
+    if max_memory is not None and workers > 1:
+        raise ValueError("streaming build with max_memory does not support several workers")
+    if frequencies and (workers > 1 or max_memory is not None):
+        raise ValueError("term frequencies are only kept by the single process in-memory build")
+    if positions and (workers > 1 or max_memory is not None):
+        raise ValueError("token positions are only kept by the single process in-memory build")
+    if shards and (frequencies or positions or max_memory is not None):
+        raise ValueError("sharded build keeps postings only and needs the in-memory build")
+    if shards and partition not in SHARD_PARTITIONS:
+        raise ValueError(f"unknown shard partition {partition!r}, choose one of {list(SHARD_PARTITIONS)}")
+    if shards < 0:
+        raise ValueError(f"number of shards should be positive, got {shards}")
+    if (frequencies or positions) and strategy not in CONTAINER_STRATEGIES:
+        raise ValueError(f"{strategy} strategy does not store term frequencies and positions, "
+                         f"choose one of {list(CONTAINER_STRATEGIES)}")
+    if store_filepath is not None:
+        write_document_store(dataset_filepath, store_filepath, compress=compress_store)
+    if max_memory is not None:
+        build_inverted_index_streaming(dataset_filepath, inverted_index_filepath,
+                                       strategy=strategy, max_memory=max_memory, analyzer=analyzer)
+        return
+    if workers > 1:
+        inverted_index = build_inverted_index_parallel(dataset_filepath, workers, analyzer=analyzer)
+    else:
+        documents = load_documents(dataset_filepath)
+        inverted_index = build_inverted_index(documents, frequencies=frequencies, positions=positions,
+                                              analyzer=analyzer)
+    if shards:
+        write_sharded_index(inverted_index, inverted_index_filepath, shards, partition=partition, strategy=strategy)
+        return
+    inverted_index.dump(inverted_index_filepath, strategy=strategy)
 
 
-def process_build(strategy, dataset_filepath, inverted_index_filepath):
+def callback_add(arguments):
+    """Callback for add specifier: index new or changed documents in a new segment"""
+    return process_add(arguments.inverted_index_dirpath, arguments.dataset_filepath)
+
+
+def process_add(inverted_index_dirpath, dataset_filepath):
     documents = load_documents(dataset_filepath)
-    inverted_index = build_inverted_index(documents)
-    inverted_index.dump(inverted_index_filepath)
+    SegmentedInvertedIndex(inverted_index_dirpath).add_documents(documents)
+
+
+def callback_delete(arguments):
+    """Callback for delete specifier: mark documents deleted"""
+    return process_delete(arguments.inverted_index_dirpath, arguments.doc_ids)
+
+
+def process_delete(inverted_index_dirpath, doc_ids):
+    deleted = SegmentedInvertedIndex(inverted_index_dirpath).delete_documents(doc_ids)
+    print(f"deleted {deleted} documents", file=sys.stderr)
+
+
+def callback_merge(arguments):
+    """Callback for merge specifier: merge segments dropping deleted documents"""
+    return process_merge(arguments.inverted_index_dirpath, arguments.max_segments)
+
+
+def process_merge(inverted_index_dirpath, max_segments=1):
+    SegmentedInvertedIndex(inverted_index_dirpath).merge(max_segments=max_segments)
+
+
+def callback_serve(arguments):
+    """Callback for serve specifier: answer queries over a socket with a resident index"""
+    return process_serve(arguments.inverted_index_filepath,
+                         host=arguments.host,
+                         port=arguments.port,
+                         unix_path=arguments.unix_path,
+                         cache_size=arguments.cache_size,
+                         boolean=arguments.boolean,
+                         reload_interval=arguments.reload_interval)
+
+
+def process_serve(inverted_index_filepath, host=DEFAULT_SERVE_HOST, port=DEFAULT_SERVE_PORT, unix_path=None,
+                  cache_size=0, boolean=False, reload_interval=DEFAULT_RELOAD_INTERVAL):
+    server = QueryServer(inverted_index_filepath, cache_size=cache_size, boolean=boolean,
+                         reload_interval=reload_interval)
+    asyncio.run(server.serve_forever(host, port, unix_path))
+
+
+def callback_share(arguments):
+    """Callback for share specifier: keep the index in shared memory for attached workers"""
+    return process_share(arguments.inverted_index_filepath, arguments.name)
+
+
+def process_share(inverted_index_filepath, name=DEFAULT_SHARED_MEMORY_NAME):
+    memory = InvertedIndex.load(inverted_index_filepath).share(name)
+    print(f"shared inverted index {inverted_index_filepath} as {memory.name} ({memory.size} bytes), "
+          "stop with SIGINT or SIGTERM", file=sys.stderr)
+    stopped = []
+    previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+    try:
+        while not stopped:
+            signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        memory.close()
+        memory.unlink()
+    print(f"removed shared inverted index {memory.name}", file=sys.stderr)
+
+
+def callback_stats(arguments):
+    """Callback for stats specifier: report index statistics without loading the index"""
+    return process_stats(arguments.inverted_index_filepath, top=arguments.top, scan=arguments.scan,
+                         as_json=arguments.as_json)
+
+
+def process_stats(inverted_index_filepath, top=DEFAULT_STATS_TOP, scan=False, as_json=False):
+    statistics = index_statistics(inverted_index_filepath, top=top, scan=scan)
+    if as_json:
+        print(json.dumps(statistics, indent=2))
+    else:
+        print_index_statistics(statistics)
+
+
+def callback_compare(arguments):
+    """Callback for compare specifier: size, dump and load time of every storage strategy"""
+    return process_compare(arguments.dataset_filepath, strategies=arguments.strategies)
+
+
+def process_compare(dataset_filepath, strategies=tuple(STORAGE_WRITERS)):
+    inverted_index = build_inverted_index(load_documents(dataset_filepath))
+    print("strategy\tbytes\tdump_ms\tload_ms")
+    for result in compare_storage(inverted_index, strategies):
+        print(f"{result['strategy']}\t{result['bytes']}\t{result['dump_ms']:.3f}\t{result['load_ms']:.3f}")
 
 
 def callback_query(arguments):
@@ -191,23 +3511,203 @@ def callback_query(arguments):
     print(f"call query subcommand with arguments: {arguments}", file=sys.stderr)
     return process_queries(inverted_index_filepath=arguments.inverted_index_filepath,
                            query=arguments.query,
-                           query_file=arguments.query_file)
+                           query_file=arguments.query_file,
+                           cache_size=getattr(arguments, "cache_size", 0),
+                           batch_size=getattr(arguments, "batch_size", 0),
+                           compact=getattr(arguments, "compact", False),
+                           top_k=getattr(arguments, "top_k", None),
+                           phrase=getattr(arguments, "phrase", False),
+                           slop=getattr(arguments, "slop", 0),
+                           near=getattr(arguments, "near", None),
+                           boolean=getattr(arguments, "boolean", False),
+                           shared_memory_name=getattr(arguments, "shared_memory_name", None),
+                           shard_processes=getattr(arguments, "shard_processes", False),
+                           store_filepath=getattr(arguments, "store_filepath", None),
+                           snippets=getattr(arguments, "snippets", DEFAULT_SNIPPETS),
+                           jobs=getattr(arguments, "jobs", 1),
+                           chunk_size=getattr(arguments, "chunk_size", DEFAULT_QUERY_CHUNK),
+                           verbose=not getattr(arguments, "quiet", False))
+
+
+def _read_chunks(query_file, chunk_size: int) -> Iterator[List[str]]:
+    """Split the query file into chunks of lines"""
+    chunk = []
+    for line in query_file:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _open_query_index(inverted_index_filepath, shared_memory_name=None, shard_processes=False,
+                      compact=False, cache_size=0) -> InvertedIndex:
+    if shared_memory_name is not None:
+        inverted_index = InvertedIndex.attach(shared_memory_name)
+    elif shard_processes:
+        inverted_index = ShardedInvertedIndex(inverted_index_filepath, processes=True)
+    else:
+        inverted_index = InvertedIndex.load(inverted_index_filepath)
+    if compact and isinstance(inverted_index.index, dict):
+        inverted_index = inverted_index.compact()
+    if cache_size > 0:
+        inverted_index.cache = QueryCache(max_entries=cache_size)
+    return inverted_index
+
+
+class _QueryRunner:
+    """Answer queries in the mode chosen for process_queries and format the answers,
+    one line of doc ids per query followed by snippets when a document store is given.
+    """
+
+    def __init__(self, inverted_index: InvertedIndex, top_k=None, phrase=False, slop=0, near=None,
+                 boolean=False, store_filepath=None, snippets=DEFAULT_SNIPPETS, batch_size=0, verbose=True):
+        self.inverted_index = inverted_index
+        self.token_pattern = BOOLEAN_TOKEN_PATTERN if boolean else QUERY_TOKEN_PATTERN
+        self.store = DocumentStore(store_filepath) if store_filepath is not None else None
+        self.snippets = snippets
+        self.verbose = verbose
+        self.batched = False
+        if boolean:
+            self.answer = lambda words: inverted_index.query_boolean(" ".join(words))
+        elif phrase:
+            self.answer = lambda words: inverted_index.query_phrase(words, slop=slop)
+        elif near is not None:
+            self.answer = lambda words: inverted_index.query_near(words, distance=near)
+        elif top_k:
+            self.answer = lambda words: [doc_id for doc_id, _ in inverted_index.query_top_k(words, k=top_k)]
+        else:
+            self.answer = inverted_index.query
+            self.batched = batch_size > 0
+
+    def format(self, words: List[str], document_ids: Sequence[int]) -> str:
+        lines = [','.join(map(str, document_ids))]
+        if self.store is not None:
+            for doc_id in document_ids[:self.snippets]:
+                if doc_id in self.store:
+                    lines.append(f"{doc_id}\t{self.store.snippet(doc_id, words, self.inverted_index.analyzer)}")
+        return "\n".join(lines) + "\n"
+
+    def answer_lines(self, lines: List[str]) -> str:
+        """Answer query file lines, in one query_many batch when batched, and return the formatted answers"""
+        queries = [self.token_pattern.findall(line.strip()) for line in lines]
+        if self.batched:
+            if self.verbose:
+                print(f"run a batch of {len(queries)} queries against InvertedIndex", file=sys.stderr)
+            answers = self.inverted_index.query_many(queries)
+        else:
+            answers = []
+            for words in queries:
+                if self.verbose:
+                    print(f"use the following query to run against InvertedIndex: {words}", file=sys.stderr)
+                answers.append(self.answer(words))
+        return "".join(self.format(words, document_ids) for words, document_ids in zip(queries, answers))
 
 
-def process_queries(inverted_index_filepath, query_file, query=None):
-    """Read queries from filepath specified in arguments"""
-    inverted_index = InvertedIndex.load(inverted_index_filepath)
+# query runner of a --jobs worker process
+_WORKER_QUERIES: Optional[_QueryRunner] = None
+
+
+def _init_query_worker(index_options: dict, runner_options: dict) -> None:
+    global _WORKER_QUERIES
+    _WORKER_QUERIES = _QueryRunner(_open_query_index(**index_options), **runner_options)
+
+
+def _worker_answer_lines(lines: List[str]) -> Tuple[str, int, int]:
+    """Answer a chunk and return the query cache hits and misses it made"""
+    cache = _WORKER_QUERIES.inverted_index.cache
+    if cache is None:
+        return _WORKER_QUERIES.answer_lines(lines), 0, 0
+    hits, misses = cache.hits, cache.misses
+    answers = _WORKER_QUERIES.answer_lines(lines)
+    return answers, cache.hits - hits, cache.misses - misses
+
+
+def _run_query_jobs(query_file, jobs: int, chunk_size: int, output: TextIO,
+                    index_options: dict, runner_options: dict) -> QueryCache:
+    """
+    Answer chunks of the query file in a pool of jobs worker processes, each with
+    its own runner over the loaded or attached index; answers are written in input
+    order, at most two chunks per worker are in flight.
+    Return an empty QueryCache holding the hit and miss counters summed over workers.
+    """
+    totals = QueryCache(max_entries=0)
+
+    def write(future) -> None:
+        answers, hits, misses = future.result()
+        output.write(answers)
+        totals.hits += hits
+        totals.misses += misses
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_query_worker,
+                             initargs=(index_options, runner_options)) as executor:
+        pending = deque()
+        for chunk in _read_chunks(query_file, chunk_size):
+            pending.append(executor.submit(_worker_answer_lines, chunk))
+            if len(pending) >= 2 * jobs:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+    return totals
+
+
+def process_queries(inverted_index_filepath, query_file, query=None, cache_size=0, batch_size=0,
+                    compact=False, top_k=None, phrase=False, slop=0, near=None, boolean=False,
+                    shared_memory_name=None, shard_processes=False, store_filepath=None,
+                    snippets=DEFAULT_SNIPPETS, jobs=1, chunk_size=DEFAULT_QUERY_CHUNK, verbose=True):
+    """
+    Read queries from filepath specified in arguments.
+    With top_k every query returns its top_k documents ranked by BM25, best first.
+    With phrase every query matches its words in order with at most slop tokens between them,
+    with near every query matches its words in any order within a window of near tokens.
+    With boolean every query is an expression with AND, OR, NOT operators and parentheses.
+    With compact eagerly loaded postings are packed into a CSR layout.
+    With positive cache_size repeated queries are answered from an LRU cache
+    and its hit and miss counters, summed over jobs, are printed to stderr at the end.
+    With positive batch_size the query file is answered in batches by query_many.
+    With shared_memory_name the index published by the share subcommand is attached instead of loaded.
+    With shard_processes every shard of a sharded index is queried by its own worker process.
+    With store_filepath every answer is followed by "doc_id<TAB>snippet" lines
+    of its first snippets documents read from the document store.
+    With jobs above one chunks of chunk_size query file lines are answered by worker
+    processes, each loading (mmap indexes share pages) or attaching the index.
+    Without verbose queries are not echoed to stderr.
+    Options that would be ignored in the chosen mode are rejected with ValueError.
+    """
+    if jobs > 1 and shard_processes:
+        raise ValueError("jobs and shard processes can not be combined, every job would start its shards")
+    if jobs > 1 and query:
+        raise ValueError("jobs split the query file into chunks and can not be combined with queries given by -q")
+    if batch_size > 0 and (top_k or phrase or near is not None or boolean):
+        raise ValueError("batch size only batches plain conjunctive queries, "
+                         "it can not be combined with top_k, phrase, near or boolean queries")
+    index_options = dict(inverted_index_filepath=inverted_index_filepath, shared_memory_name=shared_memory_name,
+                         shard_processes=shard_processes, compact=compact, cache_size=cache_size)
+    runner_options = dict(top_k=top_k, phrase=phrase, slop=slop, near=near, boolean=boolean,
+                          store_filepath=store_filepath, snippets=snippets, batch_size=batch_size, verbose=verbose)
+    output = sys.stdout
+    if jobs > 1:
+        totals = _run_query_jobs(query_file, jobs, chunk_size if batch_size <= 0 else batch_size, output,
+                                 index_options, runner_options)
+        output.flush()
+        if cache_size > 0:
+            print(totals.stats(), file=sys.stderr)
+        return
+    inverted_index = _open_query_index(**index_options)
+    runner = _QueryRunner(inverted_index, **runner_options)
     if not query:
-        for q in query_file:
-            q = q.strip()
-            q = re.findall(r'\w+', q)
-            print(f"use the following query to run against InvertedIndex: {q}", file=sys.stderr)
-            document_ids = inverted_index.query(q)
-            print(','.join(map(str, document_ids)))
+        # without batches every line is answered before the next one is read, as for interactive input
+        for lines in _read_chunks(query_file, batch_size if runner.batched else 1):
+            output.write(runner.answer_lines(lines))
     else:
         for q in query:
-            document_ids = inverted_index.query(q)
-            print(','.join(map(str, document_ids)))
+            output.write(runner.format(q, runner.answer(q)))
+    output.flush()
+    if inverted_index.cache is not None:
+        print(inverted_index.cache.stats(), file=sys.stderr)
+    if isinstance(inverted_index, ShardedInvertedIndex):
+        inverted_index.close()
 
 
 def setup_parser(parser):
@@ -223,9 +3723,9 @@ def setup_parser(parser):
     )
     build_parser.add_argument(
         "-s", "--strategy",
-        choices=["json", "struct"],
+        choices=list(STORAGE_WRITERS),
         default="struct",
-        help="choose the strategy: json or struct (by default)",
+        help="choose the storage strategy, mmap indexes are loaded lazily",
     )
     build_parser.add_argument(
         "-d", "--dataset",
@@ -239,6 +3739,58 @@ def setup_parser(parser):
         default=DEFAULT_INVERTED_INDEX_STORE_PATH,
         help="path to store inverted index in a binary format, default path is %(default)s",
     )
+    build_parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=1,
+        help="number of processes building partial indexes from byte ranges of the dataset",
+    )
+    build_parser.add_argument(
+        "-m", "--max-memory",
+        type=parse_memory_size,
+        default=None,
+        help="stream the dataset and spill index blocks to disk above this budget, e.g. 512M",
+    )
+    build_parser.add_argument(
+        "-f", "--frequencies", action="store_true",
+        help="store term frequencies and document lengths for --top-k queries (mmap, varbyte, roaring)",
+    )
+    build_parser.add_argument(
+        "--stop-words", type=load_stop_words, default=None,
+        help="drop these words from the index: \"english\" or a file with one word per line",
+    )
+    build_parser.add_argument(
+        "--min-length", type=int, default=1,
+        help="drop terms shorter than this",
+    )
+    build_parser.add_argument(
+        "--max-length", type=int, default=0,
+        help="drop terms longer than this, 0 keeps all",
+    )
+    build_parser.add_argument(
+        "--stemmer", choices=list(STEMMERS), default=None,
+        help="stem terms, s strips English plural endings",
+    )
+    build_parser.add_argument(
+        "--shards", type=int, default=0,
+        help="split the index into this many shard files in the output directory, 0 writes one file",
+    )
+    build_parser.add_argument(
+        "--partition", choices=list(SHARD_PARTITIONS), default="term",
+        help="partition shards by term hash or by doc id range",
+    )
+    build_parser.add_argument(
+        "-p", "--positions", action="store_true",
+        help="store token positions for --phrase and --near queries (mmap, varbyte, roaring)",
+    )
+    build_parser.add_argument(
+        "--store", dest="store_filepath", default=None,
+        help="also write a document store at this path for query --store snippets",
+    )
+    build_parser.add_argument(
+        "--compress-store", action="store_true",
+        help="keep zlib compressed documents in the store instead of offsets into the dataset",
+    )
     build_parser.set_defaults(callback=callback_build)
 
     query_parser = subparsers.add_parser(
@@ -254,9 +3806,9 @@ def setup_parser(parser):
     )
     query_parser.add_argument(
         "-s", "--strategy",
-        choices=["json", "struct"],
-        default="struct",
-        help="choose the strategy: json or struct (by default)",
+        choices=list(STORAGE_WRITERS),
+        default=None,
+        help="ignored, the storage strategy is detected from the magic header of the index file",
     )
     query_file_group = query_parser.add_mutually_exclusive_group(required=True)
     query_file_group.add_argument(
@@ -274,10 +3826,225 @@ def setup_parser(parser):
     query_file_group.add_argument(
         "-q", "--query", nargs="+",
         action="append",
-        help="query to run against inverted index",
+        help="query to run against inverted index, words may use * wildcards like pyth*",
+    )
+    query_parser.add_argument(
+        "--shared-memory", dest="shared_memory_name", default=None, metavar="NAME",
+        help="attach the index kept in shared memory by the share subcommand instead of loading --index",
+    )
+    query_parser.add_argument(
+        "--shard-processes", action="store_true",
+        help="query every shard of a sharded index in its own worker process",
+    )
+    query_parser.add_argument(
+        "--cache-size", type=int, default=0,
+        help="number of query results kept in an LRU cache, 0 disables the cache",
+    )
+    query_parser.add_argument(
+        "--batch-size", type=int, default=0,
+        help="answer the query file in batches of this size sharing term postings, 0 disables batching; "
+             "plain queries only, not with --top-k, --phrase, --near or --boolean",
+    )
+    query_parser.add_argument(
+        "--compact", action="store_true",
+        help="keep loaded postings in contiguous arrays instead of lists of ints",
+    )
+    query_parser.add_argument(
+        "-k", "--top-k", type=int, default=None,
+        help="return only this many documents ranked by BM25, needs an index built with --frequencies",
+    )
+    query_mode_group = query_parser.add_mutually_exclusive_group()
+    query_mode_group.add_argument(
+        "--phrase", action="store_true",
+        help="match query words as a phrase, needs an index built with --positions",
+    )
+    query_mode_group.add_argument(
+        "--near", type=int, default=None, metavar="DISTANCE",
+        help="match query words in any order within a window of DISTANCE tokens",
+    )
+    query_mode_group.add_argument(
+        "-b", "--boolean", action="store_true",
+        help="read every query as an expression with AND, OR, NOT and parentheses",
+    )
+    query_parser.add_argument(
+        "--slop", type=int, default=0,
+        help="number of other tokens allowed between neighbouring words of a --phrase query",
+    )
+    query_parser.add_argument(
+        "--store", dest="store_filepath", default=None,
+        help="document store written by build --store, answers are followed by snippets",
+    )
+    query_parser.add_argument(
+        "--snippets", type=int, default=DEFAULT_SNIPPETS,
+        help="number of documents of every answer shown with a snippet",
+    )
+    query_parser.add_argument(
+        "-j", "--jobs", type=int, default=1,
+        help="answer the query file in this many worker processes, answers keep the input order; "
+             "mmap indexes or --shared-memory keep one copy of postings for all workers; not with -q",
+    )
+    query_parser.add_argument(
+        "--chunk-size", type=int, default=DEFAULT_QUERY_CHUNK,
+        help="number of query file lines sent to a worker at once with --jobs",
+    )
+    query_parser.add_argument(
+        "--quiet", action="store_true",
+        help="do not echo every query to stderr",
     )
     query_parser.set_defaults(callback=callback_query)
 
+    add_parser = subparsers.add_parser(
+        "add",
+        help="add or replace documents of a segmented inverted index directory",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    add_parser.add_argument(
+        "--index",
+        default=DEFAULT_INVERTED_INDEX_STORE_PATH,
+        dest='inverted_index_dirpath',
+        help="directory of the segmented inverted index, created if missing",
+    )
+    add_parser.add_argument(
+        "-d", "--dataset",
+        dest='dataset_filepath',
+        required=True,
+        help="path to dataset with new or changed documents",
+    )
+    add_parser.set_defaults(callback=callback_add)
+
+    delete_parser = subparsers.add_parser(
+        "delete",
+        help="delete documents from a segmented inverted index directory",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    delete_parser.add_argument(
+        "--index",
+        default=DEFAULT_INVERTED_INDEX_STORE_PATH,
+        dest='inverted_index_dirpath',
+        help="directory of the segmented inverted index",
+    )
+    delete_parser.add_argument(
+        "--doc-id", nargs="+", type=int,
+        dest='doc_ids',
+        required=True,
+        help="ids of documents to delete",
+    )
+    delete_parser.set_defaults(callback=callback_delete)
+
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help="merge segments of a segmented inverted index directory",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    merge_parser.add_argument(
+        "--index",
+        default=DEFAULT_INVERTED_INDEX_STORE_PATH,
+        dest='inverted_index_dirpath',
+        help="directory of the segmented inverted index",
+    )
+    merge_parser.add_argument(
+        "--max-segments", type=int, default=1,
+        help="number of segments to keep after merging",
+    )
+    merge_parser.set_defaults(callback=callback_merge)
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="keep the inverted index loaded and answer one query per line over a socket",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    serve_parser.add_argument(
+        "--index",
+        default=DEFAULT_INVERTED_INDEX_STORE_PATH,
+        dest='inverted_index_filepath',
+        help="path to read inverted index from, reloaded when it changes",
+    )
+    serve_parser.add_argument(
+        "--host", default=DEFAULT_SERVE_HOST,
+        help="address to listen on",
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=DEFAULT_SERVE_PORT,
+        help="TCP port to listen on",
+    )
+    serve_parser.add_argument(
+        "--unix", dest="unix_path", default=None,
+        help="listen on this Unix socket path instead of TCP",
+    )
+    serve_parser.add_argument(
+        "--cache-size", type=int, default=0,
+        help="number of query results kept in an LRU cache, 0 disables the cache",
+    )
+    serve_parser.add_argument(
+        "-b", "--boolean", action="store_true",
+        help="read every query as an expression with AND, OR, NOT and parentheses",
+    )
+    serve_parser.add_argument(
+        "--reload-interval", type=float, default=DEFAULT_RELOAD_INTERVAL,
+        help="seconds between checks of the index for changes, 0 disables reloading",
+    )
+    serve_parser.set_defaults(callback=callback_serve)
+
+    share_parser = subparsers.add_parser(
+        "share",
+        help="load the inverted index once into shared memory for worker processes to attach",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    share_parser.add_argument(
+        "--index",
+        default=DEFAULT_INVERTED_INDEX_STORE_PATH,
+        dest='inverted_index_filepath',
+        help="path to read inverted index from",
+    )
+    share_parser.add_argument(
+        "--name", default=DEFAULT_SHARED_MEMORY_NAME,
+        help="name of the shared memory block, workers attach with InvertedIndex.attach(name)",
+    )
+    share_parser.set_defaults(callback=callback_share)
+
+    stats_parser = subparsers.add_parser(
+        "stats",
+        help="report vocabulary size, posting lengths, section sizes and memory estimates of an index",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    stats_parser.add_argument(
+        "--index",
+        default=DEFAULT_INVERTED_INDEX_STORE_PATH,
+        dest='inverted_index_filepath',
+        help="path to the index file or directory, read through mmap without loading postings",
+    )
+    stats_parser.add_argument(
+        "--top", type=int, default=DEFAULT_STATS_TOP,
+        help="number of terms with the longest postings to show",
+    )
+    stats_parser.add_argument(
+        "--scan", action="store_true",
+        help="decode every posting list once to size the varbyte and roaring encodings",
+    )
+    stats_parser.add_argument(
+        "--json", dest="as_json", action="store_true",
+        help="print the statistics as json",
+    )
+    stats_parser.set_defaults(callback=callback_stats)
+
+    compare_parser = subparsers.add_parser(
+        "compare",
+        help="report index size, dump and load time of every storage strategy on a dataset",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    compare_parser.add_argument(
+        "-d", "--dataset",
+        dest='dataset_filepath',
+        default=DEFAULT_DATASET_PATH,
+        help="path to dataset to build the compared indexes from",
+    )
+    compare_parser.add_argument(
+        "--strategies", nargs="+", choices=list(STORAGE_WRITERS),
+        default=list(STORAGE_WRITERS),
+        help="storage strategies to compare",
+    )
+    compare_parser.set_defaults(callback=callback_compare)
+
 
 def main():
     """For example"""
@@ -1,4 +1,5 @@
 import os.path
+from bisect import bisect_left
 from argparse import Namespace
 
 import pytest
@@ -7,6 +8,22 @@ from task_Boriskin_Makary_inverted_index import InvertedIndex, load_documents, b
 from task_Boriskin_Makary_inverted_index import callback_query, process_queries
 from task_Boriskin_Makary_inverted_index import callback_build, process_build
 from task_Boriskin_Makary_inverted_index import DEFAULT_INVERTED_INDEX_STORE_PATH
+from task_Boriskin_Makary_inverted_index import intersect_postings, MappedPostings
+from task_Boriskin_Makary_inverted_index import encode_varbyte, decode_varbyte
+from task_Boriskin_Makary_inverted_index import build_inverted_index_parallel
+from task_Boriskin_Makary_inverted_index import build_inverted_index_streaming, parse_memory_size
+from task_Boriskin_Makary_inverted_index import SegmentedInvertedIndex, process_add, process_merge
+from task_Boriskin_Makary_inverted_index import QueryCache, CompactPostings, HybridPostings
+from task_Boriskin_Makary_inverted_index import encode_positions, PositionsBlock
+from task_Boriskin_Makary_inverted_index import parse_boolean_query, QueryNode
+from task_Boriskin_Makary_inverted_index import QueryServer
+from task_Boriskin_Makary_inverted_index import ShardedInvertedIndex, write_sharded_index
+from task_Boriskin_Makary_inverted_index import Analyzer, ENGLISH_STOP_WORDS
+from task_Boriskin_Makary_inverted_index import index_statistics, process_stats
+from task_Boriskin_Makary_inverted_index import DocumentStore, write_document_store
+from task_Boriskin_Makary_inverted_index import process_compare, STORAGE_WRITERS
+from task_Boriskin_Makary_inverted_index import SkipPostings
+import task_Boriskin_Makary_inverted_index
 
 DEFAULT_TEST_INVERTED_INDEX_STORE_PATH = 'inverted_index_test'
 DEFAULT_TEST_QUERIES_STORE_PATH = 'queries.txt'
@@ -137,6 +154,857 @@ def test_find_documents_by_specified_words():
     )
 
 
+@pytest.mark.parametrize('strategy', ['json', 'struct', 'mmap', 'varbyte', 'roaring', 'pickle'])
+def test_dump_and_load_inverted_index_with_strategy(strategy, tmp_path):
+    documents = load_documents(filepath='test_dataset.txt')
+    inverted = build_inverted_index(documents=documents)
+    index_filepath = str(tmp_path / 'inverted.index')
+    inverted.dump(filepath=index_filepath, strategy=strategy)
+    loaded = InvertedIndex.load(filepath=index_filepath)
+    assert inverted == loaded, (
+        f"InvertedIndex loaded with {strategy} strategy differs from the built one"
+    )
+    assert [3] == loaded.query(['blue', 'sky'])
+
+
+def test_mmap_index_decodes_postings_lazily(tmp_path):
+    inverted = InvertedIndex(index={"big": [1, 70000, 2 ** 33], "small": [70000], "the": [1, 2]})
+    index_filepath = str(tmp_path / 'inverted.index')
+    inverted.dump(filepath=index_filepath, strategy='mmap')
+    loaded = InvertedIndex.load(filepath=index_filepath)
+    assert isinstance(loaded.index, MappedPostings)
+    assert 2 == loaded.index.posting_length('the')
+    assert 'absent' not in loaded.index
+    assert ['big', 'small', 'the'] == list(loaded.index)
+    assert [70000] == loaded.query(['big', 'small'])
+    assert inverted == loaded
+
+
+@pytest.mark.parametrize('workers', [2, 3, 8])
+def test_parallel_build_matches_single_process_build(workers, tmp_path):
+    dataset_filepath = tmp_path / 'dataset.txt'
+    with open(dataset_filepath, 'w', encoding='utf8') as fout:
+        for doc_id in range(1, 41):
+            fout.write(f"{doc_id}\tTitle {doc_id % 7}\tword{doc_id % 5} common Word{doc_id % 3}\n")
+    expected = build_inverted_index(load_documents(filepath=str(dataset_filepath)))
+    inverted = build_inverted_index_parallel(str(dataset_filepath), workers=workers)
+    assert expected == inverted, (
+        f"parallel build with {workers} workers differs from the single process build"
+    )
+    assert list(range(1, 41)) == inverted.index['common']
+
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+def test_parallel_build_keeps_last_line_of_repeated_doc_id(workers, tmp_path):
+    dataset_filepath = tmp_path / 'dataset.txt'
+    with open(dataset_filepath, 'w', encoding='utf8') as fout:
+        fout.write("1\tfoo bar\n2\tbaz\n1\tqux\n3\tfoo\n3\tfoo baz\n")
+    expected = build_inverted_index(load_documents(filepath=str(dataset_filepath)))
+    assert {"qux": [1], "baz": [2, 3], "foo": [3]} == expected.index
+    assert expected == build_inverted_index_parallel(str(dataset_filepath), workers=workers)
+
+
+def test_process_build_with_workers_writes_same_index(tmp_path):
+    single_filepath = str(tmp_path / 'single.index')
+    parallel_filepath = str(tmp_path / 'parallel.index')
+    process_build('mmap', DATASET_SMALL_FILEPATH, single_filepath)
+    process_build('mmap', DATASET_SMALL_FILEPATH, parallel_filepath, workers=2)
+    with open(single_filepath, 'rb') as single, open(parallel_filepath, 'rb') as parallel:
+        assert single.read() == parallel.read()
+
+
+@pytest.mark.parametrize('max_memory', [1, 2000, 10 ** 9])
+def test_streaming_build_matches_in_memory_build(max_memory, tmp_path):
+    dataset_filepath = tmp_path / 'dataset.txt'
+    with open(dataset_filepath, 'w', encoding='utf8') as fout:
+        for doc_id in [5, 3, 70000, 1, 8, 2, 4]:
+            fout.write(f"{doc_id}\tTitle\tword{doc_id % 3} common Word{doc_id % 2}\n")
+    expected = build_inverted_index(load_documents(filepath=str(dataset_filepath)))
+    index_filepath = str(tmp_path / 'inverted.index')
+    build_inverted_index_streaming(str(dataset_filepath), index_filepath,
+                                   strategy='varbyte', max_memory=max_memory)
+    inverted = InvertedIndex.load(index_filepath)
+    assert expected == inverted, (
+        f"streaming build with max_memory={max_memory} differs from the in-memory build"
+    )
+    assert [1, 2, 3, 4, 5, 8, 70000] == list(inverted.index['common'])
+    assert ['inverted.index', 'dataset.txt'] == sorted(os.listdir(tmp_path), reverse=True)
+
+
+@pytest.mark.parametrize('max_memory', [1, 700, 10 ** 9])
+def test_streaming_build_keeps_last_line_of_repeated_doc_id(max_memory, tmp_path):
+    dataset_filepath = tmp_path / 'dataset.txt'
+    with open(dataset_filepath, 'w', encoding='utf8') as fout:
+        fout.write("1\tfoo bar\n2\tbaz\n1\tqux\n3\tfoo\n3\tfoo baz\n1\tqux quux\n4\tbaz\n4\t\n")
+    expected = build_inverted_index(load_documents(filepath=str(dataset_filepath)))
+    assert {"qux": [1], "quux": [1], "baz": [2, 3], "foo": [3]} == expected.index
+    index_filepath = str(tmp_path / 'inverted.index')
+    build_inverted_index_streaming(str(dataset_filepath), index_filepath, strategy='varbyte', max_memory=max_memory)
+    assert expected == InvertedIndex.load(index_filepath)
+
+
+def test_streaming_build_drops_replaced_doc_ids_of_long_runs(tmp_path):
+    dataset_filepath = tmp_path / 'dataset.txt'
+    with open(dataset_filepath, 'w', encoding='utf8') as fout:
+        for doc_id in range(1, 20001):
+            fout.write(f"{doc_id}\tcommon\n")
+        fout.write("9000\trewritten\n15000\t\n")
+    expected = build_inverted_index(load_documents(filepath=str(dataset_filepath)))
+    index_filepath = str(tmp_path / 'inverted.index')
+    build_inverted_index_streaming(str(dataset_filepath), index_filepath, strategy='varbyte', max_memory=600000)
+    inverted = InvertedIndex.load(index_filepath)
+    assert expected == inverted
+    assert 19998 == len(inverted.index["common"]) and [9000] == list(inverted.index["rewritten"])
+
+
+def test_parse_memory_size():
+    assert 512 == parse_memory_size("512")
+    assert 3 * 1024 ** 2 == parse_memory_size("3M")
+    assert 2 * 1024 ** 3 == parse_memory_size("2gb")
+
+
+def test_segmented_index_adds_replaces_and_deletes_documents(tmp_path):
+    index_dirpath = str(tmp_path / 'segmented.index')
+    process_add(index_dirpath, DATASET_SMALL_FILEPATH)
+    segmented = SegmentedInvertedIndex(index_dirpath)
+    segmented.add_documents({4: "blue whale", 1: "a grey butterfly under the sky"})
+    assert 2 == len(segmented.segments)
+    assert [3, 4] == segmented.query(['blue'])
+    assert [1, 2, 3] == segmented.query(['sky'])
+    assert 1 == segmented.delete_documents([2, 100])
+
+    reopened = InvertedIndex.load(index_dirpath)
+    assert [1, 3] == reopened.query(['sky'])
+    assert [1] == reopened.query(['butterfly', 'sky'])
+    assert 'forget' not in reopened.index
+    expected = build_inverted_index({
+        1: "a grey butterfly under the sky",
+        3: load_documents(DATASET_SMALL_FILEPATH)[3],
+        4: "blue whale",
+    })
+    assert expected == reopened
+
+    process_merge(index_dirpath)
+    merged = SegmentedInvertedIndex(index_dirpath)
+    assert 1 == len(merged.segments)
+    assert expected == merged
+    assert ['manifest.json', 'segment-000003.docs', 'segment-000003.index'] == sorted(os.listdir(index_dirpath))
+
+
+def test_segmented_index_merges_segments_above_merge_factor(tmp_path):
+    segmented = SegmentedInvertedIndex(str(tmp_path / 'segmented.index'), merge_factor=3)
+    for doc_id in range(1, 8):
+        segmented.add_documents({doc_id: f"common word{doc_id}"})
+    assert len(segmented.segments) <= 3
+    assert list(range(1, 8)) == segmented.query(['common'])
+    assert [5] == SegmentedInvertedIndex(segmented.directory).query(['word5', 'common'])
+
+
+def test_query_cache_counts_hits_and_evicts_least_recently_used():
+    inverted = build_inverted_index(load_documents(filepath='test_dataset.txt'))
+    inverted.cache = QueryCache(max_entries=2)
+    assert [3] == inverted.query(['blue', 'sky'])
+    assert [3] == inverted.query(['sky', 'blue', 'sky'])
+    assert [1, 3] == inverted.query(['bright'])
+    assert [2] == inverted.query(['forget'])
+    assert [3] == inverted.query(['blue', 'sky'])
+    assert (1, 4) == (inverted.cache.hits, inverted.cache.misses)
+    assert 2 == len(inverted.cache)
+    assert "hit rate 20.0%" in inverted.cache.stats()
+    inverted.index['blue'].append(4)
+    inverted.index['sky'].append(4)
+    inverted.generation += 1
+    assert [3, 4] == inverted.query(['blue', 'sky'])
+
+
+def test_query_cache_replaces_entries_of_stored_key():
+    cache = QueryCache(max_entries=2, max_postings=5)
+    for result in [[1, 2, 3], [1, 2, 3, 4], [1]]:
+        cache.put(cache.key(['blue']), result)
+    cache.put(cache.key(['sky']), [2, 3, 4, 5])
+    assert [1] == cache.get(cache.key(['blue']), None)
+    assert [2, 3, 4, 5] == cache.get(cache.key(['sky']), None)
+    cache.put(cache.key(['sky']), list(range(10)))
+    assert cache.get(cache.key(['sky']), None) is None and 1 == len(cache)
+
+
+def test_query_cache_is_invalidated_when_segments_change(tmp_path):
+    segmented = SegmentedInvertedIndex(str(tmp_path / 'segmented.index'))
+    segmented.cache = QueryCache()
+    segmented.add_documents({1: "blue sky"})
+    assert [1] == segmented.query(['blue'])
+    segmented.add_documents({2: "blue sea"})
+    assert [1, 2] == segmented.query(['blue'])
+    segmented.delete_documents([1])
+    assert [2] == segmented.query(['blue'])
+    assert 0 == segmented.cache.hits
+
+
+def test_hybrid_postings_switch_dense_chunks_to_bitmaps():
+    dense = list(range(0, 20000, 2)) + list(range(70000, 70100)) + [2 ** 40]
+    sparse = list(range(1, 200000, 3))
+    dense_postings = HybridPostings.from_sorted(dense)
+    sparse_postings = HybridPostings.from_sorted(sparse)
+    assert dense_postings.has_bitmaps
+    assert dense == list(dense_postings)
+    assert len(dense) == len(dense_postings)
+    assert 2 ** 40 == dense_postings[-1] and 70000 == dense_postings[10000]
+    assert 70001 in dense_postings and 70101 not in dense_postings
+    expected = sorted(set(dense) & set(sparse))
+    assert expected == list(dense_postings.intersection(sparse_postings))
+    assert expected == intersect_postings([sparse, dense_postings])
+    assert dense == list(HybridPostings.frombytes(dense_postings.tobytes()))
+
+
+def test_hybrid_index_answers_same_queries(tmp_path):
+    index = {
+        "the": list(range(1, 30001)),
+        "of": list(range(1, 30001, 2)),
+        "rare": [3, 5, 29999, 40000],
+    }
+    inverted = InvertedIndex(index=index)
+    hybrid = inverted.hybrid()
+    assert isinstance(hybrid.index['the'], HybridPostings)
+    assert not isinstance(hybrid.index['rare'], HybridPostings)
+    index_filepath = str(tmp_path / 'inverted.index')
+    inverted.dump(index_filepath, strategy='roaring')
+    loaded = InvertedIndex.load(index_filepath)
+    assert isinstance(loaded.index['of'], HybridPostings)
+    for words in [['the', 'of'], ['the', 'rare'], ['of', 'rare', 'the'], ['rare']]:
+        assert inverted.query(words) == hybrid.query(words) == loaded.query(words)
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_compact_index_answers_same_queries(use_numpy, monkeypatch):
+    if not use_numpy:
+        monkeypatch.setattr(task_Boriskin_Makary_inverted_index, 'numpy', None)
+    elif task_Boriskin_Makary_inverted_index.numpy is None:
+        pytest.skip("numpy is not installed")
+    inverted = build_inverted_index(load_documents(filepath='test_dataset.txt'))
+    compact = inverted.compact()
+    assert isinstance(compact.index, CompactPostings)
+    assert inverted == compact
+    assert 2 == compact.index.posting_length('sky')
+    for words in [['blue', 'sky'], ['bright', 'blue'], ['butterfly', 'forget'], ['absent']]:
+        assert inverted.query(words) == compact.query(words)
+
+
+@pytest.mark.parametrize('layout', ['dict', 'compact', 'mmap', 'segmented'])
+def test_wildcard_queries_expand_sorted_term_dictionary(layout, tmp_path):
+    inverted = build_inverted_index(load_documents(filepath='test_dataset.txt'))
+    if layout == 'compact':
+        inverted = inverted.compact()
+    elif layout == 'mmap':
+        inverted.dump(str(tmp_path / 'inverted.index'), strategy='mmap')
+        inverted = InvertedIndex.load(str(tmp_path / 'inverted.index'))
+    elif layout == 'segmented':
+        inverted = SegmentedInvertedIndex(str(tmp_path / 'segmented.index'))
+        documents = load_documents(filepath='test_dataset.txt')
+        inverted.add_documents({1: documents[1]})
+        inverted.add_documents({2: documents[2], 3: documents[3]})
+    assert ['better', 'bright', 'butterfly'] == inverted.expand_term('b*t*')
+    assert ['better', 'blue', 'breeze', 'bright', 'butterfly'] == inverted.expand_term('b*')
+    assert ['sky'] == inverted.expand_term('*ky')
+    assert [1, 3] == inverted.query(['b*t'])
+    assert [2, 3] == inverted.query(['s*y', 'sk*'])
+    assert [3] == inverted.query(['sun*', 'b*'])
+    assert [] == inverted.query(['xyz*', 'sky'])
+    assert [[1, 3], []] == inverted.query_many([['bri*'], ['zz*']])
+
+
+def _brute_force_bm25(inverted, words, k, k1=1.2, b=0.75):
+    import math
+    lengths = inverted.doc_lengths
+    average_length = sum(lengths.values()) / len(lengths)
+    scores = {}
+    for term in dict.fromkeys(words):
+        if term not in inverted.index:
+            continue
+        doc_ids = list(inverted.index[term])
+        idf = math.log(1 + (len(lengths) - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+        for doc_id, frequency in zip(doc_ids, inverted.frequencies[term]):
+            norm = k1 * (1 - b + b * lengths[doc_id] / average_length)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (k1 + 1) / (frequency + norm)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+def test_build_inverted_index_keeps_term_frequencies():
+    inverted = build_inverted_index({2: "to be or not to be", 1: "be quick"}, frequencies=True)
+    assert [1, 2] == inverted.index['be']
+    assert [1, 2] == inverted.frequencies['be']
+    assert [2] == inverted.frequencies['to']
+    assert {1: 2, 2: 6} == inverted.doc_lengths
+
+
+@pytest.mark.parametrize('strategy', [None, 'mmap', 'varbyte', 'roaring'])
+def test_top_k_matches_exhaustive_bm25(strategy, tmp_path):
+    import random
+    rng = random.Random(7)
+    vocabulary = [f"w{rank}" for rank in range(40)]
+    weights = [1 / (rank + 1) for rank in range(40)]
+    documents = {
+        doc_id: " ".join(rng.choices(vocabulary, weights, k=rng.randint(3, 30)))
+        for doc_id in range(1, 301)
+    }
+    inverted = build_inverted_index(documents, frequencies=True)
+    if strategy:
+        inverted.dump(str(tmp_path / 'inverted.index'), strategy=strategy)
+        inverted = InvertedIndex.load(str(tmp_path / 'inverted.index'))
+    for words in [['w0'], ['w0', 'w1'], ['w3', 'w17', 'w39'], ['w0', 'w5', 'w25', 'absent']]:
+        for k in [1, 10, 1000]:
+            expected = _brute_force_bm25(inverted, words, k)
+            result = inverted.query_top_k(words, k=k)
+            assert [doc_id for doc_id, _ in expected] == [doc_id for doc_id, _ in result]
+            assert [score for _, score in expected] == pytest.approx([score for _, score in result])
+
+
+def test_top_k_reads_bitmap_containers_of_roaring_index(tmp_path):
+    documents = {doc_id: "the " * (doc_id % 3 + 1) + ("rare" if doc_id % 1000 == 0 else "")
+                 for doc_id in range(1, 20001)}
+    inverted = build_inverted_index(documents, frequencies=True)
+    index_filepath = str(tmp_path / 'inverted.index')
+    inverted.dump(index_filepath, strategy='roaring')
+    loaded = InvertedIndex.load(index_filepath)
+    postings = loaded.index['the']
+    assert isinstance(postings, HybridPostings) and postings.has_bitmaps
+    doc_ids = list(postings)
+    for target, low in [(0, 0), (5000, 0), (5000, 7000), (19999, 3), (65536, 0)]:
+        assert max(bisect_left(doc_ids, target), low) == postings.search(target, low), f"search({target}, {low})"
+    assert inverted.query_top_k(['the', 'rare'], k=5) == loaded.query_top_k(['the', 'rare'], k=5)
+    assert inverted.query_top_k(['the'], k=3) == loaded.query_top_k(['the'], k=3)
+
+
+def test_process_queries_with_top_k(capsys, tmp_path):
+    index_filepath = str(tmp_path / 'inverted.index')
+    process_build('varbyte', DATASET_SMALL_FILEPATH, index_filepath, frequencies=True)
+    process_queries(inverted_index_filepath=index_filepath, query_file=None,
+                    query=[['sky', 'blue'], ['the']], top_k=2)
+    captured = capsys.readouterr()
+    assert "3,1\n1,2\n" == captured.out
+    with pytest.raises(ValueError):
+        build_inverted_index(load_documents(DATASET_SMALL_FILEPATH)).query_top_k(['sky'])
+    with pytest.raises(ValueError):
+        process_build('struct', DATASET_SMALL_FILEPATH, index_filepath, frequencies=True)
+    with pytest.raises(ValueError):
+        build_inverted_index(load_documents(DATASET_SMALL_FILEPATH), positions=True).dump(index_filepath, 'json')
+
+
+def test_positions_block_decodes_single_postings():
+    positions_lists = [[0, 5, 300], [], [7], list(range(0, 5000, 3))]
+    block = PositionsBlock(encode_positions(positions_lists))
+    assert len(positions_lists) == len(block)
+    for i, positions in enumerate(positions_lists):
+        assert positions == list(block.positions(i))
+
+
+def _naive_phrase(documents, words, slop):
+    result = []
+    for doc_id, content in sorted(documents.items()):
+        tokens = content.split()
+        starts = [[i for i, token in enumerate(tokens) if token == words[0]]]
+        for word in words[1:]:
+            starts.append([i for i, token in enumerate(tokens)
+                           if token == word and any(i - slop - 1 <= j < i for j in starts[-1])])
+        if starts[-1]:
+            result.append(doc_id)
+    return result
+
+
+@pytest.mark.parametrize('strategy', [None, 'mmap', 'varbyte', 'roaring'])
+def test_phrase_and_near_queries_match_naive_scan(strategy, tmp_path):
+    import random
+    rng = random.Random(13)
+    vocabulary = [f"w{rank}" for rank in range(12)]
+    documents = {doc_id: " ".join(rng.choices(vocabulary, k=rng.randint(1, 40))) for doc_id in range(1, 201)}
+    inverted = build_inverted_index(documents, positions=True)
+    if strategy:
+        inverted.dump(str(tmp_path / 'inverted.index'), strategy=strategy)
+        inverted = InvertedIndex.load(str(tmp_path / 'inverted.index'))
+    for words in [['w0', 'w1'], ['w2', 'w2'], ['w3', 'w4', 'w3'], ['w5', 'absent']]:
+        for slop in [0, 2]:
+            expected = _naive_phrase(documents, words, slop)
+            assert expected == inverted.query_phrase(words, slop=slop), f"{words} slop={slop}"
+    near = inverted.query_near(['w0', 'w1', 'w2'], distance=3)
+    expected = [
+        doc_id for doc_id, content in sorted(documents.items())
+        if any({'w0', 'w1', 'w2'} <= set(content.split()[start:start + 4])
+               for start in range(len(content.split())))
+    ]
+    assert expected == near
+
+
+def test_process_queries_with_phrase(capsys, tmp_path):
+    index_filepath = str(tmp_path / 'inverted.index')
+    process_build('varbyte', DATASET_SMALL_FILEPATH, index_filepath, positions=True)
+    process_queries(inverted_index_filepath=index_filepath, query_file=None,
+                    query=[['blue', 'sky'], ['bright', 'blue'], ['blue', 'bright']], phrase=True)
+    assert "3\n1\n\n" == capsys.readouterr().out
+    process_queries(inverted_index_filepath=index_filepath, query_file=None,
+                    query=[['blue', 'bright']], near=1)
+    assert "1\n" == capsys.readouterr().out
+    with pytest.raises(ValueError):
+        build_inverted_index(load_documents(DATASET_SMALL_FILEPATH)).query_phrase(['blue', 'sky'])
+
+
+def test_parse_boolean_query_respects_precedence():
+    node = parse_boolean_query("a b OR NOT (c OR d) AND e")
+    expected = QueryNode("OR", children=(
+        QueryNode("AND", children=(QueryNode("TERM", "a"), QueryNode("TERM", "b"))),
+        QueryNode("AND", children=(
+            QueryNode("NOT", children=(QueryNode("OR", children=(QueryNode("TERM", "c"), QueryNode("TERM", "d"))),)),
+            QueryNode("TERM", "e"),
+        )),
+    ))
+    assert expected == node
+    for broken in ["", "a AND", "(a OR b", "a )", "OR a"]:
+        with pytest.raises(ValueError):
+            parse_boolean_query(broken)
+
+
+def test_boolean_queries_match_set_algebra():
+    import random
+    rng = random.Random(3)
+    vocabulary = [f"w{rank}" for rank in range(10)]
+    documents = {doc_id: " ".join(rng.choices(vocabulary, k=rng.randint(1, 8))) for doc_id in range(1, 301)}
+    inverted = build_inverted_index(documents)
+    sets = {term: set(doc_ids) for term, doc_ids in inverted.index.items()}
+    cases = {
+        "w0 AND w1": sets['w0'] & sets['w1'],
+        "w0 OR w1 w2": sets['w0'] | (sets['w1'] & sets['w2']),
+        "w0 AND NOT w1": sets['w0'] - sets['w1'],
+        "(w0 OR w3) NOT (w1 OR w2) w4": ((sets['w0'] | sets['w3']) & sets['w4']) - sets['w1'] - sets['w2'],
+        "w1 AND absent OR w2": sets['w2'],
+        "NOT w1 AND w0*": sets['w0'] - sets['w1'],
+        "w0 AND NOT NOT w1": sets['w0'] & sets['w1'],
+        "NOT NOT w2 AND NOT NOT NOT w3": sets['w2'] - sets['w3'],
+    }
+    for expression, expected in cases.items():
+        assert sorted(expected) == inverted.query_boolean(expression), expression
+    plan = inverted.plan_boolean(parse_boolean_query("NOT w1 w0 absent"))
+    assert ["absent", "w0"] == [child.term for child in plan.children[:2]]
+    assert 0 == plan.cost
+    for unbounded in ["NOT w1", "w0 OR NOT w1", "NOT w0 NOT w1", "NOT NOT NOT w1"]:
+        with pytest.raises(ValueError):
+            inverted.query_boolean(unbounded)
+
+
+def test_process_queries_with_boolean_expressions(capsys, tmp_path):
+    index_filepath = str(tmp_path / 'inverted.index')
+    process_build('mmap', DATASET_SMALL_FILEPATH, index_filepath)
+    queries = "blue AND NOT sky\n(forget OR sunlight) AND sky\nbright AND NOT NOT sky\n"
+    process_queries(inverted_index_filepath=index_filepath, query_file=queries.splitlines(), boolean=True)
+    assert "1\n2,3\n3\n" == capsys.readouterr().out
+
+
+def test_query_server_answers_pipelined_clients_and_reloads(tmp_path):
+    import asyncio
+    index_filepath = str(tmp_path / 'inverted.index')
+    build_inverted_index(load_documents(DATASET_SMALL_FILEPATH)).dump(index_filepath, strategy='mmap')
+    server = QueryServer(index_filepath, reload_interval=0)
+
+    async def ask(port, lines):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(''.join(line + '\n' for line in lines).encode('utf-8'))
+        await writer.drain()
+        answers = [(await reader.readline()).decode('utf-8').rstrip('\n') for _ in lines]
+        writer.close()
+        return answers
+
+    async def scenario():
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            first, second = await asyncio.gather(
+                ask(port, ['blue sky', 'forget', 'bright blue', 'absent']),
+                ask(port, ['the'] * 50),
+            )
+            assert ['3', '2', '1,3', ''] == first
+            assert ['1,2'] * 50 == second
+            assert not await server.reload_if_changed()
+            replacement = str(tmp_path / 'replacement.index')
+            build_inverted_index({7: "absent words"}).dump(replacement, strategy='mmap')
+            os.replace(replacement, index_filepath)
+            assert await server.reload_if_changed()
+            assert ['7', ''] == await ask(port, ['absent', 'blue sky'])
+
+    asyncio.run(scenario())
+    assert 1 == server.reloads
+
+
+def test_query_server_serves_and_reloads_sharded_directory(tmp_path):
+    import asyncio
+    directory = str(tmp_path / 'sharded')
+    process_build('struct', DATASET_SMALL_FILEPATH, directory, shards=2)
+    server = QueryServer(directory, reload_interval=0)
+    assert ['3', '1,3', ''] == [server.answer(line) for line in ['blue sky', 'bright', 'absent']]
+    assert not asyncio.run(server.reload_if_changed())
+    write_sharded_index(build_inverted_index({7: "absent words"}), directory, shards=3)
+    assert asyncio.run(server.reload_if_changed())
+    assert ['7', ''] == [server.answer(line) for line in ['absent', 'blue sky']]
+
+
+def test_shared_index_is_attached_by_other_processes(tmp_path):
+    import subprocess
+    import sys
+    inverted = build_inverted_index(load_documents(DATASET_SMALL_FILEPATH), frequencies=True)
+    memory = inverted.share()
+    try:
+        attached = InvertedIndex.attach(memory.name)
+        assert inverted == attached
+        assert [3] == attached.query(['blue', 'sky'])
+        assert [1, 2] == [doc_id for doc_id, _ in attached.query_top_k(['the'], k=2)]
+        worker = subprocess.run(
+            [sys.executable, "-c",
+             "from task_Boriskin_Makary_inverted_index import InvertedIndex\n"
+             f"print(InvertedIndex.attach({memory.name!r}).query(['bright', 'blue']))"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        )
+        assert "[1, 3]\n" == worker.stdout
+        # the worker exiting must not remove the block
+        assert [1, 3] == InvertedIndex.attach(memory.name).query(['bright', 'blue'])
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+@pytest.mark.parametrize('partition', ['term', 'doc'])
+@pytest.mark.parametrize('processes', [False, True])
+def test_sharded_index_answers_same_queries(partition, processes, tmp_path):
+    import random
+    rng = random.Random(5)
+    vocabulary = [f"w{rank}" for rank in range(30)] + ["alpha", "alps", "beta"]
+    documents = {doc_id: " ".join(rng.choices(vocabulary, k=rng.randint(1, 12))) for doc_id in range(1, 401)}
+    inverted = build_inverted_index(documents)
+    directory = str(tmp_path / 'sharded')
+    write_sharded_index(inverted, directory, shards=3, partition=partition)
+    queries = [['w0'], ['w0', 'w1'], ['w2', 'w3', 'w4'], ['al*'], ['w1*', 'beta'], ['absent', 'w0'], []]
+    sharded = ShardedInvertedIndex(directory, processes=processes)
+    try:
+        assert [inverted.query(q) for q in queries] == [sharded.query(q) for q in queries]
+        assert [inverted.query(q) for q in queries] == sharded.query_many(queries)
+    finally:
+        sharded.close()
+    loaded = InvertedIndex.load(directory)
+    assert isinstance(loaded, ShardedInvertedIndex)
+    assert inverted == loaded
+    assert inverted.query_boolean("(alpha OR beta) NOT w0") == loaded.query_boolean("(alpha OR beta) NOT w0")
+
+
+@pytest.mark.parametrize('partition', ['term', 'doc'])
+def test_sharded_index_does_not_analyze_terms_twice(partition, tmp_path):
+    analyzer = Analyzer(min_length=4, stemmer="s")
+    inverted = build_inverted_index({1: "cats and dogs", 2: "cats food", 3: "dogs"}, analyzer=analyzer)
+    directory = str(tmp_path / 'sharded')
+    write_sharded_index(inverted, directory, shards=2, partition=partition)
+    queries = [['cats'], ['Cats', 'food'], ['dogs', 'ca*']]
+    sharded = ShardedInvertedIndex(directory)
+    assert [[1, 2], [2], [1]] == [inverted.query(q) for q in queries]
+    assert [inverted.query(q) for q in queries] == [sharded.query(q) for q in queries]
+    assert [inverted.query(q) for q in queries] == sharded.query_many(queries)
+
+
+def test_process_queries_with_sharded_build(capsys, tmp_path):
+    directory = str(tmp_path / 'sharded')
+    process_build('struct', DATASET_SMALL_FILEPATH, directory, shards=2)
+    process_queries(inverted_index_filepath=directory, query_file=None,
+                    query=[['blue', 'sky'], ['bright'], ['absent']], shard_processes=True)
+    assert "3\n1,3\n\n" == capsys.readouterr().out
+
+
+def test_analyzer_stages():
+    analyzer = Analyzer(stop_words=ENGLISH_STOP_WORDS, min_length=2, max_length=8, stemmer="s")
+    assert ['cat', 'pony', 'fly', 'glass', 'buse', 'bus'] == analyzer.terms(
+        "The Cats, a ponies! FLIES and glass; buses x extraordinary bus")
+    assert [(1, 'cat'), (3, 'sky')] == list(analyzer.positions("the cats of sky"))
+    assert ['cat', 'sk*'] == analyzer.query_terms(['The', 'CATS', 'Sk*'])
+    assert Analyzer.from_config(analyzer.config) is Analyzer.from_config(dict(analyzer.config))
+    assert analyzer == Analyzer.from_config(analyzer.config)
+    assert Analyzer().is_default and not analyzer.is_default
+
+
+@pytest.mark.parametrize('strategy', ['struct', 'mmap', 'varbyte', 'roaring', 'pickle'])
+def test_analyzer_is_stored_in_index_header(strategy, tmp_path):
+    analyzer = Analyzer(stop_words=ENGLISH_STOP_WORDS, stemmer="s")
+    documents = load_documents(DATASET_SMALL_FILEPATH)
+    inverted = build_inverted_index(documents, analyzer=analyzer)
+    assert 'the' not in inverted.index and 'butterfly' in inverted.index and '' not in inverted.index
+    assert len(inverted.index) < len(build_inverted_index(documents).index)
+    index_filepath = str(tmp_path / 'inverted.index')
+    inverted.dump(index_filepath, strategy=strategy)
+    loaded = InvertedIndex.load(index_filepath)
+    assert analyzer == loaded.analyzer
+    assert [3] == loaded.query(['The', 'SKIES', 'blue'])
+    assert [] == loaded.query(['the', 'a'])
+    assert [1, 3] == loaded.query_boolean("bright AND (the OR blue)")
+    with pytest.raises(ValueError):
+        inverted.dump(index_filepath, strategy='json')
+
+
+def test_phrase_query_keeps_places_of_stop_words():
+    analyzer = Analyzer(stop_words=ENGLISH_STOP_WORDS)
+    inverted = build_inverted_index({1: "forget the great sky", 2: "forget great sky"},
+                                    positions=True, analyzer=analyzer)
+    assert [1] == inverted.query_phrase(['forget', 'the', 'great'])
+    assert [2] == inverted.query_phrase(['forget', 'great'])
+    assert [1, 2] == inverted.query_phrase(['forget', 'great'], slop=1)
+
+
+def test_load_reads_struct_format_without_meta(tmp_path):
+    from struct import pack
+    index_filepath = tmp_path / 'inverted.index'
+    with open(index_filepath, 'wb') as fout:
+        terms = b"blue\nsky"
+        fout.write(b"IIDXSTR2" + pack('<cQQ', b'H', 2, len(terms)) + terms)
+        fout.write(pack('<2I', 2, 1) + pack('<3H', 1, 3, 3))
+    loaded = InvertedIndex.load(str(index_filepath))
+    assert {"blue": [1, 3], "sky": [3]} == loaded.index
+    assert loaded.analyzer.is_default
+
+
+@pytest.mark.parametrize('strategy', ['json', 'struct', 'mmap', 'varbyte', 'roaring', 'pickle'])
+def test_index_statistics_match_loaded_index(strategy, tmp_path):
+    inverted = build_inverted_index(load_documents(DATASET_SMALL_FILEPATH))
+    index_filepath = str(tmp_path / 'inverted.index')
+    inverted.dump(index_filepath, strategy=strategy)
+    lengths = sorted(len(doc_ids) for doc_ids in inverted.index.values())
+    statistics = index_statistics(index_filepath, top=2, scan=True)
+    assert len(inverted.index) == statistics["terms"], f"{strategy}: wrong vocabulary size"
+    assert sum(lengths) == statistics["postings"]
+    assert len(lengths) == sum(terms for _, _, terms in statistics["histogram"])
+    assert lengths[-1] == statistics["max_length"] == statistics["heaviest"][0][1]
+    assert lengths[len(lengths) // 2] == statistics["percentiles"]["p50"]
+    assert os.path.getsize(index_filepath) == statistics["file_bytes"]
+    assert statistics["memory"]["mmap"]["mapped_bytes"] > 0 and statistics["memory"]["roaring"]["mapped_bytes"] > 0
+
+
+def test_process_stats_reads_directory_indexes(capsys, tmp_path):
+    directory = str(tmp_path / 'sharded')
+    process_build('mmap', DATASET_SMALL_FILEPATH, directory, shards=2, partition='doc')
+    process_stats(directory, top=1)
+    report = capsys.readouterr().out
+    assert "sharded mmap" in report and "shards.json" in report
+    assert index_statistics(directory)["terms"] == len(build_inverted_index(
+        load_documents(DATASET_SMALL_FILEPATH)).index)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+@pytest.mark.parametrize('doc_ids', [[1, 2, 3, 2], [5, 1000, 70000]])
+def test_document_store_fetches_documents_by_id(compress, doc_ids, tmp_path):
+    dataset_filepath = tmp_path / 'dataset.txt'
+    lines = [f"{doc_id}\tTitle {number}\tБабочка text number {number}\r\n" for number, doc_id in enumerate(doc_ids)]
+    dataset_filepath.write_bytes("".join(lines).encode('utf-8'))
+    store_filepath = str(tmp_path / 'documents.store')
+    assert len(set(doc_ids)) == write_document_store(str(dataset_filepath), store_filepath, compress=compress)
+    store = DocumentStore(store_filepath)
+    expected = {doc_id: f"Title {number}\tБабочка text number {number}" for number, doc_id in enumerate(doc_ids)}
+    assert expected == dict(store), f"compress={compress}: wrong documents"
+    assert 4 not in store and -1 not in store
+
+
+def test_document_store_snippets(capsys, tmp_path):
+    dataset_filepath = tmp_path / 'dataset.txt'
+    body = " ".join(f"word{number}" for number in range(100))
+    dataset_filepath.write_text(f"1\tLong\t{body} Sky\n2\tShort\tblue  sky\n", encoding='utf8')
+    store_filepath = str(tmp_path / 'documents.store')
+    write_document_store(str(dataset_filepath), store_filepath)
+    store = DocumentStore(store_filepath)
+    assert "...word49 word50 word51..." == store.snippet(1, ['WORD50'], length=3)
+    assert "...word99 Sky" == store.snippet(1, ['sky'], length=2)
+    assert "Short blue sky" == store.snippet(2, ['blu*'])
+    process_build('mmap', str(dataset_filepath), str(tmp_path / 'inverted.index'), store_filepath=store_filepath)
+    process_queries(inverted_index_filepath=str(tmp_path / 'inverted.index'), query_file=None,
+                    query=[['sky'], ['absent']], store_filepath=store_filepath, snippets=1)
+    assert "1,2\n1\t...word81 word82" in capsys.readouterr().out
+    with open(dataset_filepath, 'a', encoding='utf8') as fout:
+        fout.write("3\tNew\tdocument\n")
+    with pytest.raises(ValueError):
+        DocumentStore(store_filepath)
+
+
+@pytest.mark.parametrize('options', [
+    {'max_memory': 1000, 'workers': 2}, {'shards': 2, 'frequencies': True}, {'shards': 2, 'partition': 'hash'},
+    {'strategy': 'csv'}, {'strategy': 'struct', 'positions': True},
+])
+def test_process_build_checks_options_before_writing(options, tmp_path):
+    options = {'strategy': 'mmap', **options}
+    with pytest.raises(ValueError):
+        process_build(dataset_filepath=DATASET_SMALL_FILEPATH, inverted_index_filepath=str(tmp_path / 'inverted.index'),
+                      store_filepath=str(tmp_path / 'documents.store'), **options)
+    assert [] == os.listdir(tmp_path)
+
+
+def test_pickle_strategy_refuses_code(tmp_path):
+    import pickle
+    from struct import pack
+    payload = pickle.dumps(os.path.getsize, protocol=5)
+    index_filepath = tmp_path / 'inverted.index'
+    index_filepath.write_bytes(b"IIDXPKL5" + pack('<QQQ', len(payload), 0, 0) + payload)
+    with pytest.raises(pickle.UnpicklingError):
+        InvertedIndex.load(str(index_filepath))
+
+
+def test_process_compare_reports_every_strategy(capsys):
+    process_compare(DATASET_SMALL_FILEPATH)
+    lines = capsys.readouterr().out.splitlines()
+    assert "strategy\tbytes\tdump_ms\tload_ms" == lines[0]
+    assert list(STORAGE_WRITERS) == [line.split("\t")[0] for line in lines[1:]]
+
+
+@pytest.mark.parametrize('options', [{}, {'batch_size': 2}, {'boolean': True}])
+def test_process_queries_with_jobs_keeps_input_order(options, capsys, tmp_path):
+    from io import StringIO
+    index_filepath = str(tmp_path / 'inverted.index')
+    build_inverted_index(load_documents(DATASET_SMALL_FILEPATH)).dump(index_filepath, strategy='mmap')
+    lines = ["blue sky\n", "bright\n", "absent\n", "the\n", "blue OR forget\n"] * 7
+    process_queries(inverted_index_filepath=index_filepath, query_file=StringIO("".join(lines)), verbose=False,
+                    **options)
+    expected = capsys.readouterr()
+    assert "use the following query" not in expected.err
+    process_queries(inverted_index_filepath=index_filepath, query_file=StringIO("".join(lines)), verbose=False,
+                    jobs=2, chunk_size=3, **options)
+    assert expected.out == capsys.readouterr().out, f"{options}: answers of jobs differ"
+
+
+@pytest.mark.parametrize('options', [
+    {'jobs': 2, 'query': [['sky']]}, {'jobs': 2, 'shard_processes': True},
+    {'batch_size': 2, 'top_k': 3}, {'batch_size': 2, 'phrase': True}, {'batch_size': 2, 'near': 3},
+    {'batch_size': 2, 'boolean': True},
+])
+def test_process_queries_rejects_ignored_options(options, tmp_path):
+    from io import StringIO
+    index_filepath = str(tmp_path / 'inverted.index')
+    process_build('varbyte', DATASET_SMALL_FILEPATH, index_filepath, frequencies=True, positions=True)
+    with pytest.raises(ValueError):
+        process_queries(inverted_index_filepath=index_filepath, query_file=StringIO("blue sky\n"), **options)
+
+
+def test_process_queries_with_jobs_reports_cache_of_all_workers(capsys, tmp_path):
+    import re
+    from io import StringIO
+    index_filepath = str(tmp_path / 'inverted.index')
+    build_inverted_index(load_documents(DATASET_SMALL_FILEPATH)).dump(index_filepath, strategy='mmap')
+    lines = ["blue sky\n", "bright\n", "absent\n", "the\n", "sky blue\n"] * 6
+    process_queries(inverted_index_filepath=index_filepath, query_file=StringIO("".join(lines)), verbose=False,
+                    jobs=2, chunk_size=5, cache_size=8)
+    match = re.search(r"query cache: (\d+) hits, (\d+) misses", capsys.readouterr().err)
+    assert match is not None
+    hits, misses = map(int, match.groups())
+    assert len(lines) == hits + misses and 4 <= misses <= 8
+
+
+def test_skip_postings_search_decodes_single_blocks(tmp_path):
+    doc_ids = list(range(3, 100000, 7))
+    index_filepath = str(tmp_path / 'inverted.index')
+    InvertedIndex({"long": doc_ids, "short": [10, 17, 500]}).dump(index_filepath, strategy='varbyte')
+    loaded = InvertedIndex.load(index_filepath)
+    postings = loaded.index["long"]
+    assert isinstance(postings, SkipPostings) and not isinstance(loaded.index["short"], SkipPostings)
+    assert encode_varbyte(doc_ids) == bytes(loaded.index._postings[:loaded.index._postings_offsets[1]])
+    assert doc_ids == list(postings) and doc_ids[-1] == postings[-1] and doc_ids[1000] == postings[1000]
+    for target, low in [(0, 0), (3, 0), (4, 0), (8000, 0), (8000, 2000), (99999, 5), (100000, 0)]:
+        assert max(bisect_left(doc_ids, target), low) == postings.search(target, low), f"search({target}, {low})"
+
+
+def test_skip_postings_answer_like_lists(tmp_path):
+    documents = {doc_id: "common " + ("rare " if doc_id % 997 == 0 else "") + f"word{doc_id % 3}"
+                 for doc_id in range(1, 5000)}
+    inverted = build_inverted_index(documents, frequencies=True, positions=True)
+    index_filepath = str(tmp_path / 'inverted.index')
+    inverted.dump(index_filepath, strategy='varbyte')
+    loaded = InvertedIndex.load(index_filepath)
+    for words in [['rare', 'common'], ['common', 'word1'], ['rare', 'word2', 'common'], ['word*', 'rare']]:
+        assert inverted.query(words) == loaded.query(words), f"{words}: wrong answer"
+    assert inverted.query_many([['rare', 'common'], ['word0']]) == loaded.query_many([['rare', 'common'], ['word0']])
+    assert inverted.query_phrase(['common', 'rare']) == loaded.query_phrase(['common', 'rare'])
+    assert inverted.query_top_k(['rare', 'common'], k=3) == loaded.query_top_k(['rare', 'common'], k=3)
+    assert inverted.query_boolean("common AND NOT word1") == loaded.query_boolean("common AND NOT word1")
+
+
+def test_query_many_matches_single_queries(tmp_path):
+    inverted = build_inverted_index(load_documents(filepath='test_dataset.txt'))
+    queries = [['blue', 'sky'], ['sky', 'blue', 'bright'], ['sky'], ['absent', 'sky'],
+               ['sky', 'blue'], [], ['the', 'to', 'sky']]
+    expected = [inverted.query(q) for q in queries]
+    assert expected == inverted.query_many(queries)
+
+
+def test_process_queries_in_batches(capsys, tmp_path):
+    index_filepath = str(tmp_path / 'inverted.index')
+    process_build('varbyte', DATASET_SMALL_FILEPATH, index_filepath)
+    queries = "blue sky\nforget\nbright, blue\nabsent\n"
+    process_queries(inverted_index_filepath=index_filepath, query_file=queries.splitlines(), batch_size=3)
+    captured = capsys.readouterr()
+    assert "3\n2\n1,3\n\n" == captured.out
+
+
+def test_process_queries_prints_cache_stats(capsys, tmp_path):
+    index_filepath = str(tmp_path / 'inverted.index')
+    process_build('mmap', DATASET_SMALL_FILEPATH, index_filepath)
+    process_queries(inverted_index_filepath=index_filepath, query_file=None,
+                    query=[['blue'], ['blue'], ['sky']], cache_size=8)
+    captured = capsys.readouterr()
+    assert "query cache: 1 hits, 2 misses" in captured.err
+
+
+@pytest.mark.parametrize(
+    'doc_ids',
+    [[], [1, 2, 3, 4], [5, 127, 128, 300, 16384, 70000], [0, 2 ** 33, 2 ** 63 + 5]]
+)
+def test_varbyte_round_trip(doc_ids):
+    assert doc_ids == list(decode_varbyte(encode_varbyte(doc_ids)))
+
+
+def test_varbyte_index_lifts_16_bit_doc_id_limit(tmp_path):
+    inverted = InvertedIndex(index={"wide": [3, 65536, 2 ** 40], "narrow": [3]})
+    index_filepath = str(tmp_path / 'inverted.index')
+    for strategy in ['struct', 'varbyte']:
+        inverted.dump(filepath=index_filepath, strategy=strategy)
+        loaded = InvertedIndex.load(filepath=index_filepath)
+        assert [3, 65536, 2 ** 40] == list(loaded.index['wide'])
+        assert [3] == loaded.query(['narrow', 'wide'])
+
+
+def test_load_reads_first_struct_format(tmp_path):
+    import json
+    from struct import pack
+    index = {"": [1], "blue": [1, 3], "sky": [2, 3, 65535]}
+    index_filepath = tmp_path / 'inverted.index'
+    with open(index_filepath, 'wb') as fout:
+        for word, doc_ids in index.items():
+            header = json.dumps({word: len(doc_ids)}).encode('utf-8')
+            fout.write(pack('>I', len(header)) + header + pack(f'>{len(doc_ids)}H', *doc_ids))
+    assert InvertedIndex(index=index) == InvertedIndex.load(str(index_filepath))
+    InvertedIndex(index=index).dump(str(index_filepath), strategy='struct')
+    assert index == InvertedIndex.load(str(index_filepath)).index
+
+
+@pytest.mark.parametrize(
+    'postings_lists',
+    [
+        [[1, 3, 5, 7], [2, 3, 5, 8]],
+        [[4, 900], list(range(0, 1000, 2))],
+        [list(range(0, 1000, 3)), list(range(0, 1000, 5)), list(range(0, 1000, 7))],
+        [[1, 2, 3], []],
+        [[10, 20]],
+    ]
+)
+def test_intersect_postings_matches_naive_intersection(postings_lists):
+    expected = sorted(set.intersection(*map(set, postings_lists)))
+    result = intersect_postings(postings_lists)
+    assert expected == result, (
+        f"\nExpected: {expected}\nYou got: {result}"
+    )
+
+
+def test_query_ignores_repeated_and_missing_words():
+    inverted = InvertedIndex(
+        index={"butterfly": [1], "the": [1, 2], "bright": [1, 3], "blue": [1, 3]}
+    )
+    assert [1, 3] == inverted.query(['blue', 'bright', 'blue'])
+    assert [] == inverted.query(['blue', 'absent'])
+    assert [] == inverted.query([])
+
+
 def test_process_queries_can_process_all_queries_from_correct_file(capsys):
     with open(DEFAULT_TEST_QUERIES_STORE_PATH) as queries_fin:
         process_queries(inverted_index_filepath=DEFAULT_TEST_INVERTED_INDEX_STORE_PATH,